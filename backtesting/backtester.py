@@ -0,0 +1,255 @@
+"""過去のローソク足を用いて、Donchianブレイクアウトの売買とATRによる損切りを検証する
+
+リポジトリのルートで以下のように実行する
+    python -m backtesting.backtester ohlcs.csv
+csvはopen_time（タイムスタンプ）, open, high, low, closeの列を持つ
+"""
+from typing import List, Tuple, Union
+import math
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import constants
+from trading_brain.feature_builder import build_features
+
+
+class StrategyParams:
+    """戦略のパラメータをもつクラス。デフォルト値は実際のトレードで用いている値
+
+    Attributes
+    ----------
+    terms : List[int]
+        SMA, std, EMAを求める期間のパターン
+    donchian_term : int
+        最高値、最安値を求める期間
+    atr_term : int
+        ATRを求める期間
+    macd_terms : Tuple[int, int, int]
+        MACDの短期期間、長期期間、シグナルの期間
+    stop_range : float
+        損切りを行う閾値幅のATRに対する倍率
+    loss_rate : float
+        全資産のうち、1回のトレードで損失を許容する割合
+    """
+    def __init__(
+            self,
+            terms: Tuple[int, ...] = (10, 50),
+            donchian_term: int = 20,
+            atr_term: int = 5,
+            macd_terms: Tuple[int, int, int] = (9, 17, 7),
+            stop_range: float = constants.STOP_RANGE,
+            loss_rate: float = constants.ACCEPTSBEL_LOSS_RATE) -> None:
+        self.terms : List[int] = list(terms)
+        self.donchian_term : int = donchian_term
+        self.atr_term : int = atr_term
+        self.macd_terms : Tuple[int, int, int] = tuple(macd_terms)
+        self.stop_range : float = stop_range
+        self.loss_rate : float = loss_rate
+
+    def __str__(self) -> str:
+        return str(self.__dict__)
+
+
+class BacktestResult:
+    """バックテストの結果をもつクラス
+
+    Attributes
+    ----------
+    trades : pd.DataFrame
+        トレードごとの情報（entry_time, exit_time, side, qty, entry_price, exit_price, pnl, fee, reason）
+    equity : pd.Series
+        ローソク足ごとの評価額（含み損益を含む、coin建て）
+    drawdown : pd.Series
+        ローソク足ごとの最大評価額からの下落率
+    """
+    def __init__(self, trades: pd.DataFrame, equity: pd.Series) -> None:
+        self.trades : pd.DataFrame = trades
+        self.equity : pd.Series = equity
+        self.drawdown : pd.Series = equity / equity.cummax() - 1
+
+    @property
+    def max_drawdown(self) -> float:
+        return float(self.drawdown.min()) if len(self.drawdown) else 0.0
+
+    @property
+    def total_return(self) -> float:
+        if len(self.equity) == 0:
+            return 0.0
+        return float(self.equity.iloc[-1] / self.equity.iloc[0] - 1)
+
+    def to_pl_records(self) -> list:
+        """決済ごとの評価額を、profit_and_lossに保存する形式（List[PL]）で返却する"""
+        from profit_and_loss.pl_record import PL  # SQLAlchemyの読み込みは重いため、必要な時のみ行う
+
+        exit_equity : pd.Series = self.equity.reindex(self.trades['exit_time'])
+        return [
+            PL(timestamp=timestamp.to_pydatetime(), equity=float(equity), side=side)
+            for timestamp, equity, side in zip(exit_equity.index, exit_equity.to_numpy(), self.trades['side'])]
+
+    def summary(self) -> str:
+        win_rate : float = float((self.trades['pnl'] > 0).mean()) if len(self.trades) else math.nan
+        return (f'trades: {len(self.trades)}, win rate: {win_rate:.3f}, '
+                f'total return: {self.total_return:.4%}, max drawdown: {self.max_drawdown:.4%}')
+
+
+class Backtester:
+    """過去のローソク足に対して、JudgementのDonchianブレイクアウトとFundManagerの損切り・注文数量の規則を適用する
+
+    特徴量は全期間に対して一度だけ求め、エントリー、決済、損切りのシグナルはNumPyで全足に対してまとめて求める。
+    ポジションの推移はシグナルが発生した足のみを辿って決めるため、足の数に対して線形の時間で終わる。
+    損益はbybitのインバース契約（USD建ての数量、coin建ての損益）として求める
+
+    Attributes
+    ----------
+    params : StrategyParams
+        戦略のパラメータ
+    initial_balance : float
+        開始時の残高（coin建て）
+    fee_rate : float
+        成行注文の手数料率
+    """
+    def __init__(
+            self,
+            params: Union[StrategyParams, None] = None,
+            initial_balance: float = 1.0,
+            fee_rate: float = constants.TAKER_FEE_RATE) -> None:
+        self.params : StrategyParams = params if params is not None else StrategyParams()
+        self.initial_balance : float = initial_balance
+        self.fee_rate : float = fee_rate
+
+    def run(self, df_ohlcs: pd.DataFrame) -> BacktestResult:
+        """バックテストを行う
+
+        Parameters
+        ----------
+        df_ohlcs : pd.DataFrame
+            open_time, open, high, low, closeの列を持つDataFrame
+
+        Returns
+        -------
+        BacktestResult
+            バックテストの結果
+        """
+        df_features : pd.DataFrame = build_features(
+            open_time=df_ohlcs['open_time'].to_numpy(),
+            open=df_ohlcs['open'].to_numpy(),
+            high=df_ohlcs['high'].to_numpy(),
+            low=df_ohlcs['low'].to_numpy(),
+            close=df_ohlcs['close'].to_numpy(),
+            terms=self.params.terms,
+            atr_term=self.params.atr_term,
+            macd_terms=self.params.macd_terms,
+            donchian_term=self.params.donchian_term)
+        return self.run_on_features(
+            open_time=df_features['open_time'].to_numpy(),
+            close=df_features['close'].to_numpy(),
+            max_price=df_features['max_price'].to_numpy(),
+            min_price=df_features['min_price'].to_numpy(),
+            atr=df_features['ATR'].to_numpy())
+
+    def run_on_features(
+            self,
+            open_time: np.ndarray,
+            close: np.ndarray,
+            max_price: np.ndarray,
+            min_price: np.ndarray,
+            atr: np.ndarray) -> BacktestResult:
+        """求め済みの特徴量に対してバックテストを行う
+
+        Parameters
+        ----------
+        open_time, close, max_price, min_price, atr : np.ndarray
+            特徴量が求まっている足のみの配列
+
+        Returns
+        -------
+        BacktestResult
+            バックテストの結果
+        """
+        num_bars : int = len(close)
+        # judgement.DonchianStrategyと同じく、直前の足までの最高値・最安値を更新したかで判断する
+        breaks_up : np.ndarray = np.zeros(num_bars, dtype=bool)
+        breaks_down : np.ndarray = np.zeros(num_bars, dtype=bool)
+        breaks_up[1:] = close[1:] > max_price[:-1]
+        breaks_down[1:] = close[1:] < min_price[:-1]
+        # ポジションがない時の売買シグナル（同時に両方を満たす場合は打ち消し合う）
+        entry_index : np.ndarray = np.flatnonzero(breaks_up != breaks_down)
+        # ポジションがある時は、反対方向のブレイクで決済する
+        exit_long_index : np.ndarray = np.flatnonzero(breaks_down)
+        exit_short_index : np.ndarray = np.flatnonzero(breaks_up)
+
+        balance : float = self.initial_balance
+        realized : np.ndarray = np.zeros(num_bars)  # 足ごとの確定損益（手数料を含む）
+        signed_qty : np.ndarray = np.zeros(num_bars)  # 足の終値時点の保有数量（売りは負）
+        entry_prices : np.ndarray = np.ones(num_bars)
+        trades : List[tuple] = []
+
+        next_bar : int = 0  # 次にエントリーを探し始める足
+        while True:
+            # 次のエントリー
+            k : int = int(np.searchsorted(entry_index, next_bar, side='left'))
+            if k == len(entry_index):
+                break
+            entry_bar : int = int(entry_index[k])
+            side_sign : int = 1 if breaks_up[entry_bar] else -1
+            entry_price : float = float(close[entry_bar])
+            range_for_stop_loss : float = atr[entry_bar] * self.params.stop_range / entry_price
+            qty : int = math.floor(balance * entry_price * self.params.loss_rate / range_for_stop_loss) \
+                if range_for_stop_loss > 0 else 0
+            if qty <= 0:
+                next_bar = entry_bar + 1
+                continue
+
+            # 次の反対方向のブレイク
+            exit_index : np.ndarray = exit_long_index if side_sign == 1 else exit_short_index
+            j : int = int(np.searchsorted(exit_index, entry_bar, side='right'))
+            signal_exit_bar : int = int(exit_index[j]) if j < len(exit_index) else num_bars - 1
+            # 反対方向のブレイクまでの間で、最初に損切りの価格を超える足
+            segment = slice(entry_bar + 1, signal_exit_bar)
+            stop_price : np.ndarray = entry_price - side_sign * atr[segment] * self.params.stop_range
+            is_stopped : np.ndarray = side_sign * (close[segment] - stop_price) < 0
+            if is_stopped.any():
+                exit_bar, reason = entry_bar + 1 + int(np.argmax(is_stopped)), 'stop'
+            elif j < len(exit_index):
+                exit_bar, reason = signal_exit_bar, 'signal'
+            else:
+                exit_bar, reason = num_bars - 1, 'end'
+
+            exit_price : float = float(close[exit_bar])
+            pnl : float = side_sign * qty * (1 / entry_price - 1 / exit_price)
+            entry_fee : float = qty * self.fee_rate / entry_price
+            exit_fee : float = qty * self.fee_rate / exit_price
+            balance += pnl - entry_fee - exit_fee
+            realized[entry_bar] -= entry_fee
+            realized[exit_bar] += pnl - exit_fee
+            signed_qty[entry_bar:exit_bar] = side_sign * qty
+            entry_prices[entry_bar:exit_bar] = entry_price
+            trades.append((
+                open_time[entry_bar], open_time[exit_bar], constants.BUY if side_sign == 1 else constants.SELL,
+                qty, entry_price, exit_price, pnl, entry_fee + exit_fee, reason))
+            next_bar = exit_bar + 1  # 決済した足では新たにエントリーしない
+
+        unrealized : np.ndarray = signed_qty * (1 / entry_prices - 1 / close)
+        equity : np.ndarray = self.initial_balance + np.cumsum(realized) + unrealized
+        index : pd.Index = pd.Index(open_time, name='open_time')
+        df_trades : pd.DataFrame = pd.DataFrame(trades, columns=[
+            'entry_time', 'exit_time', 'side', 'qty', 'entry_price', 'exit_price', 'pnl', 'fee', 'reason'])
+        return BacktestResult(trades=df_trades, equity=pd.Series(equity, index=index, name='equity'))
+
+
+def load_ohlcs_csv(path: str) -> pd.DataFrame:
+    """open_time（タイムスタンプ）, open, high, low, closeの列を持つcsvを読み込む"""
+    df : pd.DataFrame = pd.read_csv(path)
+    df['open_time'] = pd.to_datetime(df['open_time'], unit='s')
+    return df
+
+
+if __name__ == '__main__':
+    df_ohlcs = load_ohlcs_csv(sys.argv[1])
+    started_at = time.perf_counter()
+    result = Backtester().run(df_ohlcs)
+    print(f'{len(df_ohlcs)} ohlcs in {time.perf_counter() - started_at:.3f}s')
+    print(result.summary())
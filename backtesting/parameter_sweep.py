@@ -0,0 +1,204 @@
+"""戦略のパラメータをグリッドサーチ、またはランダムサーチし、結果をcsvに保存する
+
+ローソク足は共有メモリに一度だけ置き、各ワーカープロセスはコピーせずに参照する。
+ワーカーごとに特徴量の列をキャッシュし、同じ期間を用いるパラメータの組み合わせ間で使い回す
+
+リポジトリのルートで以下のように実行する
+    python -m backtesting.parameter_sweep ohlcs.csv results.csv [--random 200] [--workers 32]
+"""
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from multiprocessing import shared_memory
+from typing import Any, Dict, Iterator, List, Sequence, Tuple, Union
+import argparse
+import itertools
+import os
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from backtesting.backtester import Backtester, BacktestResult, StrategyParams, load_ohlcs_csv
+from trading_brain.feature_builder import rolling_mean, rolling_max, rolling_min
+
+# 探索するパラメータの候補。キーはStrategyParamsの引数名
+# termsとmacd_termsはBacktesterの売買の判断に用いないため（termsは開始する足を変えるのみ）、
+# 探索しても戦略の比較にならず時間のみがかかる
+default_search_space : Dict[str, List[Any]] = {
+    'donchian_term': [10, 20, 30, 40, 55],
+    'atr_term': [5, 10, 14, 20],
+    'stop_range': [1.0, 1.5, 2.0, 2.5, 3.0],
+    'loss_rate': [0.0005, 0.001, 0.002],
+}
+
+# 1つのタスクとしてまとめて送るパラメータの組み合わせの数
+chunk_size = 16
+
+# ワーカープロセスごとに保持する状態（共有メモリ上のローソク足のビュー）
+_worker_shared_memory : Union[shared_memory.SharedMemory, None] = None
+_worker_ohlcs : Dict[str, np.ndarray] = {}
+
+
+def grid_search(search_space: Dict[str, List[Any]]) -> Iterator[StrategyParams]:
+    """パラメータの候補の全ての組み合わせを返す"""
+    names : List[str] = list(search_space)
+    for values in itertools.product(*(search_space[name] for name in names)):
+        yield StrategyParams(**dict(zip(names, values)))
+
+
+def random_search(
+        search_space: Dict[str, List[Any]],
+        num_samples: int,
+        seed: int = 0) -> Iterator[StrategyParams]:
+    """パラメータの候補から重複しないnum_samples個の組み合わせを無作為に選んで返す"""
+    names : List[str] = list(search_space)
+    num_combinations : int = int(np.prod([len(search_space[name]) for name in names]))
+    rng : random.Random = random.Random(seed)
+    for flat_index in rng.sample(range(num_combinations), min(num_samples, num_combinations)):
+        kwargs : Dict[str, Any] = {}
+        for name in reversed(names):
+            flat_index, i = divmod(flat_index, len(search_space[name]))
+            kwargs[name] = search_space[name][i]
+        yield StrategyParams(**kwargs)
+
+
+def _share_ohlcs(df_ohlcs: pd.DataFrame) -> shared_memory.SharedMemory:
+    """open_time（タイムスタンプ）, high, low, closeの列を1つの共有メモリに並べて置く"""
+    num_ohlcs : int = len(df_ohlcs)
+    shm : shared_memory.SharedMemory = shared_memory.SharedMemory(create=True, size=max(4 * 8 * num_ohlcs, 1))
+    open_time, prices = _ohlcs_views(shm, num_ohlcs)
+    open_time[:] = df_ohlcs['open_time'].to_numpy().astype('datetime64[s]').astype(np.int64)
+    prices[:] = df_ohlcs[['high', 'low', 'close']].to_numpy(dtype=np.float64).T
+    return shm
+
+
+def _ohlcs_views(shm: shared_memory.SharedMemory, num_ohlcs: int) -> Tuple[np.ndarray, np.ndarray]:
+    """共有メモリ上のopen_time（int64）と、(3, num_ohlcs)のhigh, low, close（float64）のビューを返す"""
+    open_time : np.ndarray = np.ndarray((num_ohlcs,), dtype=np.int64, buffer=shm.buf)
+    prices : np.ndarray = np.ndarray((3, num_ohlcs), dtype=np.float64, buffer=shm.buf, offset=8 * num_ohlcs)
+    return open_time, prices
+
+
+def _init_worker(shm_name: str, num_ohlcs: int) -> None:
+    """ワーカープロセスの開始時に、共有メモリ上のローソク足を参照する"""
+    global _worker_shared_memory
+    _worker_shared_memory = shared_memory.SharedMemory(name=shm_name)
+    open_time, prices = _ohlcs_views(_worker_shared_memory, num_ohlcs)
+    _worker_ohlcs['open_time'] = open_time
+    _worker_ohlcs['high'], _worker_ohlcs['low'], _worker_ohlcs['close'] = prices
+
+
+@lru_cache(maxsize=64)
+def _feature_column(name: str, term: int) -> np.ndarray:
+    """ワーカー内で特徴量の列を求める。同じ列を用いるパラメータの組み合わせの間で使い回す"""
+    if name == 'ATR':
+        return rolling_mean(_worker_ohlcs['high'], term) - rolling_mean(_worker_ohlcs['low'], term)
+    if name == 'max_price':
+        return rolling_max(_worker_ohlcs['high'], term)
+    if name == 'min_price':
+        return rolling_min(_worker_ohlcs['low'], term)
+    raise ValueError(f'unknown feature: {name}')
+
+
+def _evaluate(params: StrategyParams) -> Dict[str, Any]:
+    """1つのパラメータの組み合わせでバックテストを行い、結果の1行を返す。
+    Donchianブレイクアウトの売買に用いるATRと最高値・最安値の列のみを求め、
+    Backtester.runと同じく全ての特徴量が求まる足から開始する
+    """
+    close : np.ndarray = _worker_ohlcs['close']
+    warmup : int = min(max(params.terms + [params.atr_term, params.donchian_term]) - 1, len(close))
+    started_at : float = time.perf_counter()
+    result : BacktestResult = Backtester(params=params).run_on_features(
+        open_time=_worker_ohlcs['open_time'][warmup:].astype('datetime64[s]'),
+        close=close[warmup:],
+        max_price=_feature_column('max_price', params.donchian_term)[warmup:],
+        min_price=_feature_column('min_price', params.donchian_term)[warmup:],
+        atr=_feature_column('ATR', params.atr_term)[warmup:])
+    trades : pd.DataFrame = result.trades
+    return {
+        **{name: str(value) if isinstance(value, (list, tuple)) else value for name, value in vars(params).items()},
+        'num_trades': len(trades),
+        'win_rate': float((trades['pnl'] > 0).mean()) if len(trades) else np.nan,
+        'total_return': result.total_return,
+        'max_drawdown': result.max_drawdown,
+        'fee': float(trades['fee'].sum()),
+        'elapsed_seconds': time.perf_counter() - started_at,
+    }
+
+
+def _evaluate_chunk(chunk: List[StrategyParams]) -> List[Dict[str, Any]]:
+    return [_evaluate(params) for params in chunk]
+
+
+def _chunks(params_list: Sequence[StrategyParams], size: int) -> Iterator[List[StrategyParams]]:
+    for start in range(0, len(params_list), size):
+        yield list(params_list[start:start + size])
+
+
+def run_sweep(
+        df_ohlcs: pd.DataFrame,
+        params_list: Sequence[StrategyParams],
+        max_workers: Union[int, None] = None,
+        sort_by: str = 'total_return') -> pd.DataFrame:
+    """パラメータの組み合わせごとのバックテストを、プロセスプールで並列に行う
+
+    同じ特徴量の列を用いる組み合わせが同じワーカーに送られやすいよう、
+    ATRとDonchianの期間の順に並べてからchunk_size個ずつタスクにする
+
+    Parameters
+    ----------
+    df_ohlcs : pd.DataFrame
+        open_time, high, low, closeの列を持つDataFrame
+    params_list : Sequence[StrategyParams]
+        バックテストを行うパラメータの組み合わせ
+    max_workers : int | None
+        ワーカープロセスの数。Noneの場合はCPUのコア数
+    sort_by : str
+        結果を降順に並べる列名
+
+    Returns
+    -------
+    pd.DataFrame
+        パラメータの組み合わせごとの結果
+    """
+    params_list = sorted(params_list, key=lambda params: (params.atr_term, params.donchian_term))
+    max_workers = max_workers or os.cpu_count() or 1
+    shm : shared_memory.SharedMemory = _share_ohlcs(df_ohlcs)
+    try:
+        with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_worker,
+                initargs=(shm.name, len(df_ohlcs))) as executor:
+            rows : List[Dict[str, Any]] = [
+                row for rows in executor.map(_evaluate_chunk, _chunks(params_list, chunk_size)) for row in rows]
+    finally:
+        shm.close()
+        shm.unlink()
+    df_results : pd.DataFrame = pd.DataFrame(rows)
+    if len(df_results):
+        df_results = df_results.sort_values(sort_by, ascending=False, ignore_index=True)
+    return df_results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ohlcs_path')
+    parser.add_argument('results_path')
+    parser.add_argument('--random', type=int, default=0, help='ランダムサーチする組み合わせの数。0の場合はグリッドサーチ')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--sort-by', default='total_return')
+    args = parser.parse_args()
+
+    df_ohlcs = load_ohlcs_csv(args.ohlcs_path)
+    if args.random > 0:
+        params_list = list(random_search(default_search_space, args.random))
+    else:
+        params_list = list(grid_search(default_search_space))
+    started_at = time.perf_counter()
+    df_results = run_sweep(df_ohlcs, params_list, max_workers=args.workers, sort_by=args.sort_by)
+    elapsed = time.perf_counter() - started_at
+    df_results.to_csv(args.results_path, index=False)
+    print(f'{len(params_list)} parameter sets x {len(df_ohlcs)} ohlcs in {elapsed:.1f}s '
+          f'({len(params_list) / elapsed:.1f} sets/s)')
+    print(df_results.head(10).to_string())
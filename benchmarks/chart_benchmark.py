@@ -0,0 +1,56 @@
+"""3ヶ月分の1分足と損益を一時フォルダに保存し、Plotterがチャートを作成するまでの時間を、
+描画する場合（キャッシュなし）とキャッシュしたHTMLを返却する場合で計測する。間引かずに描画した場合のHTMLの大きさも比較する
+
+settingsはカレントディレクトリのsettings.iniを、profit_and_lossはインポート時にカレントディレクトリのデータベースを読み込むため、
+settingsをリポジトリのルートで読み込んでから一時フォルダへ移動し、その後にPlotterを読み込む
+
+リポジトリのルートで以下のように実行する
+    python -m benchmarks.chart_benchmark
+"""
+from datetime import datetime, timedelta
+from typing import List
+import os
+import tempfile
+import time
+
+import constants
+import settings  # 一時フォルダへ移動する前に読み込む
+from benchmarks.feature_creation_benchmark import make_ohlcs
+from benchmarks.replay_benchmark import to_buffer
+
+num_days = 90
+pl_interval_minutes = 5
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        from chart_plotting_main import Plotter
+        from profit_and_loss.pl_record import PL, ProfitAndLoss
+        from trading_api.candle_archive import CandleArchive
+
+        num_ohlcs : int = num_days * 24 * 60
+        ohlcs = to_buffer(make_ohlcs(num_ohlcs))
+        archive : CandleArchive = CandleArchive(symbol='BTCUSD', time_interval=constants.DURATION_1M)
+        archive.append(ohlcs)
+        started : datetime = datetime.fromtimestamp(int(ohlcs.open_time[0]))
+        sides : List[str] = [constants.BUY, constants.NONE, constants.SELL, constants.NONE]
+        ProfitAndLoss.bulk_insert([
+            PL(timestamp=started + timedelta(minutes=i * pl_interval_minutes), equity=1.0 + i * 1e-5, side=sides[i // 12 % 4])
+            for i in range(num_ohlcs // pl_interval_minutes)])
+        print(f'{num_ohlcs} ohlcs ({num_days} days of 1 minute ohlcs), {num_ohlcs // pl_interval_minutes} pl rows')
+
+        plotter : Plotter = Plotter(symbol='BTCUSD', time_interval=constants.DURATION_1M, archive=archive)
+        started_at : float = time.perf_counter()
+        path : str = plotter.plot_chart(show=False)
+        print(f'  {"render (downsampled)":<32} {time.perf_counter() - started_at:8.3f} s {os.path.getsize(path) / 1e6:8.2f} MB')
+        started_at = time.perf_counter()
+        plotter.plot_chart(show=False)
+        print(f'  {"cached":<32} {time.perf_counter() - started_at:8.3f} s')
+
+        full_plotter : Plotter = Plotter(
+            symbol='BTCUSD', time_interval=constants.DURATION_1M, archive=archive,
+            max_bars=num_ohlcs, max_line_points=num_ohlcs)
+        started_at = time.perf_counter()
+        path = full_plotter.plot_chart(show=False)
+        print(f'  {"render (every ohlc)":<32} {time.perf_counter() - started_at:8.3f} s {os.path.getsize(path) / 1e6:8.2f} MB')
@@ -0,0 +1,82 @@
+"""特徴量作成の速度・メモリ使用量を、DataFrameをコピーしながら求める従来の実装と比較する
+
+リポジトリのルートで以下のように実行する
+    python -m benchmarks.feature_creation_benchmark
+"""
+from typing import Callable, List
+import timeit
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from trading_brain.feature_builder import build_features
+
+terms : List[int] = [10, 50]
+
+
+def create_features_with_copies(df: pd.DataFrame) -> pd.DataFrame:
+    """比較用の従来の実装。各特徴量を求める度にDataFrameをコピーする"""
+    df = df.copy()  # _create_features
+    df = df.copy()  # _cal_ATR
+    df['ATR'] = (df['high'].rolling(window=5).sum() - df['low'].rolling(window=5).sum()) / 5
+    for term in terms:
+        df = df.copy()
+        df[f'sma_{term}'] = df['close'].rolling(window=term).mean()
+        df = df.copy()
+        df[f'std_{term}'] = df['close'].rolling(window=term).std()
+        df = df.copy()
+        df[f'ema_{term}'] = df['close'].ewm(span=term, adjust=False).mean()
+    df = df.copy()
+    ema_short = df['close'].ewm(span=9, adjust=False).mean()
+    ema_long = df['close'].ewm(span=17, adjust=False).mean()
+    df['macd'] = (ema_short - ema_long)
+    df['macd_signal'] = (ema_short - ema_long).ewm(span=7, adjust=False).mean()
+    df = df.copy()
+    df['max_price'] = df['high'].rolling(window=20).max()
+    df['min_price'] = df['low'].rolling(window=20).min()
+    return df.dropna()
+
+
+def create_features_in_one_pass(df: pd.DataFrame) -> pd.DataFrame:
+    return build_features(
+        open_time=df['open_time'].to_numpy(),
+        open=df['open'].to_numpy(),
+        high=df['high'].to_numpy(),
+        low=df['low'].to_numpy(),
+        close=df['close'].to_numpy(),
+        terms=terms)
+
+
+def make_ohlcs(num_ohlcs: int, seed: int = 0) -> pd.DataFrame:
+    """ランダムウォークでローソク足を生成する"""
+    rng = np.random.default_rng(seed)
+    close : np.ndarray = 50000 + np.cumsum(rng.normal(0, 20, num_ohlcs))
+    open : np.ndarray = np.concatenate([[close[0]], close[:-1]])
+    spread : np.ndarray = np.abs(rng.normal(0, 10, num_ohlcs))
+    return pd.DataFrame({
+        'open_time': pd.date_range('2021-01-01', periods=num_ohlcs, freq='T'),
+        'open': open,
+        'high': np.maximum(open, close) + spread,
+        'low': np.minimum(open, close) - spread,
+        'close': close})
+
+
+def measure(func: Callable[[pd.DataFrame], pd.DataFrame], df: pd.DataFrame, number: int) -> None:
+    seconds : float = min(timeit.repeat(lambda: func(df), number=number, repeat=5)) / number
+    tracemalloc.start()
+    func(df)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'  {func.__name__:<30} {seconds * 1e3:10.3f} ms {peak / 2**20:10.2f} MiB peak')
+
+
+if __name__ == '__main__':
+    for num_ohlcs, number in [(1000, 100), (100_000, 3), (525_600, 1)]:
+        df = make_ohlcs(num_ohlcs)
+        expected = create_features_with_copies(df)
+        actual = create_features_in_one_pass(df)
+        pd.testing.assert_frame_equal(expected, actual, check_exact=False, rtol=1e-7)
+        print(f'{num_ohlcs} ohlcs')
+        measure(create_features_with_copies, df, number)
+        measure(create_features_in_one_pass, df, number)
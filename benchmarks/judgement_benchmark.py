@@ -0,0 +1,58 @@
+"""売買の判断1回あたりの時間を、DataFrameの.ilocで値を参照する従来の実装と比較する
+
+リポジトリのルートで以下のように実行する
+    python -m benchmarks.judgement_benchmark
+"""
+from typing import Callable
+import timeit
+
+import pandas as pd
+
+import constants
+from benchmarks.feature_creation_benchmark import make_ohlcs
+from trading_api.trading_api import OhlcBuffer
+from trading_brain.indicators import IndicatorEngine
+from trading_brain.feature_snapshot import LatestBars
+from trading_brain.judgement import Judgement
+
+number = 10000
+
+
+def judge_with_iloc(df_features: pd.DataFrame, position_side: str) -> int:
+    """比較用の従来の実装。値を参照する度に、全ての列を持つ行（Series）を作成する"""
+    signal_to_create_order : int = 0
+    now_price : float = df_features.iloc[-1]['close']
+    max_price_over_past : float = df_features.iloc[-2]['max_price']
+    min_price_over_past : float = df_features.iloc[-2]['min_price']
+    if (now_price > max_price_over_past) and (not position_side == constants.BUY):
+        signal_to_create_order += 1
+    if (now_price < min_price_over_past) and (not position_side == constants.SELL):
+        signal_to_create_order -= 1
+    return signal_to_create_order
+
+
+def measure(name: str, func: Callable[[], object]) -> None:
+    seconds : float = min(timeit.repeat(func, number=number, repeat=5)) / number
+    print(f'  {name:<40} {seconds * 1e6:10.2f} us')
+
+
+if __name__ == '__main__':
+    df = make_ohlcs(constants.NUMBER_OF_OHLCS)
+    indicator_engine = IndicatorEngine(terms=[10, 50])
+    ohlcs = OhlcBuffer(capacity=len(df))
+    ohlcs.extend(
+        df['open_time'].to_numpy().astype('datetime64[s]').astype('int64'),
+        df[OhlcBuffer.ohlc_columns].to_numpy())
+    indicator_engine.update_from_buffer(ohlcs)
+    df_features : pd.DataFrame = indicator_engine.to_frame()
+    latest_bars : LatestBars = indicator_engine.latest_bars()
+    # Judgement.judgeは入力が変わらない場合に評価を省くため、戦略の評価自体はvoteで計測する
+    judgement = Judgement(strategy_weights={'donchian': 1.0})
+    donchian = judgement.strategies[0][0]
+
+    assert judge_with_iloc(df_features, constants.NONE) == donchian.vote(latest_bars, constants.NONE)
+    print(f'{len(df_features)} rows, {len(df_features.columns)} columns')
+    measure('iloc (previous implementation)', lambda: judge_with_iloc(df_features, constants.NONE))
+    measure('LatestBars creation (once per snapshot)', lambda: indicator_engine.latest_bars())
+    measure('DonchianStrategy.vote on LatestBars', lambda: donchian.vote(latest_bars, constants.NONE))
+    measure('Judgement.judge (unchanged inputs)', lambda: judgement.judge(constants.NONE, latest_bars))
@@ -0,0 +1,107 @@
+"""通貨の数を増やした時の、1回の更新サイクル（全通貨の特徴量の更新と売買の判断）の遅延とメモリ使用量を計測する
+
+REST APIの代わりに、一定の遅延の後にランダムウォークのローソク足を返すSyntheticApiClientを用い、
+全てのパイプラインで1つのクライアントとRequestScheduler（レート制限）を共有する。
+実際のトレードと同じく、ポジションはWebSocketで受け取っている（起動時にのみREST APIで取得する）ものとする
+
+リポジトリのルートで以下のように実行する
+    python -m benchmarks.multi_symbol_benchmark
+"""
+from datetime import datetime
+from typing import Dict, List
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import constants
+from trading_api.trading_api import AccountStateCache, ApiClient, OhlcBuffer, Position, number_of_ohlcs_to_get, unit_minutes
+from trading_api.rate_limiter import RequestScheduler, PUBLIC, PRIVATE, PRIORITY_ACCOUNT, PRIORITY_MARKET_DATA
+from trading_runtime.trading_runtime import TradingRuntime
+
+request_latency = 0.05  # 1回のリクエストの往復にかかる秒数
+num_cycles = 20
+
+
+class SyntheticApiClient:
+    """ApiClientと同じメソッドを持ち、通信の代わりにrequest_latency秒待ってからローソク足を生成して返すクラス"""
+    def __init__(self) -> None:
+        self.account_state_cache : AccountStateCache = AccountStateCache()
+        self.account_state_cache.set_streaming(True)
+        self.request_scheduler : RequestScheduler = RequestScheduler()
+        self.clock = time.time
+        self._rngs : Dict[str, np.random.Generator] = {}
+
+    def _wait(self, kind: str, priority: int, endpoint: str) -> None:
+        self.request_scheduler.acquire(kind, priority, endpoint)
+        time.sleep(request_latency)
+
+    def begin_cycle(self, symbol: str) -> None:
+        ApiClient.begin_cycle(self, symbol)
+
+    def get_available_balance(self, coin: str) -> float:
+        def fetch() -> float:
+            self._wait(PRIVATE, PRIORITY_ACCOUNT, 'private_wallet_balance')
+            return 1.0
+        return self.account_state_cache.get_balance(coin, fetch)
+
+    def get_position(self, symbol: str) -> Position:
+        def fetch() -> Position:
+            self._wait(PRIVATE, PRIORITY_ACCOUNT, 'private_position_list')
+            now : datetime = datetime.now()
+            return Position(
+                side=constants.NONE, size=0, entry_price=0.0, leverage=1.0, liq_price=0.0,
+                created_at=now, updated_at=now)
+        return self.account_state_cache.get_position(symbol, fetch)
+
+    def get_ohlcs(self, symbol: str, time_interval: str, num_ohlcs: int) -> OhlcBuffer:
+        start_time : int = int(self.clock()) - num_ohlcs * unit_minutes[time_interval] * 60
+        return self.get_ohlcs_since(symbol=symbol, start_time=start_time, time_interval=time_interval)
+
+    def get_ohlcs_since(self, symbol: str, start_time: int, time_interval: str) -> OhlcBuffer:
+        unit_seconds : int = unit_minutes[time_interval] * 60
+        now : int = int(self.clock())
+        open_time : np.ndarray = np.arange(start_time - start_time % unit_seconds, now, unit_seconds, dtype=np.int64)
+        for _ in range(0, len(open_time), 200):  # 200個ごとに1ページ
+            self._wait(PUBLIC, PRIORITY_MARKET_DATA, 'public_kline_list')
+        rng : np.random.Generator = self._rngs.setdefault(symbol, np.random.default_rng(len(self._rngs)))
+        close : np.ndarray = 50000 + np.cumsum(rng.normal(0, 20, len(open_time)))
+        spread : np.ndarray = np.abs(rng.normal(0, 10, len(open_time)))
+        ohlcs : OhlcBuffer = OhlcBuffer(capacity=max(len(open_time), 1))
+        ohlcs.extend(open_time, np.column_stack([close, close + spread, close - spread, close]))
+        return ohlcs
+
+
+def measure(num_symbols: int) -> None:
+    symbols : List[str] = [f'S{i:03d}USD' for i in range(num_symbols)]
+    tracemalloc.start()
+    runtime : TradingRuntime = TradingRuntime(
+        symbols=symbols,
+        time_intervals=[constants.DURATION_1M],
+        api_client=SyntheticApiClient(),
+        use_websocket=False)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cycle_seconds : List[float] = []
+    for _ in range(num_cycles):
+        started_at : float = time.perf_counter()
+        runtime.update_all()
+        for pipeline in runtime.pipelines:
+            trader = pipeline.trader
+            runtime.api_client.begin_cycle(trader.symbol)
+            trader.algorithms.send_trading_signal(snapshot=trader.features_creator.channel.latest)
+        cycle_seconds.append(time.perf_counter() - started_at)
+    p50, p99 = np.percentile(cycle_seconds, [50, 99])
+    print(f'{num_symbols:4d} symbols  p50 {p50 * 1e3:9.1f} ms  p99 {p99 * 1e3:9.1f} ms  '
+          f'p50/symbol {p50 / num_symbols * 1e3:7.1f} ms  {peak / 2**20 / num_symbols:8.2f} MiB/symbol at startup')
+
+
+if __name__ == '__main__':
+    print(f'{number_of_ohlcs_to_get} ohlcs per symbol, {request_latency * 1e3:.0f} ms per request')
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # ローソク足のアーカイブを一時フォルダに作成する
+        for num_symbols in [1, 2, 5, 10, 20]:
+            measure(num_symbols)
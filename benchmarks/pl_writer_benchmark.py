@@ -0,0 +1,51 @@
+"""損益の書き込み速度（rows/s）を、1行ごとにコミットする従来のProfitAndLoss.insertと、
+バックグラウンドでまとめて書き込むPLWriterで比較する。PLWriterは、呼び出し元が待つputの時間も計測する
+
+profit_and_lossはインポート時にカレントディレクトリへデータベースを作成するため、一時フォルダへ移動してから読み込む
+
+リポジトリのルートで以下のように実行する
+    python -m benchmarks.pl_writer_benchmark
+"""
+from datetime import datetime, timedelta
+from typing import List
+import os
+import tempfile
+import time
+
+import constants
+
+num_rows = 5000
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        from profit_and_loss.pl_record import PL, ProfitAndLoss
+        from profit_and_loss.pl_writer import PLWriter
+
+        started : datetime = datetime(2021, 1, 1)
+        pls : List[PL] = [
+            PL(timestamp=started + timedelta(seconds=i), equity=1.0 + i * 1e-6, side=constants.BUY)
+            for i in range(2 * num_rows)]
+        print(f'{num_rows} rows')
+
+        started_at : float = time.perf_counter()
+        for pl in pls[:num_rows]:
+            ProfitAndLoss.insert(pl)
+        elapsed : float = time.perf_counter() - started_at
+        print(f'  {"ProfitAndLoss.insert (commit per row)":<40} {num_rows / elapsed:12.0f} rows/s')
+
+        pl_writer : PLWriter = PLWriter()
+        put_seconds : List[float] = []
+        started_at = time.perf_counter()
+        for pl in pls[num_rows:]:
+            put_started_at : float = time.perf_counter()
+            pl_writer.put(pl)
+            put_seconds.append(time.perf_counter() - put_started_at)
+        pl_writer.flush()
+        elapsed = time.perf_counter() - started_at
+        put_seconds.sort()
+        print(f'  {"PLWriter (batched, WAL)":<40} {num_rows / elapsed:12.0f} rows/s')
+        print(f'  {"PLWriter.put p50 / p99":<40} {put_seconds[len(put_seconds) // 2] * 1e6:9.1f} us'
+              f' / {put_seconds[int(len(put_seconds) * 0.99)] * 1e6:.1f} us')
+        pl_writer.close()
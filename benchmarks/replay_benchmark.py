@@ -0,0 +1,40 @@
+"""SimulatedExchange上で実際のFeaturesCreatorとTraderを動かし、足を受け取ってから注文が取引所に届くまでの遅延と、
+1秒あたりに処理できる足の数を、リクエストの往復にかかる時間ごとに計測する
+
+ランダムウォークのローソク足を待機せずに再生するため、同じ条件では常に同じ注文が出る
+
+リポジトリのルートで以下のように実行する
+    python -m benchmarks.replay_benchmark
+"""
+import pandas as pd
+
+import constants
+from benchmarks.feature_creation_benchmark import make_ohlcs
+from trading_api.trading_api import OhlcBuffer
+from simulator.replay import ReplayDriver
+
+num_ohlcs = 5000
+latencies = [0.0, 0.001, 0.005]
+
+
+def to_buffer(df: pd.DataFrame) -> OhlcBuffer:
+    ohlcs : OhlcBuffer = OhlcBuffer(capacity=len(df))
+    ohlcs.extend(
+        df['open_time'].to_numpy().astype('datetime64[s]').astype('int64'),
+        df[OhlcBuffer.ohlc_columns].to_numpy())
+    return ohlcs
+
+
+if __name__ == '__main__':
+    ohlcs : OhlcBuffer = to_buffer(make_ohlcs(num_ohlcs + constants.NUMBER_OF_OHLCS))
+    print(f'{num_ohlcs} ohlcs after {constants.NUMBER_OF_OHLCS} warm-up ohlcs, replayed without waiting')
+    print(f'{"latency":>10} {"ohlcs/s":>10} {"cycle p50":>10} {"cycle p99":>10} '
+          f'{"order p50":>10} {"order p99":>10} {"fills":>6}')
+    for latency in latencies:
+        summary = ReplayDriver(ohlcs=ohlcs, speed=None, latency=latency).run().summary()
+        print(f'{latency * 1e3:8.1f}ms {summary["ohlcs_per_second"]:10.1f} '
+              f'{summary["cycle_p50_ms"]:8.2f}ms {summary["cycle_p99_ms"]:8.2f}ms '
+              f'{summary["tick_to_order_p50_ms"]:8.2f}ms {summary["tick_to_order_p99_ms"]:8.2f}ms '
+              f'{summary["num_fills"]:6d}')
+    # 1000倍速で再生するには、1分足を60ms以内に処理する必要がある
+    print(f'1000x real time needs {1000 / 60:.1f} ohlcs/s for 1 minute ohlcs')
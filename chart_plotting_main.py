@@ -1,44 +1,281 @@
-from typing import List, Any
+from datetime import datetime
+from typing import Any, Dict, List, Tuple, Union
+import argparse
+import hashlib
+import math
+import os
+import time
+import webbrowser
 
+import dateutil.tz
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+import constants
+import settings
+from trading_api.candle_archive import CandleArchive
+from trading_api.trading_api import ApiClient, OhlcBuffer, unit_minutes
+from trading_brain.feature_builder import build_features
+from profit_and_loss.pl_analytics import EquityStats, get_equity_stats
+from profit_and_loss.pl_record import PL, ProfitAndLoss
+from utils.downsampling import downsample_ohlc, lttb
+from logger import Logger
+
+logger = Logger()
+
+# 期間を持つ特徴量の接頭辞。build_featuresにはこの期間のみを渡す
+term_feature_prefixes = ('sma', 'std', 'ema')
+
+
+def to_local_datetime(open_time: np.ndarray) -> pd.DatetimeIndex:
+    """タイムスタンプ（秒）の配列をローカル時刻に変換する（OhlcBuffer.to_frameと同じ変換）"""
+    return pd.to_datetime(open_time, unit='s', utc=True).tz_convert(dateutil.tz.tzlocal()).tz_localize(None)
 
-from trading_brain.feature_creation import SingletonFeaturesCreator
 
 class Plotter:
-    def __init__(self) -> None:
-        _feature_creator : SingletonFeaturesCreator = SingletonFeaturesCreator()
-        self.df_features : pd.DataFrame = _feature_creator.df_features
-        self.ploted_data : List[Any] = []
-
-    def plot_chart(self):
-        self._add_ohlc_to_ploted_data()
-        self._add_sma_to_ploted_data()
-        fig = go.Figure(data=self.ploted_data)
-        fig.write_html("test.html")
-        fig.show()
-
-    def _add_ohlc_to_ploted_data(self):
-        ohlc_data = go.Candlestick(
-            x=self.df_features['open_time'],
-            open=self.df_features['open'],
-            high=self.df_features['high'],
-            low=self.df_features['low'],
-            close=self.df_features['close'],
-            name='ohlc')
-        self.ploted_data.append(ohlc_data)
-
-    def _add_sma_to_ploted_data(self):
-        sma_data = go.Scatter(
-            x=self.df_features['open_time'],
-            y=self.df_features['ema_10'],
-            name='ema_10',
-            opacity=0.6,  # 透明度
-            marker={'color':'#ffd12a'})
-        self.ploted_data.append(sma_data)
+    """ローカルに保存したローソク足（CandleArchive）と損益（ProfitAndLoss）から、チャートを作成するクラス
+
+    REST APIを呼ばずに保存済みのローソク足から特徴量を求め、画面の解像度に合わせて間引いてから描画する。
+    ローソク足は始値・高値・安値・終値を保ったまま長い単位時間の足にまとめ、折れ線はLTTBで間引くため、
+    数ヶ月分の1分足でも描画する点の数は一定となる。
+    描画したHTMLは、範囲・設定と、範囲内の最後のローソク足・損益の時刻から求めたキーごとにconstants.CHART_CACHE_FOLDERへ保存し、
+    データが変わっていなければ描画し直さない
+
+    Attributes
+    ----------
+    symbol : str
+        通貨 e.g.) BTCUSD
+    time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
+        ローソク足の単位時間
+    start_time : int
+        範囲の開始時刻のタイムスタンプ。0の場合は保存している最初の足から
+    end_time : int | None
+        範囲の終了時刻のタイムスタンプ。この時刻に始まる足は含まない。Noneの場合は最後まで
+    line_columns : List[str]
+        ローソク足に重ねる特徴量の列名 e.g.) ['ema_10', 'max_price']
+    max_bars : int
+        描画するローソク足の最大の本数
+    max_line_points : int
+        描画する折れ線1本あたりの最大の点の数
+    archive : CandleArchive
+        読み込むローソク足の保存先
+
+    Methods
+    -------
+    plot_chart -> str
+        チャートを作成し、HTMLのパスを返却する
+    backfill -> int
+        保存している最後の足から現在時刻までのローソク足をREST APIで取得し、保存する
+    """
+    def __init__(
+            self,
+            symbol: str = settings.symbols[0],
+            time_interval: str = settings.time_intervals[0],
+            start_time: int = 0,
+            end_time: Union[int, None] = None,
+            line_columns: Union[List[str], None] = None,
+            max_bars: int = constants.CHART_MAX_BARS,
+            max_line_points: int = constants.CHART_MAX_LINE_POINTS,
+            archive: Union[CandleArchive, None] = None) -> None:
+        self.symbol : str = symbol
+        self.time_interval : str = time_interval
+        self.start_time : int = start_time
+        self.end_time : Union[int, None] = end_time
+        self.line_columns : List[str] = line_columns if line_columns is not None else ['ema_10']
+        self.max_bars : int = max_bars
+        self.max_line_points : int = max_line_points
+        self.archive : CandleArchive = archive if archive is not None else CandleArchive(symbol=symbol, time_interval=time_interval)
+        self.unit_seconds : int = unit_minutes[time_interval] * 60
+        self.terms : List[int] = sorted({
+            int(column.rsplit('_', 1)[1]) for column in self.line_columns
+            if column.split('_', 1)[0] in term_feature_prefixes}) or [10]
+
+    def plot_chart(self, show: bool = True) -> str:
+        """チャートを作成し、HTMLのパスを返却する。同じ範囲・設定・データのHTMLが保存済みの場合は描画し直さない
+
+        Parameters
+        ----------
+        show : bool
+            作成したHTMLをブラウザで開く場合はTrue
+
+        Returns
+        -------
+        str
+            チャートのHTMLのパス
+        """
+        started_at : float = time.perf_counter()
+        path : str = os.path.join(constants.CHART_CACHE_FOLDER, f'{self.cache_key()}.html')
+        if os.path.exists(path):
+            logger.info(f'chart is cached: {path}')
+        else:
+            fig : go.Figure = self._build_figure()
+            os.makedirs(constants.CHART_CACHE_FOLDER, exist_ok=True)
+            # plotly.jsを埋め込むと1ファイルあたり数MBとなるため、CDNから読み込む
+            fig.write_html(path, include_plotlyjs='cdn')
+            logger.info(f'rendered chart in {time.perf_counter() - started_at:.3f}s: {path}')
+        if show:
+            webbrowser.open(f'file://{os.path.abspath(path)}')
+        return path
+
+    def cache_key(self) -> str:
+        """チャートのキャッシュのキー。範囲と設定に加え、範囲内の最後のローソク足・損益の時刻を含むため、
+        範囲内にデータが追加されると別のキーとなる"""
+        last_open_time : Union[int, None] = self.archive.last_open_time()
+        if last_open_time is not None and self.end_time is not None:
+            last_open_time = min(last_open_time, self.end_time)
+        stats : Union[EquityStats, None] = get_equity_stats()
+        last_pl_time : Union[float, None] = None
+        if stats is not None and stats.last_timestamp is not None:
+            last_pl_time = stats.last_timestamp.timestamp()
+            if self.end_time is not None:
+                last_pl_time = min(last_pl_time, self.end_time)
+        key : Tuple[Any, ...] = (
+            self.symbol, self.time_interval, self.start_time, self.end_time, tuple(self.line_columns),
+            self.max_bars, self.max_line_points, last_open_time, last_pl_time)
+        return hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+
+    def backfill(self, api_client: ApiClient) -> int:
+        """保存している最後の足（保存していない場合はstart_time）から現在時刻までのローソク足をREST APIで取得し、
+        確定した足のみを保存する
+
+        Returns
+        -------
+        int
+            保存した足の数
+        """
+        last_open_time : Union[int, None] = self.archive.last_open_time()
+        start_time : int = self.start_time if last_open_time is None else last_open_time + self.unit_seconds
+        ohlcs : OhlcBuffer = api_client.get_ohlcs_since(self.symbol, start_time, self.time_interval)
+        if len(ohlcs) > 0:
+            ohlcs.truncate_from(ohlcs.last_open_time())  # 最後の足はまだ確定していない
+        num_ohlcs : int = len(self.archive)
+        self.archive.append(ohlcs)
+        return len(self.archive) - num_ohlcs
+
+    def _load_ohlcs(self) -> Tuple[OhlcBuffer, int]:
+        """範囲のローソク足を、特徴量を求めるための前の足と共に読み込む
+
+        Returns
+        -------
+        Tuple[OhlcBuffer, int]
+            ローソク足と、範囲の最初の足の位置
+        """
+        # 取引中と同じく、constants.NUMBER_OF_OHLCS本の足から特徴量を求め始める
+        warmup_start_time : int = max(self.start_time - constants.NUMBER_OF_OHLCS * self.unit_seconds, 0)
+        ohlcs : OhlcBuffer = self.archive.read_range(start_time=warmup_start_time, end_time=self.end_time)
+        return ohlcs, int(np.searchsorted(ohlcs.open_time, self.start_time, side='left'))
+
+    def _build_figure(self) -> go.Figure:
+        ohlcs, start = self._load_ohlcs()
+        if len(ohlcs) == start:
+            logger.warn(f'no ohlcs are archived for {self.symbol} {self.time_interval} in the range')
+        open_time : np.ndarray = ohlcs.open_time[start:]
+
+        fig : go.Figure = make_subplots(
+            rows=2, cols=1, shared_xaxes=True, row_heights=[0.75, 0.25], vertical_spacing=0.03)
+        self._add_ohlc(fig, ohlcs, start)
+        self._add_features(fig, ohlcs, start)
+        self._add_pls(fig, open_time, ohlcs.column('close')[start:])
+        fig.update_layout(
+            title=f'{self.symbol} {self.time_interval}',
+            xaxis_rangeslider_visible=False,  # レンジスライダーは全ての足を描き直すため表示しない
+            hovermode='x')
+        return fig
+
+    def _add_ohlc(self, fig: go.Figure, ohlcs: OhlcBuffer, start: int) -> None:
+        num_ohlcs : int = len(ohlcs) - start
+        bucket_seconds : int = self.unit_seconds * max(math.ceil(num_ohlcs / self.max_bars), 1)
+        open_time, open, high, low, close = downsample_ohlc(
+            ohlcs.open_time[start:],
+            ohlcs.column('open')[start:],
+            ohlcs.column('high')[start:],
+            ohlcs.column('low')[start:],
+            ohlcs.column('close')[start:],
+            bucket_seconds)
+        fig.add_trace(
+            go.Candlestick(
+                x=to_local_datetime(open_time), open=open, high=high, low=low, close=close,
+                name=f'ohlc ({bucket_seconds // 60}m)'),
+            row=1, col=1)
+
+    def _add_features(self, fig: go.Figure, ohlcs: OhlcBuffer, start: int) -> None:
+        """特徴量を間引く前の足から求め、LTTBで間引いて重ねる"""
+        df_features : pd.DataFrame = build_features(
+            open_time=ohlcs.open_time,
+            open=ohlcs.column('open'),
+            high=ohlcs.column('high'),
+            low=ohlcs.column('low'),
+            close=ohlcs.column('close'),
+            terms=self.terms)
+        df_features = df_features.loc[start:]
+        open_time : np.ndarray = df_features['open_time'].to_numpy()
+        for column in self.line_columns:
+            x, y = lttb(open_time, df_features[column].to_numpy(), self.max_line_points)
+            fig.add_trace(
+                go.Scattergl(x=to_local_datetime(x), y=y, name=column, mode='lines', opacity=0.6),
+                row=1, col=1)
+
+    def _add_pls(self, fig: go.Figure, open_time: np.ndarray, close: np.ndarray) -> None:
+        """損益を読み込み、評価額の推移を下段に、ポジションを持った・決済した時刻を終値の上に重ねる"""
+        start : datetime = datetime.fromtimestamp(self.start_time)
+        end : Union[datetime, None] = datetime.fromtimestamp(self.end_time) if self.end_time is not None else None
+        pls : List[PL] = ProfitAndLoss.get_range(start=start, end=end)
+        if not pls:
+            return None
+        pl_time : np.ndarray = np.array([pl.timestamp.timestamp() for pl in pls], dtype=np.int64)
+        equity : np.ndarray = np.array([pl.equity for pl in pls], dtype=np.float64)
+        x, y = lttb(pl_time, equity, self.max_line_points)
+        fig.add_trace(
+            go.Scattergl(x=to_local_datetime(x), y=y, name='equity', mode='lines', line={'color': '#636efa'}),
+            row=2, col=1)
+
+        if len(open_time) == 0:
+            return None
+        # ポジションの向きが変わった行を取引とみなす
+        markers : Dict[str, Dict[str, Any]] = {
+            constants.BUY: {'symbol': 'triangle-up', 'color': '#2ca02c'},
+            constants.SELL: {'symbol': 'triangle-down', 'color': '#d62728'},
+            constants.NONE: {'symbol': 'x', 'color': '#7f7f7f'},
+        }
+        previous_side : str = constants.NONE
+        trades : Dict[str, List[int]] = {side: [] for side in markers}
+        for i, pl in enumerate(pls):
+            if pl.side != previous_side and pl.side in trades:
+                trades[pl.side].append(i)
+            previous_side = pl.side
+        for side, indices in trades.items():
+            if not indices:
+                continue
+            trade_time : np.ndarray = pl_time[indices]
+            bar_indices : np.ndarray = np.clip(np.searchsorted(open_time, trade_time, side='right') - 1, 0, len(close) - 1)
+            fig.add_trace(
+                go.Scatter(
+                    x=to_local_datetime(trade_time), y=close[bar_indices],
+                    name='close' if side == constants.NONE else side.lower(),
+                    mode='markers', marker={**markers[side], 'size': 9}),
+                row=1, col=1)
 
 
 if __name__ == '__main__':
-    plotter = Plotter()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbol', default=settings.symbols[0])
+    parser.add_argument('--time-interval', default=settings.time_intervals[0])
+    parser.add_argument('--days', type=float, default=30.0, help='描画する日数。0の場合は保存している全ての足')
+    parser.add_argument('--lines', default='ema_10', help='ローソク足に重ねる特徴量の列名（カンマ区切り）')
+    parser.add_argument('--max-bars', type=int, default=constants.CHART_MAX_BARS)
+    parser.add_argument('--fetch', action='store_true', help='描画する前に、最後の足から現在時刻までの足をREST APIで取得して保存する')
+    parser.add_argument('--no-show', action='store_true')
+    args = parser.parse_args()
 
-    plotter.plot_chart()
\ No newline at end of file
+    plotter = Plotter(
+        symbol=args.symbol,
+        time_interval=args.time_interval,
+        # 日の単位で切り捨て、同じ日の間は同じ範囲（キャッシュのキー）となるようにする
+        start_time=int(time.time() - args.days * 24 * 60 * 60) // (24 * 60 * 60) * (24 * 60 * 60) if args.days > 0 else 0,
+        line_columns=[column.strip() for column in args.lines.split(',') if column.strip()],
+        max_bars=args.max_bars)
+    if args.fetch:
+        print(f'{plotter.backfill(ApiClient())} ohlcs are archived')
+    print(plotter.plot_chart(show=not args.no_show))
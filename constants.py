@@ -22,11 +22,69 @@ LIMIT = 'Limit'
 MARKET = 'Market'
 STOP = 'Stop'
 
+GOOD_TILL_CANCEL = 'GoodTillCancel'  # bybit v2のtime_in_forceの値
+
 NUMBER_OF_OHLCS = 1000
+NUMBER_OF_LATEST_BARS = 10  # 判断に用いるため、スナップショットにfloatとして保持する直近の足の数
 UPDATE_INTERVAL = 20
+ACCOUNT_CACHE_TTL = 5.0  # ポジションと残高のキャッシュの有効期間（秒）
+ORDER_CONFIRM_TIMEOUT = 5.0  # 送信した注文の更新をこの秒数受け取れない場合、REST APIで注文の一覧を取得し直す
+
+# 通貨ごとの呼値の単位。含まれない通貨はDEFAULT_PRICE_TICK_SIZEとする
+PRICE_TICK_SIZES = {
+    'BTCUSD': 0.5,
+    'ETHUSD': 0.05,
+    'EOSUSD': 0.001,
+    'XRPUSD': 0.0001,
+}
+DEFAULT_PRICE_TICK_SIZE = 0.5
+
+MAX_CONCURRENT_UPDATES = 4  # REST APIで並行して特徴量を更新するパイプラインの数
+
+# レート制限 (1秒あたりに送信できるリクエスト数, 連続して送信できるリクエスト数)
+PUBLIC_RATE_LIMIT = (20.0, 20.0)
+PRIVATE_RATE_LIMIT = (100 / 60, 10.0)  # PRIVATE_ENDPOINT_RATE_LIMITSに含まれないprivateのエンドポイント
+# bybitはprivateのエンドポイントごとに制限するため、エンドポイントごとに別々に数える。名前はpybybitのメソッド名
+PRIVATE_ENDPOINT_RATE_LIMITS = {
+    'private_order_create': (100 / 60, 10.0),
+    'private_order_cancelall': (100 / 60, 10.0),
+    'private_order_list': (600 / 60, 10.0),
+    'private_stoporder_create': (100 / 60, 10.0),
+    'private_stoporder_replace': (100 / 60, 10.0),
+    'private_stoporder_cancelall': (100 / 60, 10.0),
+    'private_stoporder_list': (600 / 60, 10.0),
+    'private_position_list': (120 / 60, 10.0),
+    'private_wallet_balance': (120 / 60, 10.0),
+}
 
 STOP_RANGE = 2.0  # 損切りを行う閾値幅の倍率
+STOP_REPLACE_RATE = 0.1  # 損切りの価格がATRのこの割合以上動いた時のみ、取引所の逆指値注文を変更する
 ACCEPTSBEL_LOSS_RATE = 0.001  # 全資産のうち、損失を許容する割合
+TAKER_FEE_RATE = 0.00075  # 成行注文の手数料率
+
+# 損益の書き込み。キューの最大の行数、1回のトランザクションで書き込む最大の行数、書き込むまでに待つ最大の秒数
+PL_QUEUE_MAXSIZE = 10000
+PL_BATCH_SIZE = 500
+PL_FLUSH_INTERVAL = 1.0
+
+# チャートの描画。画面の解像度に合わせて間引く、ローソク足の最大の本数と折れ線の最大の点の数
+CHART_MAX_BARS = 1500
+CHART_MAX_LINE_POINTS = 3000
+CHART_CACHE_FOLDER = 'charts'  # 描画したチャートのHTMLを、範囲と設定ごとに保存するフォルダ
+
+# 計測。メトリクスを公開するHTTPサーバーのアドレス（ポートが0の場合は起動しない）と、サンプリングプロファイラの間隔（秒）
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 8000
+PROFILER_SAMPLE_INTERVAL = 0.01
+
+# 判断に用いる戦略とその重み。シグナルの重み付き和が1以上で買い、-1以下で売り（0の戦略は評価しない）
+STRATEGY_WEIGHTS = {
+    'donchian': 1.0,
+    'macd': 0.0,
+}
 
 timestamp = datetime.strftime(datetime.now(), '%Y%m%d%H%M%S')
-db_name = f'bybit_pl_{timestamp}.sql'
\ No newline at end of file
+# 損益は起動ごとに分けず、1つのデータベースに保存し続ける。以前の起動ごとのファイル（bybit_pl_{timestamp}.sql）は
+# python -m profit_and_loss.importer で取り込む
+db_name = 'bybit_pl.sql'
+legacy_db_name_pattern = 'bybit_pl_*.sql'
\ No newline at end of file
@@ -1,34 +1,118 @@
-from typing import List, Dict, Union
+from typing import Union
 
 import math
 
 import constants
 from trading_api.trading_api import ApiClient, Position
-from trading_brain.feature_creation import SingletonFeaturesCreator
+from trading_brain.feature_creation import FeaturesCreator
+from trading_brain.feature_snapshot import FeatureSnapshot, LatestBars
+
 
 class FundManager:
-    def __init__(self) -> None:
-        self.api_client : ApiClient = ApiClient()
-        _features_creator = SingletonFeaturesCreator()
-        _df_features = _features_creator.df_features
-        self.now_price : float = _df_features.iloc[-1]['close']
-        self.ATR : float = _df_features.iloc[-1]['close']
-
-    def decide_if_stop_position(self) -> bool:
-        now_position : Position = self.api_client.get_position()
-        side_sign : int = 1 if now_position.side==constants.BUY else -1  #ポジションが買いの時:1, 売りの時:-1 
-
-        entry_price : float = now_position.entry_price
-        stop_price : float = self.now_price - side_sign * self.ATR * constants.STOP_RANGE
-        
-        if entry_price < stop_price * side_sign:
-            return True
-        return False
+    """損切りの価格と注文数量を求めるクラス
+
+    現在価格とATRは特徴量のスナップショットを受け取る度に、残高はポジション情報を受け取る度に更新する。
+    判断はいずれも保持している値のみを用いるため、定数時間で終わり、APIへのリクエストを行わない
+
+    残高は、注文数量の計算と損益の記録のいずれにも、ポジション情報に含まれるwallet_balance（証拠金を含む残高）を用いる。
+    証拠金を除いたavailable_balanceと混ぜると、ポジションを持つ度に値が変わり、損益の記録が上下してしまうため
+
+    Attributes
+    ----------
+    api_client : ApiClient
+        bybitAPIラッパーインスタンス。残高がまだ分からない場合にのみ、ポジション情報の取得に用いる
+    symbol : str
+        通貨 e.g.) BTCUSD
+    now_price : float
+        最新の足の終値
+    ATR : float
+        最新の足のATR
+    wallet_balance : float | None
+        最後に受け取ったポジション情報のwallet_balance（coin建て、証拠金を含む）。まだ受け取っていない場合はNone
+
+    Methods
+    -------
+    on_snapshot -> None
+        特徴量のスナップショットを受け取り、現在価格とATRを更新する
+    on_position -> None
+        ポジション情報を受け取り、残高を更新する
+    stop_price -> float
+        ポジションの損切りの価格を求める
+    decide_if_stop_position -> bool
+        損切りを行うか否かを判断する
+    cul_qty -> int
+        注文数量を求める
+    """
+    def __init__(self, api_client: ApiClient, features_creator: FeaturesCreator) -> None:
+        self.api_client : ApiClient = api_client
+        self.symbol : str = features_creator.symbol
+        self.now_price : float = math.nan
+        self.ATR : float = math.nan
+        self.wallet_balance : Union[float, None] = None
+        self.on_snapshot(features_creator.channel.latest)
+
+    def on_snapshot(self, snapshot: FeatureSnapshot) -> None:
+        """特徴量のスナップショットを受け取り、現在価格とATRを更新する"""
+        latest_bars : LatestBars = snapshot.latest_bars
+        self.now_price = latest_bars.last('close')
+        self.ATR = latest_bars.last('ATR')
+
+    def on_position(self, position: Position) -> None:
+        """ポジション情報を受け取り、残高を更新する。ポジション情報に残高が含まれない場合は何もしない"""
+        if position.wallet_balance is not None:
+            self.wallet_balance = position.wallet_balance
+
+    def stop_price(self, position: Position) -> float:
+        """ポジションの損切りの価格を求める。買いの場合は取得価格からATRの倍数だけ下、売りの場合は上
+
+        Parameters
+        ----------
+        position : Position
+            現在のポジション
+
+        Returns
+        -------
+        float
+            損切りの価格
+        """
+        side_sign : int = 1 if position.side == constants.BUY else -1  # ポジションが買いの時:1, 売りの時:-1
+        return position.entry_price - side_sign * self.ATR * constants.STOP_RANGE
+
+    def decide_if_stop_position(self, position: Position) -> bool:
+        """現在価格が損切りの価格を超えて、ポジションと逆の方向に動いたかを判断する
+
+        Parameters
+        ----------
+        position : Position
+            現在のポジション
+
+        Returns
+        -------
+        bool
+            損切りを行う場合はTrue
+        """
+        if position.side == constants.NONE:
+            return False
+        side_sign : int = 1 if position.side == constants.BUY else -1
+        return side_sign * (self.now_price - self.stop_price(position)) < 0
 
     def cul_qty(self) -> int:
-        available_USD : float = self.api_client.get_available_balance() * self.now_price
+        """1回の損切りでの損失が資産のconstants.ACCEPTSBEL_LOSS_RATEとなる注文数量（USD）を求める
+
+        Returns
+        -------
+        int
+            注文数量。ATRもしくは残高が求まっていない場合は0
+        """
+        if self.wallet_balance is None:
+            self.on_position(self.api_client.get_position(self.symbol))
+        if self.wallet_balance is None:
+            return 0
         range_for_stop_loss : float = self.ATR * constants.STOP_RANGE / self.now_price
+        if not range_for_stop_loss > 0:
+            return 0
+        available_USD : float = self.wallet_balance * self.now_price
 
         qty : int = math.floor(available_USD * constants.ACCEPTSBEL_LOSS_RATE / range_for_stop_loss)
 
-        return qty
\ No newline at end of file
+        return qty
@@ -0,0 +1,106 @@
+from typing import Any, Dict, List, Union
+import threading
+
+import constants
+from trading_api.trading_api import StopOrder, parse_stop_order
+from logger import Logger
+
+logger = Logger()
+
+# WebSocketで受け取る逆指値注文の状態のうち、まだ取引所に置かれているもの
+untriggered_statuses = ('Untriggered',)
+
+
+class StopOrderBook:
+    """1つの通貨について、取引所に置いている逆指値注文（損切り）をローカルに保持するクラス
+
+    注文の作成・変更のレスポンスと、WebSocketで受け取る逆指値注文の更新から状態を更新するため、
+    損切りの価格を変更する度に注文の一覧を取得する必要はない。
+    切断や注文の変更の失敗などで取引所の状態と食い違った可能性がある場合はneeds_reconcileをTrueとし、
+    次の判断の前にREST APIで取得した一覧で置き換える
+
+    Attributes
+    ----------
+    symbol : str
+        通貨 e.g.) BTCUSD
+    needs_reconcile : bool
+        取引所の状態と食い違った可能性がある場合はTrue。起動直後は取引所の状態が分からないためTrue
+
+    Methods
+    -------
+    get -> StopOrder | None
+        保持している逆指値注文のうち1つを返却する
+    add -> None
+        作成した逆指値注文を追加する
+    update -> None
+        変更した逆指値注文の数量とトリガー価格を反映する
+    clear -> None
+        全ての逆指値注文を削除する
+    reset -> None
+        REST APIで取得した一覧で置き換える
+    mark_stale -> None
+        取引所の状態と食い違った可能性があることを記録する
+    on_stream -> None
+        WebSocketで受け取った逆指値注文の更新を反映する
+    """
+    def __init__(self, symbol: str) -> None:
+        self.symbol : str = symbol
+        self.needs_reconcile : bool = True
+        self._stop_orders : Dict[str, StopOrder] = {}
+        self._lock : threading.Lock = threading.Lock()  # WebSocketのスレッドからも更新されるため
+
+    def __len__(self) -> int:
+        return len(self._stop_orders)
+
+    def get(self) -> Union[StopOrder, None]:
+        """保持している逆指値注文のうち1つを返却する。保持していない場合はNone"""
+        with self._lock:
+            return next(iter(self._stop_orders.values()), None)
+
+    def add(self, stop_order: StopOrder) -> None:
+        """作成した逆指値注文を追加する"""
+        with self._lock:
+            self._stop_orders[stop_order.stop_order_id] = stop_order
+
+    def update(self, stop_order_id: str, qty: int, stop_px: float) -> None:
+        """変更した逆指値注文の数量とトリガー価格を反映する。既に削除されている場合は何もしない"""
+        with self._lock:
+            stop_order : Union[StopOrder, None] = self._stop_orders.get(stop_order_id)
+            if stop_order is not None:
+                stop_order.qty = qty
+                stop_order.stop_px = stop_px
+
+    def clear(self) -> None:
+        """全ての逆指値注文を削除する"""
+        with self._lock:
+            self._stop_orders.clear()
+
+    def reset(self, stop_orders: List[StopOrder]) -> None:
+        """REST APIで取得した一覧で置き換え、取引所の状態と一致したことを記録する"""
+        with self._lock:
+            self._stop_orders = {stop_order.stop_order_id: stop_order for stop_order in stop_orders}
+            self.needs_reconcile = False
+
+    def mark_stale(self) -> None:
+        """取引所の状態と食い違った可能性があることを記録する"""
+        self.needs_reconcile = True
+
+    def on_stream(self, stop_orders_info: List[Dict[str, Any]]) -> None:
+        """WebSocketで受け取った逆指値注文の更新を反映する。
+        トリガー、キャンセルされた注文は削除し、置かれたままの注文は追加・更新する
+
+        Parameters
+        ----------
+        stop_orders_info : List[Dict[str, Any]]
+            WebSocketで受け取った、この通貨の逆指値注文の情報
+        """
+        with self._lock:
+            for stop_order_info in stop_orders_info:
+                if stop_order_info.get('stop_order_type', constants.STOP) != constants.STOP:
+                    continue  # 利確などの条件付き注文は扱わない
+                stop_order : StopOrder = parse_stop_order(stop_order_info)
+                if stop_order_info['order_status'] in untriggered_statuses:
+                    self._stop_orders[stop_order.stop_order_id] = stop_order
+                else:
+                    self._stop_orders.pop(stop_order.stop_order_id, None)
+                    logger.info(f"{self.symbol} stop order {stop_order.stop_order_id} is {stop_order_info['order_status']}")
@@ -0,0 +1,226 @@
+from typing import Any, Dict, List, Union
+import threading
+import time
+import uuid
+
+import constants
+from trading_api.trading_api import Order
+from logger import Logger
+from utils.metrics import metrics
+
+logger = Logger()
+
+CREATED = 'Created'  # 注文を送信し、取引所で受け付けられたことをまだ確認していない
+NEW = 'New'
+PARTIALLY_FILLED = 'PartiallyFilled'
+FILLED = 'Filled'
+CANCELLED = 'Cancelled'
+REJECTED = 'Rejected'
+
+open_statuses = (CREATED, NEW, PARTIALLY_FILLED, 'PendingCancel')
+
+
+class OrderManager:
+    """1つの通貨について、出した注文の状態をローカルに保持するクラス
+
+    注文は取引所が割り振る注文ID（order_id）と、注文を出す前に割り振る注文ID（order_link_id）の両方で引けるよう保持する。
+    状態は注文作成のレスポンスと、WebSocketで受け取る注文の更新から
+        Created -> New -> PartiallyFilled -> Filled | Cancelled | Rejected
+    と遷移させ、約定していない数量を売り買いごとに集計しておくため、未約定の数量は定数時間で求まる。
+    REST APIで注文の一覧を取得するのは、起動直後、再接続後、
+    もしくは送信した注文の更新をconstants.ORDER_CONFIRM_TIMEOUT秒以上受け取れていない場合のみとする
+
+    Attributes
+    ----------
+    symbol : str
+        通貨 e.g.) BTCUSD
+
+    Methods
+    -------
+    register -> bool
+        注文を出す前に呼び、order_link_idを割り振って保持する
+    on_create_response -> None
+        注文作成のレスポンスを反映する
+    on_stream -> None
+        WebSocketで受け取った注文の更新を反映する
+    open_qty -> int
+        約定していない数量を返却する
+    has_open_order -> bool
+        約定していない注文があるかを返却する
+    get -> Order | None
+        注文IDから注文を返却する
+    needs_reconcile -> bool
+        REST APIで注文の一覧を取得し直す必要があるかを返却する
+    reconcile -> None
+        REST APIで取得した注文の一覧で置き換える
+    mark_stale -> None
+        取引所の状態と食い違った可能性があることを記録する
+    """
+    def __init__(self, symbol: str) -> None:
+        self.symbol : str = symbol
+        self._orders : Dict[str, Order] = {}  # order_link_id -> 約定していない注文
+        self._link_ids : Dict[str, str] = {}  # order_id -> order_link_id
+        self._open_qty : Dict[str, int] = {constants.BUY: 0, constants.SELL: 0}
+        self._sent_at : Dict[str, float] = {}  # 取引所で受け付けられたことをまだ確認していない注文の送信時刻
+        self._is_stale : bool = True  # 起動直後は取引所の状態が分からない
+        self._lock : threading.Lock = threading.Lock()  # WebSocketのスレッドからも更新されるため
+
+    def register(self, order: Order) -> bool:
+        """注文を出す前に呼び、order_link_idを割り振って保持する。
+        同じ向きの約定していない注文が既にある場合は、重複した注文とみなして保持せずFalseを返却する
+
+        Parameters
+        ----------
+        order : Order
+            これから出す注文
+
+        Returns
+        -------
+        bool
+            注文を出してよい場合はTrue
+        """
+        with self._lock:
+            if self._open_qty[order.side] > 0:
+                metrics.counter(f'duplicate_orders_{self.symbol}').inc()
+                logger.error(f'{self.symbol} duplicate {order.side} order is rejected: {order}', exc_info=False)
+                return False
+            order.order_link_id = uuid.uuid4().hex
+            order.order_status = CREATED
+            order.leaves_qty = order.qty
+            self._add(order)
+            self._sent_at[order.order_link_id] = time.monotonic()
+            return True
+
+    def on_create_response(self, order_link_id: str, resp_json: Dict[str, Any]) -> None:
+        """注文作成のレスポンスを反映する。失敗した場合はRejectedとする
+
+        Parameters
+        ----------
+        order_link_id : str
+            registerで割り振った注文ID
+        resp_json : Dict[str, Any]
+            注文作成のレスポンスのJSON
+        """
+        with self._lock:
+            order : Union[Order, None] = self._orders.get(order_link_id)
+            if order is None:  # レスポンスより先にWebSocketで約定を受け取った
+                return None
+            if resp_json['ret_code'] != 0:
+                self._transition(order, REJECTED, 0)
+                return None
+            result : Dict[str, Any] = resp_json['result']
+            order.order_id = result['order_id']
+            self._link_ids[order.order_id] = order_link_id
+
+    def on_stream(self, orders_info: List[Dict[str, Any]]) -> None:
+        """WebSocketで受け取った注文の更新を反映する。
+        約定済みの数量が保持しているものより少ない更新は、順序が入れ替わった古いものとして無視する
+
+        Parameters
+        ----------
+        orders_info : List[Dict[str, Any]]
+            WebSocketで受け取った、この通貨の注文の情報
+        """
+        with self._lock:
+            for order_info in orders_info:
+                order_link_id : str = order_info.get('order_link_id') or self._link_ids.get(order_info['order_id'], '')
+                order : Union[Order, None] = self._orders.get(order_link_id) or self._orders.get(order_info['order_id'])
+                status : str = order_info['order_status']
+                leaves_qty : int = int(order_info['leaves_qty'])
+                if order is None:
+                    if status in open_statuses:  # このインスタンスの外で出された注文
+                        self._add(Order(
+                            side=order_info['side'],
+                            order_type=order_info['order_type'],
+                            qty=int(order_info['qty']),
+                            price=float(order_info['price']),
+                            order_id=order_info['order_id'],
+                            order_link_id=order_link_id or None,
+                            order_status=status,
+                            leaves_qty=leaves_qty))
+                    continue
+                if leaves_qty > order.leaves_qty:
+                    continue
+                if order.order_id is None:
+                    order.order_id = order_info['order_id']
+                    self._link_ids[order.order_id] = self._key_of(order)
+                sent_at : Union[float, None] = self._sent_at.pop(self._key_of(order), None)
+                if sent_at is not None:  # 注文を送信してから、取引所から最初の更新を受け取るまでの時間
+                    metrics.histogram(f'order_ack_seconds_{self.symbol}').observe(time.monotonic() - sent_at)
+                self._transition(order, status, leaves_qty)
+
+    def open_qty(self, side: Union[str, None] = None) -> int:
+        """約定していない数量を返却する
+
+        Parameters
+        ----------
+        side : str | None = constants.BUY | constants.SELL | None
+            集計する向き。Noneの場合は買いを正、売りを負とした合計を返却する
+        """
+        if side is None:
+            return self._open_qty[constants.BUY] - self._open_qty[constants.SELL]
+        return self._open_qty[side]
+
+    def has_open_order(self) -> bool:
+        """約定していない注文があるかを返却する"""
+        return len(self._orders) > 0
+
+    def get(self, order_id: str) -> Union[Order, None]:
+        """注文ID（order_id、order_link_idのどちらでもよい）から、約定していない注文を返却する"""
+        with self._lock:
+            return self._orders.get(order_id) or self._orders.get(self._link_ids.get(order_id, ''))
+
+    def needs_reconcile(self) -> bool:
+        """REST APIで注文の一覧を取得し直す必要があるかを返却する"""
+        if self._is_stale:
+            return True
+        now : float = time.monotonic()
+        return any(now - sent_at > constants.ORDER_CONFIRM_TIMEOUT for sent_at in self._sent_at.values())
+
+    def reconcile(self, active_orders: List[Order]) -> None:
+        """REST APIで取得した約定していない注文の一覧で置き換える。一覧にない注文は約定、もしくはキャンセルされたとみなす
+
+        Parameters
+        ----------
+        active_orders : List[Order]
+            ApiClient.get_active_ordersで取得した注文の一覧
+        """
+        with self._lock:
+            self._orders.clear()
+            self._link_ids.clear()
+            self._open_qty = {constants.BUY: 0, constants.SELL: 0}
+            self._sent_at.clear()
+            for order in active_orders:
+                self._add(order)
+            self._is_stale = False
+        metrics.counter(f'order_reconciles_{self.symbol}').inc()
+
+    def mark_stale(self) -> None:
+        """取引所の状態と食い違った可能性があることを記録する"""
+        self._is_stale = True
+
+    def _key_of(self, order: Order) -> str:
+        return order.order_link_id if order.order_link_id is not None else order.order_id
+
+    def _add(self, order: Order) -> None:
+        """約定していない注文を追加する。呼び出し元でロックを取得すること"""
+        self._orders[self._key_of(order)] = order
+        if order.order_id is not None and order.order_link_id is not None:
+            self._link_ids[order.order_id] = order.order_link_id
+        self._open_qty[order.side] += order.leaves_qty
+
+    def _transition(self, order: Order, status: str, leaves_qty: int) -> None:
+        """注文の状態と約定していない数量を更新し、約定、キャンセルされた注文は削除する。呼び出し元でロックを取得すること"""
+        if status not in open_statuses:
+            leaves_qty = 0
+        self._open_qty[order.side] += leaves_qty - order.leaves_qty
+        order.leaves_qty = leaves_qty
+        order.order_status = status
+        if status in open_statuses:
+            return None
+        key : str = self._key_of(order)
+        self._orders.pop(key, None)
+        self._sent_at.pop(key, None)
+        if order.order_id is not None:
+            self._link_ids.pop(order.order_id, None)
+        logger.info(f'{self.symbol} order {key} is {status}')
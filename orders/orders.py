@@ -1,47 +1,142 @@
-from typing import List, Dict, Union
+from datetime import datetime
+from typing import Any, List, Dict, Tuple, Union
+import math
 import time
 
+import requests
+
 import constants
-from trading_api.trading_api import ApiClient, Order, Position
-from trading_brain.feature_creation import SingletonFeaturesCreator
+from trading_api.trading_api import ApiClient, Order, Position, StopOrder, round_to_tick
+from orders.order_book import StopOrderBook
+from orders.order_manager import OrderManager
+from trading_brain.feature_creation import FeaturesCreator
+from trading_brain.feature_snapshot import FeatureSnapshot
 from trading_brain.algorithms import Algorithms
 from fund_management.fund_management import FundManager
+from profit_and_loss.pl_record import PL
+from profit_and_loss.pl_writer import PLWriter
 from logger import Logger
+from utils.metrics import metrics
 
 logger = Logger()
 
+
+def opposite_side(side: str) -> str:
+    """ポジションを決済する注文の向きを返却する"""
+    return constants.SELL if side == constants.BUY else constants.BUY
+
+
 class Trader:
-    """リアルタイムトレードを行うクラス
+    """1つの通貨のリアルタイムトレードを行うクラス
 
     Attributes
     ----------
     api_client : ApiClient
         bybitAPIラッパーインスタンス
-    features_creator : SingletonFeaturesCreator
+    features_creator : FeaturesCreator
         特徴量生成インスタンス
+    symbol : str
+        トレードする通貨。features_creatorの通貨と同じ
     algorithms : Algorithms
         注文を判断するインスタンス
     fund_manager : FundManager
         資産管理を行うインスタンス
+    stop_order_book : StopOrderBook
+        取引所に置いている損切りの逆指値注文
+    order_manager : OrderManager
+        出した注文の状態。約定していない数量の参照と、重複した注文の検知に用いる
+    latest_position : Position | None
+        WebSocketで最後に受け取ったポジション情報
+    pl_writer : PLWriter | None
+        ポジションか残高が変わる度に損益を記録するインスタンス。Noneの場合は記録しない
     """
-    def __init__(self) -> None:
-        self.api_client = ApiClient()
-        self.features_creator = SingletonFeaturesCreator()
-        self.algorithms = Algorithms()
-        self.fund_manager = FundManager()
+    def __init__(
+            self,
+            api_client: ApiClient,
+            features_creator: FeaturesCreator,
+            pl_writer: Union[PLWriter, None] = None) -> None:
+        self.api_client : ApiClient = api_client
+        self.features_creator : FeaturesCreator = features_creator
+        self.symbol : str = features_creator.symbol
+        self.algorithms : Algorithms = Algorithms(api_client=api_client, symbol=self.symbol)
+        self.fund_manager : FundManager = FundManager(api_client=api_client, features_creator=features_creator)
+        self.stop_order_book : StopOrderBook = StopOrderBook(symbol=self.symbol)
+        self.order_manager : OrderManager = OrderManager(symbol=self.symbol)
+        self.latest_position : Union[Position, None] = None
+        self.pl_writer : Union[PLWriter, None] = pl_writer
+        self._last_pl_key : Union[Tuple[str, int, float], None] = None  # 最後に記録した(side, size, 残高)
 
     def trade(self):
         """リアルタイムトレードを行う"""
+        last_version : int = 0
         while True:
-            while not self.features_creator.has_updated:
-                time.sleep(0.5)
-            self.features_creator.has_updated = False
-            signal, has_position  = self.algorithms.send_trading_signal()
+            # 特徴量が更新されるまで待機し、更新されたスナップショットを一度だけ処理する
+            snapshot : FeatureSnapshot = self.features_creator.channel.wait_for_next(last_version)
+            last_version = snapshot.version
+            self.trade_once(snapshot)
+
+    def trade_once(self, snapshot: FeatureSnapshot) -> None:
+        """1つのスナップショットについて、売買の判断と注文を行う。
+        tradeから呼ばれるほか、simulator.replayでは足を流す度に同じスレッドから直接呼ぶ
+
+        Parameters
+        ----------
+        snapshot : FeatureSnapshot
+            判断に用いる特徴量のスナップショット
+        """
+        with metrics.span(f'trade_cycle_seconds_{self.symbol}'):
+            self.api_client.begin_cycle(self.symbol)  # この判断の間は同じポジション情報を用いる
+            self.fund_manager.on_snapshot(snapshot)  # 現在価格とATRを更新する
+            if self.order_manager.needs_reconcile():  # 注文の更新を取りこぼした可能性がある場合のみ
+                self.order_manager.reconcile(self.api_client.get_active_orders(self.symbol))
+            signal, has_position  = self.algorithms.send_trading_signal(snapshot=snapshot)
+            metrics.histogram(f'candle_to_decision_seconds_{self.symbol}').observe(time.perf_counter() - snapshot.received_at)
             if signal is not None and has_position:
                 self._settle_position()  # ポジションを決済
             if signal is not None and not has_position:
                 self._create_order(signal=signal)  # ポジションを作成
-            self._stop_position()  # 損切りの判断
+            with metrics.span(f'protect_position_seconds_{self.symbol}'):
+                self._protect_position()  # 損切りの逆指値注文をポジションに合わせる
+
+    def on_position(self, position: Position) -> None:
+        """WebSocketでポジションの更新を受け取る"""
+        self.latest_position = position
+        self.api_client.account_state_cache.set_position(self.symbol, position)
+        self.fund_manager.on_position(position)
+        self._record_pl(position)
+        logger.info(f'{self.symbol} position is updated: {position}')
+
+    def on_order(self, orders_info: List[Dict[str, Any]]) -> None:
+        """WebSocketで注文の更新を受け取る"""
+        self.order_manager.on_stream(orders_info)
+
+    def on_stop_order(self, stop_orders_info: List[Dict[str, Any]]) -> None:
+        """WebSocketで逆指値注文の更新を受け取る"""
+        self.stop_order_book.on_stream(stop_orders_info)
+
+    def on_reconnect(self) -> None:
+        """WebSocketが再接続した際に呼ばれる。切断中の注文の更新を取りこぼした可能性があるため、次の判断の前に取り直す"""
+        self.stop_order_book.mark_stale()
+        self.order_manager.mark_stale()
+
+    def _record_pl(self, position: Position) -> None:
+        """ポジションか残高が前回の記録から変わっている場合に、損益を書き込みのキューに追加する。書き込みは待たない"""
+        if self.pl_writer is None or self.fund_manager.wallet_balance is None:
+            return None
+        pl_key : Tuple[str, int, float] = (position.side, position.size, self.fund_manager.wallet_balance)
+        if pl_key == self._last_pl_key:
+            return None
+        self._last_pl_key = pl_key
+        self.pl_writer.put(PL(timestamp=datetime.now(), equity=self.fund_manager.wallet_balance, side=position.side))
+
+    def _send_order(self, order: Order) -> bool:
+        """注文をorder_managerに登録してから出す。同じ向きの約定していない注文がある場合は出さずにFalseを返却する"""
+        if not self.order_manager.register(order):
+            return False
+        with metrics.span(f'order_send_seconds_{self.symbol}'):
+            resp : requests.Response = self.api_client.create_order(symbol=self.symbol, order=order)
+        self.order_manager.on_create_response(order.order_link_id, resp.json())
+        return True
 
     def _create_order(self, signal: str) -> None:
         """注文を出す
@@ -57,13 +152,14 @@ class Trader:
             order_type=constants.MARKET,
             qty=qty,
             price=None)
-        self.api_client.create_order(order=order)
-        logger.info('order is created')
+        if not self._send_order(order):
+            return None
+        logger.info(f'{self.symbol} order is created')
         logger.info(f'{order}')
 
     def _settle_position(self) -> None:
         """現在所有しているポジションを決済する"""
-        now_position : Position = self.api_client.get_position()
+        now_position : Position = self.api_client.get_position(self.symbol)
         side : str = now_position.side
         size : int = now_position.size
         if side == constants.NONE:  # ポジションを所持していない時
@@ -77,29 +173,94 @@ class Trader:
             order_type=constants.MARKET,
             qty=size,
             price=None)
-        self.api_client.create_order(order=order)  # ポジションの決済を行う
-        logger.info('position is settled')
+        if not self._send_order(order):  # ポジションの決済を行う
+            return None
+        logger.info(f'{self.symbol} position is settled')
         logger.info(f'{order}')
 
-    def _stop_position(self) -> None:
-        now_position : Position = self.api_client.get_position()
-        side : str = now_position.side
-        size : int = now_position.size
-        if side == constants.NONE:
+    def _protect_position(self) -> None:
+        """取引所に置いている損切りの逆指値注文を、現在のポジションに合わせる
+
+        ポジションを持った直後に逆指値注文を置き、以降はATRの変化に合わせて注文を置き直さずに変更するため、
+        損切りは判断の周期を待たずに取引所で行われる。
+        既に損切りの価格を超えている場合は、逆指値注文を置けないため成行注文で決済する
+        """
+        now_position : Position = self.api_client.get_position(self.symbol)
+        self.fund_manager.on_position(now_position)
+        self._record_pl(now_position)
+        if self.stop_order_book.needs_reconcile:
+            self.stop_order_book.reset(self.api_client.get_active_stop_orders(self.symbol))
+        if now_position.side == constants.NONE:
+            self._cancel_stop_orders()  # 決済済み、もしくはトリガーされたポジションの残り
             return None
-        should_stop_position : bool = self.fund_manager.decide_if_stop_position()
-        if not should_stop_position:
+        if self.fund_manager.decide_if_stop_position(now_position):
+            self._stop_position(now_position)
             return None
-        # 損切りを行う
-        if side == constants.BUY:
-            side = constants.SELL
-        elif side == constants.SELL:
-            side = constants.BUY
-        order : Order = Order(
+        stop_px : float = self.fund_manager.stop_price(now_position)
+        if math.isnan(stop_px):  # ATRが求まっていない
+            return None
+        stop_px = round_to_tick(self.symbol, stop_px)
+        stop_side : str = opposite_side(now_position.side)
+        stop_order : Union[StopOrder, None] = self.stop_order_book.get()
+        if stop_order is not None and (stop_order.side != stop_side or len(self.stop_order_book) > 1):
+            if not self._cancel_stop_orders():  # 反対のポジションのもの、もしくは重複したもの
+                return None  # 残っている可能性があるため、照合し直した次の周期で置き直す
+            stop_order = None
+        if stop_order is None:
+            self._create_stop_order(stop_side, now_position.size, stop_px)
+            return None
+        moves_enough : bool = abs(stop_px - stop_order.stop_px) >= self.fund_manager.ATR * constants.STOP_REPLACE_RATE
+        if stop_order.qty != now_position.size or moves_enough:
+            self._replace_stop_order(stop_order, now_position.size, stop_px)
+
+    def _create_stop_order(self, side: str, qty: int, stop_px: float) -> None:
+        """損切りの逆指値注文を出す"""
+        stop_order : Union[StopOrder, None] = self.api_client.create_stop_order(
+            symbol=self.symbol,
             side=side,
+            qty=qty,
+            stop_px=stop_px,
+            base_price=self.fund_manager.now_price)
+        if stop_order is None:
+            self.stop_order_book.mark_stale()
+            return None
+        self.stop_order_book.add(stop_order)
+        logger.info(f'{self.symbol} stop order is created: {stop_order}')
+
+    def _replace_stop_order(self, stop_order: StopOrder, qty: int, stop_px: float) -> None:
+        """損切りの逆指値注文の数量とトリガー価格を変更する"""
+        succeeded : bool = self.api_client.replace_stop_order(
+            symbol=self.symbol,
+            stop_order_id=stop_order.stop_order_id,
+            qty=qty,
+            stop_px=stop_px)
+        if not succeeded:  # 既にトリガー、キャンセルされた可能性がある
+            self.stop_order_book.mark_stale()
+            return None
+        self.stop_order_book.update(stop_order.stop_order_id, qty=qty, stop_px=stop_px)
+        logger.info(f'{self.symbol} stop order is replaced: {stop_order}')
+
+    def _cancel_stop_orders(self) -> bool:
+        """全ての損切りの逆指値注文をキャンセルし、成功した場合（キャンセルする注文がない場合を含む）はTrueを返却する。
+        失敗した場合は注文が残っている可能性があるため、次の周期で取引所の注文と照合し直す
+        """
+        if len(self.stop_order_book) == 0:
+            return True
+        if not self.api_client.cancel_all_stop_orders(self.symbol):
+            self.stop_order_book.mark_stale()
+            return False
+        self.stop_order_book.clear()
+        return True
+
+    def _stop_position(self, now_position: Position) -> None:
+        """成行注文で損切りを行う"""
+        order : Order = Order(
+            side=opposite_side(now_position.side),
             order_type=constants.MARKET,
-            qty=size,
+            qty=now_position.size,
             price=None)
-        self.api_client.create_order(order=order)  # ポジションの決済を行う
-        logger.info('position is stopped')
+        if not self._send_order(order):  # ポジションの決済を行う
+            return None
+        self._cancel_stop_orders()
+        logger.info(f'{self.symbol} position is stopped')
         logger.info(f'{order}')
@@ -1,4 +1 @@
-from profit_and_loss.base_db import init_db
-
-# profit_and_lossがインポートされた時にinit_dbを呼び出す
-init_db()
\ No newline at end of file
+# データベースはインポート時には作成せず、最初に使用する時にbase_db.get_engineで作成する
@@ -1,6 +1,8 @@
 from contextlib import contextmanager
+from typing import Union
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.orm import scoped_session
@@ -11,12 +13,54 @@ from logger import Logger
 logger = Logger()
 
 Base = declarative_base()
-engine = create_engine(f'sqlite:///{constants.db_name}?check_same_thread=False')
-Session = scoped_session(sessionmaker(bind=engine, expire_on_commit=False))
+Session = scoped_session(sessionmaker(expire_on_commit=False))
+_engine : Union[Engine, None] = None
+
+
+def configure(db_name: str) -> None:
+    """接続先のデータベースを設定し、テーブルを作成する。既に接続している場合は切り替える
+    （テストで一時フォルダのデータベースを用いる場合など）
+
+    Parameters
+    ----------
+    db_name : str
+        SQLiteのデータベースのパス
+    """
+    global _engine
+    if _engine is not None:
+        Session.remove()
+        _engine.dispose()
+    _engine = create_engine(f'sqlite:///{db_name}?check_same_thread=False')
+    event.listen(_engine, 'connect', set_sqlite_pragmas)
+    Session.configure(bind=_engine)
+    init_db()
+
+
+def get_engine() -> Engine:
+    """データベースのエンジンを返却する。インポートしただけではファイルを作らないよう、
+    初めて呼ばれた時にconstants.db_nameへ接続する
+    """
+    if _engine is None:
+        configure(constants.db_name)
+    return _engine
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """接続ごとにSQLiteのpragmaを設定する。
+    WALモードでは書き込み中も読み込みを妨げず、synchronous=NORMALによりコミットごとのfsyncを省く
+    （fsyncはチェックポイント時のみ行うため、電源断では直前のコミットを失う可能性があるが、データベースは壊れない）
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.close()
 
 
 @contextmanager
 def session_scope():
+    get_engine()
     session = Session()
     try:
         yield session
@@ -31,4 +75,5 @@ def session_scope():
 
 def init_db():
     import profit_and_loss.pl_record
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    import profit_and_loss.pl_analytics
+    Base.metadata.create_all(bind=get_engine())
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""起動ごとに作成していた損益のデータベース（bybit_pl_{timestamp}.sql）を、1つのデータベース（constants.db_name）に取り込む
+
+取り込んだ後に集計を作り直す。同じ時刻の行が既にある場合は取り込まないため、何度実行してもよい。
+元のファイルは削除しない
+
+リポジトリのルートで以下のように実行する
+    python -m profit_and_loss.importer [取り込むファイル ...]
+"""
+from datetime import datetime
+from typing import Iterator, List
+import glob
+import os
+import sqlite3
+import sys
+
+import constants
+from profit_and_loss.pl_record import PL, ProfitAndLoss
+from logger import Logger
+
+logger = Logger()
+
+batch_size = 5000
+
+
+def read_pls(path: str) -> Iterator[List[PL]]:
+    """損益のデータベースを読み取り専用で開き、batch_size行ずつ返却する
+
+    Parameters
+    ----------
+    path : str
+        取り込むデータベースのパス
+
+    Yields
+    ------
+    List[PL]
+        読み込んだ損益
+    """
+    connection : sqlite3.Connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        cursor : sqlite3.Cursor = connection.execute('SELECT timestamp, equity, side FROM profit_and_loss ORDER BY timestamp')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return None
+            # SQLAlchemyはDateTimeを'YYYY-MM-DD HH:MM:SS.ffffff'の文字列として保存する
+            yield [PL(timestamp=datetime.fromisoformat(timestamp), equity=equity, side=side) for timestamp, equity, side in rows]
+    finally:
+        connection.close()
+
+
+def import_pl_files(paths: List[str]) -> int:
+    """損益のデータベースを取り込み、集計を作り直す
+
+    Parameters
+    ----------
+    paths : List[str]
+        取り込むデータベースのパス。constants.db_name自身は除く
+
+    Returns
+    -------
+    int
+        読み込んだ行数（既にあったため取り込まなかった行も含む）
+    """
+    num_rows : int = 0
+    for path in paths:
+        if os.path.abspath(path) == os.path.abspath(constants.db_name):
+            continue
+        try:
+            for pls in read_pls(path):
+                ProfitAndLoss.bulk_insert(pls, updates_analytics=False)
+                num_rows += len(pls)
+        except sqlite3.DatabaseError as e:  # 損益のテーブルを持たないファイルなど
+            logger.error(f'failed to import {path}: {e}', exc_info=False)
+            continue
+        logger.info(f'imported {path}')
+    ProfitAndLoss.rebuild_analytics()
+    return num_rows
+
+
+if __name__ == '__main__':
+    pl_paths : List[str] = sys.argv[1:] or sorted(glob.glob(constants.legacy_db_name_pattern))
+    print(f'{import_pl_files(pl_paths)} rows in {len(pl_paths)} files are imported into {constants.db_name}')
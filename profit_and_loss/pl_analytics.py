@@ -0,0 +1,134 @@
+from datetime import date, datetime
+from typing import Dict, List, Union
+
+from sqlalchemy import Column, Date, DateTime, Float, Integer
+
+from profit_and_loss.base_db import Base, session_scope
+
+
+class EquityStats(Base):
+    """損益の全期間の集計。1行（id=1）のみを持ち、損益を挿入する度に同じトランザクションで更新する
+
+    Attributes
+    ----------
+    last_timestamp : datetime | None
+        最後に集計した損益の時刻
+    last_equity : float | None
+        最後の評価額
+    peak_equity : float | None
+        評価額の最大値
+    max_drawdown : float
+        最大ドローダウン（評価額の最大値からの下落率の最大値）
+    num_rows : int
+        集計した損益の行数
+    """
+    __tablename__ = 'equity_stats'
+    id = Column(Integer, primary_key=True)
+    last_timestamp = Column(DateTime, nullable=True)
+    last_equity = Column(Float, nullable=True)
+    peak_equity = Column(Float, nullable=True)
+    max_drawdown = Column(Float, nullable=False, default=0.0)
+    num_rows = Column(Integer, nullable=False, default=0)
+
+
+class DailyPL(Base):
+    """日ごとの損益の集計
+
+    Attributes
+    ----------
+    date : date
+        日付
+    open_equity : float
+        その日の最初の評価額。前日以前の損益がある場合は、その最後の評価額
+    close_equity : float
+        その日の最後の評価額
+    min_equity : float
+        その日の評価額の最小値
+    max_equity : float
+        その日の評価額の最大値
+    num_rows : int
+        その日の損益の行数
+    pnl : float
+        その日の損益（close_equity - open_equity）
+    """
+    __tablename__ = 'daily_pl'
+    date = Column(Date, primary_key=True)
+    open_equity = Column(Float, nullable=False)
+    close_equity = Column(Float, nullable=False)
+    min_equity = Column(Float, nullable=False)
+    max_equity = Column(Float, nullable=False)
+    num_rows = Column(Integer, nullable=False)
+
+    @property
+    def pnl(self) -> float:
+        return self.close_equity - self.open_equity
+
+
+class EquityAccumulator:
+    """損益を時刻順に1行ずつ受け取り、EquityStatsとDailyPLを逐次的に更新するクラス。
+    挿入時の差分更新と、全体の再集計の両方で用いる
+
+    Attributes
+    ----------
+    stats : EquityStats
+        更新する全期間の集計
+    daily_pls : Dict[date, DailyPL]
+        更新する日ごとの集計。まだ無い日付の集計は作成して追加する
+    new_daily_pls : List[DailyPL]
+        作成した日ごとの集計。呼び出し元でセッションに追加する
+    """
+    def __init__(self, stats: EquityStats, daily_pls: Dict[date, DailyPL]) -> None:
+        self.stats : EquityStats = stats
+        self.daily_pls : Dict[date, DailyPL] = daily_pls
+        self.new_daily_pls : List[DailyPL] = []
+
+    def add(self, timestamp: datetime, equity: float) -> None:
+        """損益を1行反映する。last_timestampより後の時刻のみを、時刻順に渡すこと"""
+        stats : EquityStats = self.stats
+        if stats.peak_equity is None or equity > stats.peak_equity:
+            stats.peak_equity = equity
+        if stats.peak_equity > 0:
+            stats.max_drawdown = max(stats.max_drawdown or 0.0, (stats.peak_equity - equity) / stats.peak_equity)
+        daily_pl : Union[DailyPL, None] = self.daily_pls.get(timestamp.date())
+        if daily_pl is None:
+            daily_pl = DailyPL(
+                date=timestamp.date(),
+                open_equity=stats.last_equity if stats.last_equity is not None else equity,
+                close_equity=equity,
+                min_equity=equity,
+                max_equity=equity,
+                num_rows=0)
+            self.daily_pls[daily_pl.date] = daily_pl
+            self.new_daily_pls.append(daily_pl)
+        daily_pl.close_equity = equity
+        daily_pl.min_equity = min(daily_pl.min_equity, equity)
+        daily_pl.max_equity = max(daily_pl.max_equity, equity)
+        daily_pl.num_rows += 1
+        stats.last_timestamp = timestamp
+        stats.last_equity = equity
+        stats.num_rows = (stats.num_rows or 0) + 1
+
+
+def get_equity_stats() -> Union[EquityStats, None]:
+    """全期間の集計を返却する。損益がまだ無い場合はNone"""
+    with session_scope() as session:
+        return session.query(EquityStats).get(1)
+
+
+def get_daily_pls(start_date: Union[date, None] = None, end_date: Union[date, None] = None) -> List[DailyPL]:
+    """日ごとの集計を日付順に返却する
+
+    Parameters
+    ----------
+    start_date : date | None
+        この日付以降の集計を返却する。Noneの場合は最初から
+    end_date : date | None
+        この日付より前の集計を返却する。Noneの場合は最後まで
+    """
+    with session_scope() as session:
+        query = session.query(DailyPL)
+        if start_date is not None:
+            query = query.filter(DailyPL.date >= start_date)
+        if end_date is not None:
+            query = query.filter(DailyPL.date < end_date)
+        return query.order_by(DailyPL.date).all()
@@ -1,10 +1,12 @@
-from datetime import datetime
-from typing import Union
+from datetime import date, datetime
+from typing import Dict, Iterator, List, Union
 
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from sqlalchemy import Column, DateTime, String, Float
 
 from profit_and_loss.base_db import Base, session_scope
+from profit_and_loss.pl_analytics import DailyPL, EquityAccumulator, EquityStats
 from logger import Logger
 
 logger = Logger()
@@ -22,6 +24,12 @@ class PL:
 
 
 class ProfitAndLoss(Base):
+    """損益を1行ずつ保存するテーブル。timestampは主キーのため索引があり、範囲の検索は索引で行う
+
+    行を挿入する度に、同じトランザクションでEquityStatsとDailyPL（pl_analytics）を差分だけ更新するため、
+    評価額の最大値、最大ドローダウン、日ごとの損益はテーブル全体を走査せずに参照できる。
+    最後の行より前の時刻の行を挿入した場合や、行を更新・削除した場合は、集計を全体から作り直す
+    """
     __tablename__ = 'profit_and_loss'
     timestamp = Column(DateTime, primary_key=True, nullable=False)
     equity = Column(Float, nullable=False)
@@ -30,13 +38,33 @@ class ProfitAndLoss(Base):
     # CRUD処理
     @classmethod
     def insert(cls, pl: PL) -> None:
-        pl = cls(**pl.__dict__)
+        row = cls(**pl.__dict__)
         try:
             with session_scope() as session:
-                session.add(pl)
+                session.add(row)
+                session.flush()  # 重複した行の場合は、集計を更新する前にIntegrityErrorとする
+                cls._update_analytics(session, [pl])
         except IntegrityError as e:
             logger.error(e)
 
+    @classmethod
+    def bulk_insert(cls, pls: List[PL], updates_analytics: bool = True) -> None:
+        """複数の損益を1つのトランザクションでまとめて挿入する。同じtimestampの行が既にある場合は、その行のみ挿入しない
+
+        Parameters
+        ----------
+        pls : List[PL]
+            挿入する損益
+        updates_analytics : bool
+            集計を更新する場合はTrue。まとめて取り込んだ後にrebuild_analyticsを呼ぶ場合はFalseとする
+        """
+        if not pls:
+            return None
+        with session_scope() as session:
+            session.execute(cls.__table__.insert().prefix_with('OR IGNORE'), [pl.__dict__ for pl in pls])
+            if updates_analytics:
+                cls._update_analytics(session, pls)
+
     @classmethod
     def get(cls, time: datetime) -> Union[Base, None]:
         with session_scope() as session:
@@ -45,11 +73,118 @@ class ProfitAndLoss(Base):
                 return None
             return row
 
+    @classmethod
+    def get_range(cls, start: Union[datetime, None] = None, end: Union[datetime, None] = None) -> List[PL]:
+        """指定の時刻の範囲の損益を、時刻順にまとめて返却する
+
+        Parameters
+        ----------
+        start : datetime | None
+            この時刻以降の損益を返却する。Noneの場合は最初から
+        end : datetime | None
+            この時刻より前の損益を返却する。Noneの場合は最後まで
+        """
+        with session_scope() as session:
+            rows = cls._range_query(session, start, end).all()
+        return [PL(timestamp=row.timestamp, equity=row.equity, side=row.side) for row in rows]
+
+    @classmethod
+    def iter_range(
+            cls,
+            start: Union[datetime, None] = None,
+            end: Union[datetime, None] = None,
+            batch_size: int = 1000) -> Iterator[PL]:
+        """指定の時刻の範囲の損益を、時刻順に少しずつ読み込みながら返却する。
+        直前に読み込んだ時刻より後の行を索引で引く（キーセットページング）ため、範囲が大きくても読み込みの度に先頭から走査しない
+
+        Parameters
+        ----------
+        start : datetime | None
+            この時刻以降の損益を返却する。Noneの場合は最初から
+        end : datetime | None
+            この時刻より前の損益を返却する。Noneの場合は最後まで
+        batch_size : int
+            1回に読み込む行数
+
+        Yields
+        ------
+        PL
+            損益
+        """
+        last_timestamp : Union[datetime, None] = None
+        while True:
+            with session_scope() as session:
+                query = cls._range_query(session, start, end)
+                if last_timestamp is not None:
+                    query = query.filter(cls.timestamp > last_timestamp)
+                rows = query.limit(batch_size).all()
+            for row in rows:
+                yield PL(timestamp=row.timestamp, equity=row.equity, side=row.side)
+            if len(rows) < batch_size:
+                return None
+            last_timestamp = rows[-1].timestamp
+
     def update(self) -> None:
         with session_scope() as session:
             session.add(self)
+            session.flush()
+            self._rebuild_analytics(session)
 
     @classmethod
     def delete(cls, time: datetime) -> None:
         with session_scope() as session:
-            session.query(cls).filter(cls.timestamp==time).delete()
\ No newline at end of file
+            session.query(cls).filter(cls.timestamp==time).delete()
+            cls._rebuild_analytics(session)
+
+    @classmethod
+    def rebuild_analytics(cls) -> None:
+        """集計を全ての損益から作り直す"""
+        with session_scope() as session:
+            cls._rebuild_analytics(session)
+
+    @classmethod
+    def _range_query(cls, session: Session, start: Union[datetime, None], end: Union[datetime, None]):
+        query = session.query(cls.timestamp, cls.equity, cls.side)
+        if start is not None:
+            query = query.filter(cls.timestamp >= start)
+        if end is not None:
+            query = query.filter(cls.timestamp < end)
+        return query.order_by(cls.timestamp)
+
+    @classmethod
+    def _update_analytics(cls, session: Session, pls: List[PL]) -> None:
+        """挿入した損益の分だけ集計を更新する。最後に集計した時刻以前の損益を含む場合は、全体から作り直す"""
+        pls = sorted(pls, key=lambda pl: pl.timestamp)
+        stats : Union[EquityStats, None] = session.query(EquityStats).get(1)
+        if stats is None:
+            stats = EquityStats(id=1, max_drawdown=0.0, num_rows=0)
+            session.add(stats)
+        if stats.last_timestamp is not None and pls[0].timestamp <= stats.last_timestamp:
+            cls._rebuild_analytics(session)
+            return None
+        dates : List[date] = sorted({pl.timestamp.date() for pl in pls})
+        daily_pls : Dict[date, DailyPL] = {
+            daily_pl.date: daily_pl for daily_pl in session.query(DailyPL).filter(DailyPL.date.in_(dates))}
+        accumulator : EquityAccumulator = EquityAccumulator(stats, daily_pls)
+        last_timestamp : Union[datetime, None] = None
+        for pl in pls:
+            if pl.timestamp == last_timestamp:  # 同じ時刻の行は、最初の行のみが挿入されている
+                continue
+            accumulator.add(pl.timestamp, pl.equity)
+            last_timestamp = pl.timestamp
+        session.add_all(accumulator.new_daily_pls)
+
+    @classmethod
+    def _rebuild_analytics(cls, session: Session) -> None:
+        """集計を削除し、全ての損益を時刻順に読み込みながら作り直す"""
+        stats : Union[EquityStats, None] = session.query(EquityStats).get(1)
+        if stats is None:
+            stats = EquityStats(id=1)
+            session.add(stats)
+        stats.last_timestamp, stats.last_equity, stats.peak_equity = None, None, None
+        stats.max_drawdown, stats.num_rows = 0.0, 0
+        session.query(DailyPL).delete()
+        accumulator : EquityAccumulator = EquityAccumulator(stats, {})
+        for row in cls._range_query(session, None, None).yield_per(1000):
+            accumulator.add(row.timestamp, row.equity)
+        session.add_all(accumulator.new_daily_pls)
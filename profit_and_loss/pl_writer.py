@@ -0,0 +1,113 @@
+from typing import List
+import queue
+import threading
+import time
+
+import constants
+from profit_and_loss.pl_record import PL, ProfitAndLoss
+from logger import Logger
+from utils.metrics import metrics
+
+logger = Logger()
+
+_close = object()  # 書き込みスレッドに終了を伝えるための番兵
+
+
+class PLWriter:
+    """損益をバックグラウンドのスレッドでまとめてデータベースに書き込むクラス
+
+    putはキューに追加するのみで、書き込み（コミット時の同期）を待たない。
+    書き込みスレッドは、batch_size行が溜まるか、最初の行を受け取ってからflush_interval秒が経つと、
+    それまでの行を1つのトランザクションでまとめて挿入する。
+    キューが一杯の場合は、呼び出し元を待たせずにその行を破棄し、pl_rows_droppedとして記録する
+
+    Attributes
+    ----------
+    batch_size : int
+        1回のトランザクションで書き込む最大の行数
+    flush_interval : float
+        最初の行を受け取ってから書き込むまでに待つ最大の秒数
+
+    Methods
+    -------
+    put -> bool
+        損益を書き込みのキューに追加する
+    flush -> None
+        キューに追加済みの損益が全て書き込まれるまで待機する
+    close -> None
+        キューに追加済みの損益を書き込み、書き込みスレッドを終了する
+    """
+    def __init__(
+            self,
+            max_queue_size: int = constants.PL_QUEUE_MAXSIZE,
+            batch_size: int = constants.PL_BATCH_SIZE,
+            flush_interval: float = constants.PL_FLUSH_INTERVAL) -> None:
+        self.batch_size : int = batch_size
+        self.flush_interval : float = flush_interval
+        self._queue : queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._thread : threading.Thread = threading.Thread(target=self._run, name='pl_writer', daemon=True)
+        self._thread.start()
+
+    def put(self, pl: PL) -> bool:
+        """損益を書き込みのキューに追加する
+
+        Parameters
+        ----------
+        pl : PL
+            書き込む損益
+
+        Returns
+        -------
+        bool
+            追加できた場合はTrue。キューが一杯で破棄した場合はFalse
+        """
+        try:
+            self._queue.put_nowait(pl)
+        except queue.Full:
+            metrics.counter('pl_rows_dropped').inc()
+            logger.warn(f'pl queue is full. dropped: {pl.__dict__}')
+            return False
+        return True
+
+    def flush(self) -> None:
+        """キューに追加済みの損益が全て書き込まれるまで待機する"""
+        self._queue.join()
+
+    def close(self) -> None:
+        """キューに追加済みの損益を書き込み、書き込みスレッドを終了する"""
+        self._queue.put(_close)
+        self._thread.join()
+
+    def _run(self) -> None:
+        is_closed : bool = False
+        while not is_closed:
+            item = self._queue.get()  # 最初の行を受け取るまでは待ち続ける
+            deadline : float = time.monotonic() + self.flush_interval
+            pls : List[PL] = []
+            while True:
+                if item is _close:
+                    is_closed = True
+                    break
+                pls.append(item)
+                remaining_seconds : float = deadline - time.monotonic()
+                if len(pls) >= self.batch_size or remaining_seconds <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining_seconds)
+                except queue.Empty:
+                    break
+            self._write(pls)
+            for _ in range(len(pls) + is_closed):
+                self._queue.task_done()
+
+    def _write(self, pls: List[PL]) -> None:
+        if not pls:
+            return None
+        started_at : float = time.perf_counter()
+        try:
+            ProfitAndLoss.bulk_insert(pls)
+        except Exception:
+            metrics.counter('pl_rows_dropped').inc(len(pls))
+            return None
+        metrics.histogram('pl_write_seconds').observe(time.perf_counter() - started_at)
+        metrics.counter('pl_rows_written').inc(len(pls))
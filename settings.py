@@ -12,4 +12,7 @@ api_secret_key = conf['bybit']['api_secret_key']
 testnet_api_key = conf['bybit']['testnet_api_key']
 tesetnet_api_secret_key = conf['bybit']['tesetnet_api_secret_key']
 
-symbol = conf['bybit']['symbol']
\ No newline at end of file
+symbols = [symbol.strip() for symbol in conf['bybit']['symbol'].split(',')]
+time_intervals = [time_interval.strip() for time_interval in conf['bybit']['time_interval'].split(',')]
+
+use_websocket = bool_from_str(conf['bybit']['use_websocket'])
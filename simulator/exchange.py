@@ -0,0 +1,460 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Union
+import itertools
+import threading
+import time
+
+import constants
+from trading_api.trading_api import OhlcBuffer, Position, parse_position, unit_minutes
+
+ret_code_ok = 0
+ret_code_invalid_params = 10001
+ret_code_order_not_exists = 20001
+
+# 注文の状態のうち、まだ約定、キャンセルされていないもの
+open_order_statuses = ('Created', 'New', 'PartiallyFilled')
+
+
+class SimulatedResponse:
+    """requests.Responseの代わりに返却するクラス。ApiClientが参照するjsonとheadersのみを持つ"""
+    def __init__(self, body: Dict[str, Any]) -> None:
+        self._body : Dict[str, Any] = body
+        self.headers : Dict[str, str] = {}
+        self.status_code : int = 200
+
+    def json(self) -> Dict[str, Any]:
+        return self._body
+
+
+class SimulatedExchange:
+    """pybybit.APIの代わりにApiClientへ渡し、1つの通貨のインバース契約を再現する取引所
+
+    ApiClientが用いるエンドポイントを、pybybitと同じrest.inverse.{メソッド名}で呼び出せる。
+    時刻は与えたローソク足の1本単位で進み、advanceを呼ぶまで進まないため、同じ入力からは常に同じ約定が得られる。
+    約定は以下のように決める
+        * 成行注文: fill_delay_bars=0の場合は現在の足の終値で即座に、それ以外はその本数後の足の始値で約定する
+        * 指値注文: 足の高値・安値が指値に達した時に、指値（始値の方が有利な場合は始値）で約定する
+        * 逆指値注文: 足の高値・安値がトリガー価格に達した時に、トリガー価格（窓を開けた場合は始値）で成行注文を発注する
+    約定やポジションの変化は、subscribeで登録した関数にWebSocketと同じ形式で通知する
+
+    Attributes
+    ----------
+    rest : SimpleNamespace
+        pybybit.APIと同様に、rest.inverse.{メソッド名}でエンドポイントを呼び出すための属性
+    symbol : str
+        通貨 e.g.) BTCUSD
+    time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
+        ローソク足の単位時間
+    ohlcs : OhlcBuffer
+        再現するローソク足。古い順に並ぶ
+    cursor : int
+        現在の足の位置。これより後の足は、まだ存在しないものとして扱う
+    latency : float
+        1回のリクエストの往復にかかる秒数。実時間で待機する
+    fill_delay_bars : int
+        成行注文が約定するまでの足の本数
+    taker_fee_rate : float
+        約定時の手数料率
+    leverage : float
+        レバレッジの値
+    wallet_balance : float
+        残高（coin建て）。約定時に実現損益と手数料を反映する
+    fills : List[Dict[str, Any]]
+        約定の履歴
+    order_received_at : List[float]
+        注文（逆指値注文を除く）を受け付けた時刻（time.perf_counter）の履歴。遅延の計測に用いる
+
+    Methods
+    -------
+    clock -> float
+        現在の足の終了時刻のタイムスタンプを返却する。ApiClientのclockに指定する
+    current_ohlc -> OhlcBuffer
+        現在の足を返却する
+    advance -> bool
+        時刻を1本進め、その足で約定する注文を約定させる
+    subscribe -> None
+        注文、逆指値注文、ポジションの更新を受け取る関数を登録する
+    """
+    def __init__(
+            self,
+            symbol: str,
+            ohlcs: OhlcBuffer,
+            time_interval: str = constants.DURATION_1M,
+            cursor: int = 0,
+            latency: float = 0.0,
+            fill_delay_bars: int = 0,
+            taker_fee_rate: float = constants.TAKER_FEE_RATE,
+            leverage: float = 1.0,
+            wallet_balance: float = 1.0) -> None:
+        self.rest : SimpleNamespace = SimpleNamespace(inverse=self)
+        self.symbol : str = symbol
+        self.time_interval : str = time_interval
+        self.ohlcs : OhlcBuffer = ohlcs
+        self.cursor : int = cursor
+        self.latency : float = latency
+        self.fill_delay_bars : int = fill_delay_bars
+        self.taker_fee_rate : float = taker_fee_rate
+        self.leverage : float = leverage
+        self.wallet_balance : float = wallet_balance
+        self.fills : List[Dict[str, Any]] = []
+        self.order_received_at : List[float] = []
+        self._unit_seconds : int = unit_minutes[time_interval] * 60
+        self._ids : Iterator = itertools.count(1)  # 注文IDを決定的に割り振る
+        self._orders : Dict[str, Dict[str, Any]] = {}  # order_id -> 約定していない注文
+        self._fill_at : Dict[str, int] = {}  # order_id -> 約定させる足の位置（成行注文）
+        self._stop_orders : Dict[str, Dict[str, Any]] = {}  # stop_order_id -> トリガーされていない逆指値注文
+        self._position_side : str = constants.NONE
+        self._position_size : int = 0
+        self._entry_price : float = 0.0
+        self._on_order : Union[Callable[[List[Dict[str, Any]]], None], None] = None
+        self._on_stop_order : Union[Callable[[List[Dict[str, Any]]], None], None] = None
+        self._on_position : Union[Callable[[Position], None], None] = None
+        self._lock : threading.RLock = threading.RLock()
+
+    def clock(self) -> float:
+        """現在の足の終了時刻のタイムスタンプを返却する。ApiClientのclockに指定する"""
+        return float(self.ohlcs.open_time[self.cursor] + self._unit_seconds)
+
+    def current_ohlc(self) -> OhlcBuffer:
+        """現在の足を、WebSocketで受け取るものと同じ1本のOhlcBufferとして返却する"""
+        ohlc : OhlcBuffer = OhlcBuffer(capacity=1)
+        ohlc.extend(self.ohlcs.open_time[self.cursor:self.cursor + 1], self.ohlcs.values[self.cursor:self.cursor + 1])
+        return ohlc
+
+    def subscribe(
+            self,
+            on_order: Union[Callable[[List[Dict[str, Any]]], None], None] = None,
+            on_stop_order: Union[Callable[[List[Dict[str, Any]]], None], None] = None,
+            on_position: Union[Callable[[Position], None], None] = None) -> None:
+        """注文、逆指値注文、ポジションの更新を受け取る関数を登録する。RealtimeClientの各関数と同じ形式で呼び出す"""
+        self._on_order = on_order
+        self._on_stop_order = on_stop_order
+        self._on_position = on_position
+
+    def advance(self) -> bool:
+        """時刻を1本進め、その足で約定する成行注文、指値注文、逆指値注文を約定させる
+
+        Returns
+        -------
+        bool
+            進めた場合はTrue。最後の足に達している場合はFalse
+        """
+        with self._lock:
+            if self.cursor + 1 >= len(self.ohlcs):
+                return False
+            self.cursor += 1
+            open, high, low, _ = self.ohlcs.values[self.cursor].tolist()
+            for order_id, fill_at in list(self._fill_at.items()):
+                if fill_at <= self.cursor:
+                    self._fill(self._orders[order_id], open)
+            for stop_order in list(self._stop_orders.values()):
+                if stop_order['trigger_direction'] < 0 and low <= stop_order['stop_px']:
+                    self._trigger(stop_order, min(open, stop_order['stop_px']))
+                elif stop_order['trigger_direction'] > 0 and high >= stop_order['stop_px']:
+                    self._trigger(stop_order, max(open, stop_order['stop_px']))
+            for order in list(self._orders.values()):
+                if order['order_type'] != constants.LIMIT:
+                    continue
+                if order['side'] == constants.BUY and low <= order['price']:
+                    self._fill(order, min(open, order['price']))
+                elif order['side'] == constants.SELL and high >= order['price']:
+                    self._fill(order, max(open, order['price']))
+            return True
+
+    # ---- pybybitのrest.inverseと同じ名前のエンドポイント ----
+
+    def public_kline_list(self, symbol: str, interval: str, from_: int, limit: int = 200, **_) -> SimulatedResponse:
+        self._wait()
+        if interval != self.time_interval:
+            return self._error(ret_code_invalid_params, f'interval {interval} is not simulated')
+        with self._lock:
+            open_time = self.ohlcs.open_time[:self.cursor + 1]
+            start : int = int(open_time.searchsorted(from_))
+            end : int = min(start + limit, len(open_time))
+            result : List[Dict[str, Any]] = [
+                {'symbol': symbol, 'interval': interval, 'open_time': int(open_time[i]),
+                 'open': o, 'high': h, 'low': l, 'close': c}
+                for i, (o, h, l, c) in zip(range(start, end), self.ohlcs.values[start:end].tolist())]
+        return self._ok(result)
+
+    def private_wallet_balance(self, coin: str, **_) -> SimulatedResponse:
+        self._wait()
+        with self._lock:
+            position_margin : float = 0.0
+            if self._position_size > 0:
+                position_margin = self._position_size / self._entry_price / self.leverage
+            return self._ok({coin: {
+                'wallet_balance': self.wallet_balance,
+                'available_balance': self.wallet_balance - position_margin}})
+
+    def private_position_list(self, symbol: str, **_) -> SimulatedResponse:
+        self._wait()
+        with self._lock:
+            return self._ok(self._position_info())
+
+    def private_order_list(self, symbol: str, order_status: str = '', **_) -> SimulatedResponse:
+        self._wait()
+        statuses : List[str] = order_status.split(',') if order_status else list(open_order_statuses)
+        with self._lock:
+            data : List[Dict[str, Any]] = [
+                self._public_order(order) for order in self._orders.values() if order['order_status'] in statuses]
+        return self._ok({'data': data})
+
+    def private_order_create(
+            self,
+            symbol: str,
+            side: str,
+            order_type: str,
+            qty: int,
+            price: Union[float, None] = None,
+            order_link_id: str = '',
+            **_) -> SimulatedResponse:
+        self._wait(half=True)  # 往路
+        with self._lock:
+            self.order_received_at.append(time.perf_counter())
+            resp : SimulatedResponse = self._create_order(side, order_type, int(qty), price, order_link_id)
+        self._wait(half=True)  # 復路
+        return resp
+
+    def _create_order(
+            self,
+            side: str,
+            order_type: str,
+            qty: int,
+            price: Union[float, None],
+            order_link_id: str) -> SimulatedResponse:
+        if qty <= 0:
+            return self._error(ret_code_invalid_params, 'qty must be greater than 0')
+        if order_type == constants.LIMIT and price is None:
+            return self._error(ret_code_invalid_params, 'price is required for limit orders')
+        order : Dict[str, Any] = self._new_order(side, order_type, qty, price, order_link_id)
+        resp : SimulatedResponse = self._ok(dict(self._public_order(order), order_status='Created'))
+        self._emit_orders([order])
+        if order_type == constants.MARKET:
+            if self.fill_delay_bars == 0:
+                self._fill(order, self._close())
+            else:
+                self._fill_at[order['order_id']] = self.cursor + self.fill_delay_bars
+        return resp
+
+    def private_order_cancelall(self, symbol: str, **_) -> SimulatedResponse:
+        self._wait()
+        with self._lock:
+            cancelled : List[Dict[str, Any]] = list(self._orders.values())
+            for order in cancelled:
+                order['order_status'] = 'Cancelled'
+                order['leaves_qty'] = 0
+            self._orders.clear()
+            self._fill_at.clear()
+            self._emit_orders(cancelled)
+            return self._ok([self._public_order(order) for order in cancelled])
+
+    def private_stoporder_list(self, symbol: str, stop_order_status: str = 'Untriggered', **_) -> SimulatedResponse:
+        self._wait()
+        with self._lock:
+            data : List[Dict[str, Any]] = [
+                self._public_stop_order(stop_order) for stop_order in self._stop_orders.values()
+                if stop_order_status in ('', stop_order['stop_order_status'])]
+        return self._ok({'data': data})
+
+    def private_stoporder_create(
+            self,
+            symbol: str,
+            side: str,
+            order_type: str,
+            qty: int,
+            stop_px: float,
+            base_price: float,
+            close_on_trigger: bool = False,
+            **_) -> SimulatedResponse:
+        self._wait()
+        with self._lock:
+            trigger_direction : int = -1 if stop_px < base_price else 1
+            if int(qty) <= 0 or (stop_px - self._close()) * trigger_direction <= 0:
+                return self._error(ret_code_invalid_params, 'stop_px is already reached or qty is invalid')
+            stop_order : Dict[str, Any] = {
+                'stop_order_id': self._next_id(),
+                'symbol': self.symbol,
+                'side': side,
+                'order_type': order_type,
+                'qty': int(qty),
+                'stop_px': float(stop_px),
+                'base_price': float(base_price),
+                'trigger_direction': trigger_direction,
+                'close_on_trigger': close_on_trigger,
+                'stop_order_type': constants.STOP,
+                'stop_order_status': 'Untriggered',
+                'created_at': self._now_iso(),
+            }
+            self._stop_orders[stop_order['stop_order_id']] = stop_order
+            self._emit_stop_order(stop_order)
+            return self._ok(self._public_stop_order(stop_order))
+
+    def private_stoporder_replace(
+            self,
+            symbol: str,
+            stop_order_id: str,
+            p_r_qty: Union[int, None] = None,
+            p_r_trigger_price: Union[float, None] = None,
+            **_) -> SimulatedResponse:
+        self._wait()
+        with self._lock:
+            stop_order : Union[Dict[str, Any], None] = self._stop_orders.get(stop_order_id)
+            if stop_order is None:
+                return self._error(ret_code_order_not_exists, 'order not exists or too late to replace')
+            if p_r_trigger_price is not None:
+                if (p_r_trigger_price - self._close()) * stop_order['trigger_direction'] <= 0:
+                    return self._error(ret_code_invalid_params, 'stop_px is already reached')
+                stop_order['stop_px'] = float(p_r_trigger_price)
+            if p_r_qty is not None:
+                stop_order['qty'] = int(p_r_qty)
+            self._emit_stop_order(stop_order)
+            return self._ok({'stop_order_id': stop_order_id})
+
+    def private_stoporder_cancelall(self, symbol: str, **_) -> SimulatedResponse:
+        self._wait()
+        with self._lock:
+            cancelled : List[Dict[str, Any]] = list(self._stop_orders.values())
+            self._stop_orders.clear()
+            for stop_order in cancelled:
+                stop_order['stop_order_status'] = 'Cancelled'
+                self._emit_stop_order(stop_order)
+            return self._ok([{'stop_order_id': stop_order['stop_order_id']} for stop_order in cancelled])
+
+    # ---- 約定の処理 ----
+
+    def _new_order(self, side: str, order_type: str, qty: int, price: Union[float, None], order_link_id: str) -> Dict[str, Any]:
+        now : str = self._now_iso()
+        order : Dict[str, Any] = {
+            'order_id': self._next_id(),
+            'order_link_id': order_link_id,
+            'symbol': self.symbol,
+            'side': side,
+            'order_type': order_type,
+            'qty': qty,
+            'price': float(price) if price is not None else self._close(),
+            'order_status': 'New',
+            'leaves_qty': qty,
+            'cum_exec_qty': 0,
+            'created_at': now,
+            'updated_at': now,
+        }
+        self._orders[order['order_id']] = order
+        return order
+
+    def _trigger(self, stop_order: Dict[str, Any], price: float) -> None:
+        """逆指値注文をトリガーし、成行注文を発注して約定させる"""
+        del self._stop_orders[stop_order['stop_order_id']]
+        qty : int = stop_order['qty']
+        if stop_order['close_on_trigger']:  # ポジションを減らす方向の数量のみ
+            reduces_position : bool = self._position_side not in (constants.NONE, stop_order['side'])
+            qty = min(qty, self._position_size) if reduces_position else 0
+        stop_order['stop_order_status'] = 'Triggered' if qty > 0 else 'Deactivated'
+        self._emit_stop_order(stop_order)
+        if qty == 0:
+            return None
+        order : Dict[str, Any] = self._new_order(stop_order['side'], constants.MARKET, qty, price, '')
+        self._fill(order, price)
+
+    def _fill(self, order: Dict[str, Any], price: float) -> None:
+        """注文を全て約定させ、ポジションと残高に反映する"""
+        qty : int = order['leaves_qty']
+        self._orders.pop(order['order_id'], None)
+        self._fill_at.pop(order['order_id'], None)
+        realized_pnl : float = self._apply_to_position(order['side'], qty, price)
+        fee : float = qty / price * self.taker_fee_rate
+        self.wallet_balance += realized_pnl - fee
+        order.update(order_status='Filled', leaves_qty=0, cum_exec_qty=qty, price=price, updated_at=self._now_iso())
+        self.fills.append({
+            'open_time': int(self.ohlcs.open_time[self.cursor]),
+            'order_id': order['order_id'],
+            'side': order['side'],
+            'qty': qty,
+            'price': price,
+            'realized_pnl': realized_pnl,
+            'fee': fee,
+            'wallet_balance': self.wallet_balance,
+        })
+        self._emit_orders([order])
+        if self._on_position is not None:
+            self._on_position(parse_position(self._position_info()))
+
+    def _apply_to_position(self, side: str, qty: int, price: float) -> float:
+        """約定をポジションに反映し、実現損益（coin建て）を返却する。インバース契約のため、損益は価格の逆数の差で求める"""
+        if self._position_side in (constants.NONE, side):
+            size : int = self._position_size + qty
+            self._entry_price = size / (self._position_size / self._entry_price + qty / price) if self._position_size else price
+            self._position_side, self._position_size = side, size
+            return 0.0
+        closed_qty : int = min(qty, self._position_size)
+        side_sign : int = 1 if self._position_side == constants.BUY else -1
+        realized_pnl : float = side_sign * closed_qty * (1 / self._entry_price - 1 / price)
+        self._position_size -= closed_qty
+        if self._position_size == 0:
+            self._position_side, self._entry_price = constants.NONE, 0.0
+        if qty > closed_qty:  # ドテン
+            self._position_side, self._position_size, self._entry_price = side, qty - closed_qty, price
+        return realized_pnl
+
+    # ---- レスポンスの作成 ----
+
+    def _position_info(self) -> Dict[str, Any]:
+        now : str = self._now_iso()
+        return {
+            'symbol': self.symbol,
+            'side': self._position_side,
+            'size': self._position_size,
+            'entry_price': self._entry_price,
+            'leverage': self.leverage,
+            'liq_price': 0.0,
+            'wallet_balance': self.wallet_balance,
+            'created_at': now,
+            'updated_at': now,
+        }
+
+    def _public_order(self, order: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(order)
+
+    def _public_stop_order(self, stop_order: Dict[str, Any]) -> Dict[str, Any]:
+        public : Dict[str, Any] = {key: value for key, value in stop_order.items() if key != 'trigger_direction'}
+        public['updated_at'] = self._now_iso()
+        return public
+
+    def _emit_orders(self, orders: List[Dict[str, Any]]) -> None:
+        if self._on_order is not None and orders:
+            self._on_order([self._public_order(order) for order in orders])
+
+    def _emit_stop_order(self, stop_order: Dict[str, Any]) -> None:
+        """WebSocketのstop_orderトピックと同じく、IDをorder_id、トリガー価格をtrigger_priceとして通知する"""
+        if self._on_stop_order is None:
+            return None
+        self._on_stop_order([{
+            'order_id': stop_order['stop_order_id'],
+            'symbol': self.symbol,
+            'side': stop_order['side'],
+            'qty': stop_order['qty'],
+            'trigger_price': stop_order['stop_px'],
+            'stop_order_type': stop_order['stop_order_type'],
+            'order_status': stop_order['stop_order_status'],
+        }])
+
+    def _ok(self, result: Any) -> SimulatedResponse:
+        return SimulatedResponse({'ret_code': ret_code_ok, 'ret_msg': 'OK', 'result': result, 'time_now': str(self.clock())})
+
+    def _error(self, ret_code: int, ret_msg: str) -> SimulatedResponse:
+        return SimulatedResponse({'ret_code': ret_code, 'ret_msg': ret_msg, 'result': None, 'time_now': str(self.clock())})
+
+    def _wait(self, half: bool = False) -> None:
+        """通信の遅延を再現する。注文は受け付けた時刻を記録するため、往路と復路に分けて待機する"""
+        if self.latency > 0:
+            time.sleep(self.latency / 2 if half else self.latency)
+
+    def _close(self) -> float:
+        return float(self.ohlcs.values[self.cursor, 3])
+
+    def _next_id(self) -> str:
+        return f'{next(self._ids):08d}'
+
+    def _now_iso(self) -> str:
+        return datetime.fromtimestamp(self.clock(), timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
@@ -0,0 +1,203 @@
+from typing import Any, Dict, List, Union
+import base64
+import hashlib
+import json
+import socket
+import struct
+import threading
+
+from logger import Logger
+
+logger = Logger()
+
+# RFC 6455のハンドシェイクでSec-WebSocket-Keyに連結する固定の文字列
+websocket_guid = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OPCODE_TEXT = 0x1
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+class FakeRealtimeServer:
+    """記録したbybitのWebSocketのメッセージを再生する、ローカルのWebSocketサーバー。
+    RealtimeClientのendpointに指定し、実際の取引所に接続せずに受信の経路を確かめるために用いる
+
+    接続ごとにsessionsの先頭から順に1つを割り当て、クライアントからsubscribeを受け取った後にそのメッセージを順に送る。
+    最後のセッション以外は送り終えた後に接続を閉じるため、クライアントの再接続を再現できる。
+    最後のセッションはstopが呼ばれるまで接続を保つ
+
+    Attributes
+    ----------
+    sessions : List[List[Dict[str, Any]]]
+        接続ごとに送るメッセージ
+    received : List[Dict[str, Any]]
+        クライアントから受け取ったメッセージ（auth, subscribe, pingなど）
+    num_connections : int
+        これまでに受け付けた接続の数
+    url : str
+        接続先のURL e.g.) ws://127.0.0.1:50000/realtime
+
+    Methods
+    -------
+    start -> None
+        別のスレッドで待ち受けを開始する
+    stop -> None
+        待ち受けを停止し、接続を閉じる
+    wait_for_sessions -> bool
+        全てのセッションのメッセージを送り終えるまで待機する
+    """
+    def __init__(self, sessions: List[List[Dict[str, Any]]], host: str = '127.0.0.1', port: int = 0) -> None:
+        self.sessions : List[List[Dict[str, Any]]] = sessions
+        self.received : List[Dict[str, Any]] = []
+        self.num_connections : int = 0
+        self._listener : socket.socket = socket.create_server((host, port))
+        self._connections : List[socket.socket] = []
+        self._is_running : bool = False
+        self._finished : threading.Event = threading.Event()
+        self._lock : threading.Lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'FakeRealtimeServer':
+        """{"sessions": [[メッセージ, ...], ...]}の形式で記録したJSONファイルから作成する"""
+        with open(path, encoding='utf-8') as f:
+            return cls(sessions=json.load(f)['sessions'], **kwargs)
+
+    @property
+    def url(self) -> str:
+        host, port = self._listener.getsockname()[:2]
+        return f'ws://{host}:{port}/realtime'
+
+    def start(self) -> None:
+        """別のスレッドで待ち受けを開始する"""
+        self._is_running = True
+        threading.Thread(target=self._accept, name='fake_realtime_server', daemon=True).start()
+
+    def stop(self) -> None:
+        """待ち受けを停止し、接続を閉じる"""
+        self._is_running = False
+        self._listener.close()
+        with self._lock:
+            for connection in self._connections:
+                self._close(connection)
+
+    def wait_for_sessions(self, timeout: Union[float, None] = None) -> bool:
+        """全てのセッションのメッセージを送り終えるまで待機する。timeoutまでに送り終えた場合はTrue"""
+        return self._finished.wait(timeout)
+
+    def _accept(self) -> None:
+        while self._is_running:
+            try:
+                connection, _ = self._listener.accept()
+            except OSError:  # stopで閉じられた
+                return None
+            with self._lock:
+                session_index : int = min(self.num_connections, len(self.sessions) - 1)
+                self.num_connections += 1
+                self._connections.append(connection)
+            threading.Thread(target=self._serve, args=(connection, session_index), daemon=True).start()
+
+    def _serve(self, connection: socket.socket, session_index: int) -> None:
+        is_closing : bool = False  # 切断を再現するためにcloseを送り、クライアントのcloseを待っている
+        try:
+            self._handshake(connection)
+            while self._is_running:
+                opcode, payload = self._recv_frame(connection)
+                if opcode == OPCODE_CLOSE:
+                    break
+                if is_closing:
+                    continue
+                if opcode == OPCODE_PING:
+                    self._send_frame(connection, OPCODE_PONG, payload)
+                    continue
+                if opcode != OPCODE_TEXT:
+                    continue
+                msg : Dict[str, Any] = json.loads(payload.decode())
+                with self._lock:
+                    self.received.append(msg)
+                if msg.get('op') == 'ping':
+                    self._send_text(connection, {'success': True, 'ret_msg': 'pong', 'request': msg})
+                elif msg.get('op') == 'auth':
+                    self._send_text(connection, {'success': True, 'ret_msg': '', 'request': msg})
+                elif msg.get('op') == 'subscribe':
+                    self._send_text(connection, {'success': True, 'ret_msg': '', 'request': msg})
+                    for message in self.sessions[session_index]:
+                        self._send_text(connection, message)
+                    if session_index == len(self.sessions) - 1:
+                        self._finished.set()
+                    else:
+                        # 切断を再現する。未読のメッセージを残して閉じるとRSTになり、クライアントが受信済みのメッセージを
+                        # 読む前に捨てられることがあるため、closeを送った後はクライアントのcloseを受け取るまで読み続ける
+                        self._send_frame(connection, OPCODE_CLOSE, b'')
+                        is_closing = True
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            if is_closing:
+                connection.close()
+            else:
+                self._close(connection)
+
+    def _handshake(self, connection: socket.socket) -> None:
+        request : bytes = b''
+        while b'\r\n\r\n' not in request:
+            chunk : bytes = connection.recv(4096)
+            if not chunk:
+                raise ConnectionError('connection is closed during handshake')
+            request += chunk
+        headers : Dict[str, str] = {}
+        for line in request.decode().split('\r\n')[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        accept : str = base64.b64encode(
+            hashlib.sha1((headers['sec-websocket-key'] + websocket_guid).encode()).digest()).decode()
+        connection.sendall((
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n').encode())
+
+    def _recv_exactly(self, connection: socket.socket, size: int) -> bytes:
+        data : bytes = b''
+        while len(data) < size:
+            chunk : bytes = connection.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('connection is closed')
+            data += chunk
+        return data
+
+    def _recv_frame(self, connection: socket.socket):
+        """クライアントのフレームを1つ受け取り、(opcode, payload)を返却する。クライアントのフレームは必ずマスクされている"""
+        first, second = self._recv_exactly(connection, 2)
+        length : int = second & 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self._recv_exactly(connection, 2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self._recv_exactly(connection, 8))[0]
+        mask : bytes = self._recv_exactly(connection, 4) if second & 0x80 else b'\x00\x00\x00\x00'
+        payload : bytes = self._recv_exactly(connection, length)
+        return first & 0x0F, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+    def _send_text(self, connection: socket.socket, msg: Dict[str, Any]) -> None:
+        self._send_frame(connection, OPCODE_TEXT, json.dumps(msg).encode())
+
+    def _send_frame(self, connection: socket.socket, opcode: int, payload: bytes) -> None:
+        header : bytes = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 1 << 16:
+            header += bytes([126]) + struct.pack('!H', len(payload))
+        else:
+            header += bytes([127]) + struct.pack('!Q', len(payload))
+        connection.sendall(header + payload)
+
+    def _close(self, connection: socket.socket) -> None:
+        try:
+            self._send_frame(connection, OPCODE_CLOSE, b'')
+        except OSError:
+            pass
+        try:
+            connection.close()
+        except OSError:
+            pass
@@ -0,0 +1,197 @@
+"""記録したローソク足をSimulatedExchangeで再生し、実際のFeaturesCreatorとTraderで売買を再現する
+
+CandleArchiveに保存済みのローソク足を用いる場合は、リポジトリのルートで以下のように実行する
+    python -m simulator.replay --symbol BTCUSD --num-ohlcs 10000 --speed 1000
+"""
+from typing import Any, Dict, List, Union
+import argparse
+import time
+
+import numpy as np
+
+import constants
+from trading_api.trading_api import AccountStateCache, ApiClient, OhlcBuffer, unit_minutes
+from trading_api.rate_limiter import RequestScheduler, PUBLIC, PRIVATE
+from trading_api.candle_archive import CandleArchive
+from trading_brain.feature_creation import FeaturesCreator
+from orders.orders import Trader
+from simulator.exchange import SimulatedExchange
+
+# シミュレーションではレート制限で待機しないよう、実質的に無制限とする
+unlimited_rate_limits = {PUBLIC: (1e9, 1e9), PRIVATE: (1e9, 1e9)}
+
+
+class ReplayResult:
+    """リプレイの結果をもつクラス
+
+    Attributes
+    ----------
+    num_ohlcs : int
+        再生したローソク足の数（ウォームアップを除く）
+    elapsed_seconds : float
+        再生にかかった実時間
+    cycle_seconds : np.ndarray
+        足ごとの、足を受け取ってから判断と注文を終えるまでの時間
+    tick_to_order_seconds : np.ndarray
+        注文を出した足ごとの、足を受け取ってから取引所が最初の注文を受け付けるまでの時間
+    fills : List[Dict[str, Any]]
+        約定の履歴
+    initial_wallet_balance : float
+        開始時の残高（coin建て）
+    final_wallet_balance : float
+        終了時の残高（coin建て）
+    """
+    def __init__(
+            self,
+            num_ohlcs: int,
+            elapsed_seconds: float,
+            cycle_seconds: np.ndarray,
+            tick_to_order_seconds: np.ndarray,
+            fills: List[Dict[str, Any]],
+            initial_wallet_balance: float,
+            final_wallet_balance: float) -> None:
+        self.num_ohlcs : int = num_ohlcs
+        self.elapsed_seconds : float = elapsed_seconds
+        self.cycle_seconds : np.ndarray = cycle_seconds
+        self.tick_to_order_seconds : np.ndarray = tick_to_order_seconds
+        self.fills : List[Dict[str, Any]] = fills
+        self.initial_wallet_balance : float = initial_wallet_balance
+        self.final_wallet_balance : float = final_wallet_balance
+
+    def summary(self) -> Dict[str, float]:
+        """主要な指標をdictで返却する。遅延はミリ秒"""
+        def percentile(values: np.ndarray, q: float) -> float:
+            return float(np.percentile(values, q)) * 1e3 if len(values) else float('nan')
+        return {
+            'num_ohlcs': self.num_ohlcs,
+            'ohlcs_per_second': self.num_ohlcs / self.elapsed_seconds if self.elapsed_seconds > 0 else float('nan'),
+            'cycle_p50_ms': percentile(self.cycle_seconds, 50),
+            'cycle_p99_ms': percentile(self.cycle_seconds, 99),
+            'tick_to_order_p50_ms': percentile(self.tick_to_order_seconds, 50),
+            'tick_to_order_p99_ms': percentile(self.tick_to_order_seconds, 99),
+            'num_fills': len(self.fills),
+            'total_return': self.final_wallet_balance / self.initial_wallet_balance - 1,
+        }
+
+
+class ReplayDriver:
+    """記録したローソク足をSimulatedExchangeで1本ずつ進め、WebSocketで受け取った場合と同じ経路で
+    FeaturesCreator.update_from_streamに渡し、続けてTrader.trade_onceで判断と注文を行う
+
+    判断は足を渡したスレッドで直接行うため、読み飛ばされるスナップショットはなく、同じ入力からは常に同じ結果が得られる。
+    speedを指定した場合は、実時間のspeed倍の速さになるよう足の間で待機する
+
+    Attributes
+    ----------
+    ohlcs : OhlcBuffer
+        再生するローソク足。先頭のnum_warmup_ohlcs個は特徴量の初期化のみに用いる
+    symbol : str
+        通貨 e.g.) BTCUSD
+    time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
+        ローソク足の単位時間
+    speed : float | None
+        実時間に対する再生速度の倍率。Noneの場合は待機せずに再生する
+    num_warmup_ohlcs : int
+        起動時にREST APIで取得させる足の数
+    exchange_options : Dict[str, Any]
+        SimulatedExchangeに渡す引数（latency, fill_delay_bars, wallet_balanceなど）
+
+    Methods
+    -------
+    run -> ReplayResult
+        ローソク足を最後まで再生する
+    """
+    def __init__(
+            self,
+            ohlcs: OhlcBuffer,
+            symbol: str = 'BTCUSD',
+            time_interval: str = constants.DURATION_1M,
+            speed: Union[float, None] = 1000.0,
+            num_warmup_ohlcs: int = constants.NUMBER_OF_OHLCS,
+            **exchange_options) -> None:
+        if len(ohlcs) <= num_warmup_ohlcs:
+            raise ValueError(f'{len(ohlcs)} ohlcs are not enough for {num_warmup_ohlcs} warm-up ohlcs')
+        self.ohlcs : OhlcBuffer = ohlcs
+        self.symbol : str = symbol
+        self.time_interval : str = time_interval
+        self.speed : Union[float, None] = speed
+        self.num_warmup_ohlcs : int = num_warmup_ohlcs
+        self.exchange_options : Dict[str, Any] = exchange_options
+
+    def run(self) -> ReplayResult:
+        """ローソク足を最後まで再生する
+
+        Returns
+        -------
+        ReplayResult
+            リプレイの結果
+        """
+        exchange : SimulatedExchange = SimulatedExchange(
+            symbol=self.symbol,
+            ohlcs=self.ohlcs,
+            time_interval=self.time_interval,
+            cursor=self.num_warmup_ohlcs - 1,
+            **self.exchange_options)
+        api_client : ApiClient = ApiClient(
+            account_state_cache=AccountStateCache(),
+            request_scheduler=RequestScheduler(limits=unlimited_rate_limits),
+            client=exchange,
+            clock=exchange.clock)
+        features_creator : FeaturesCreator = FeaturesCreator(
+            api_client=api_client,
+            symbol=self.symbol,
+            time_interval=self.time_interval,
+            uses_archive=False)  # 再生した足を実際のアーカイブに混ぜない
+        trader : Trader = Trader(api_client=api_client, features_creator=features_creator)
+        exchange.subscribe(on_order=trader.on_order, on_stop_order=trader.on_stop_order, on_position=trader.on_position)
+        api_client.account_state_cache.set_streaming(True)  # ポジションの更新は約定の度に通知される
+        initial_wallet_balance : float = exchange.wallet_balance
+
+        seconds_per_ohlc : Union[float, None] = None
+        if self.speed is not None:
+            seconds_per_ohlc = unit_minutes[self.time_interval] * 60 / self.speed
+        cycle_seconds : List[float] = []
+        tick_to_order_seconds : List[float] = []
+        started_at : float = time.perf_counter()
+        while exchange.advance():
+            received_at : float = time.perf_counter()
+            num_orders : int = len(exchange.order_received_at)
+            features_creator.update_from_stream(exchange.current_ohlc())
+            trader.trade_once(features_creator.channel.latest)
+            cycle_seconds.append(time.perf_counter() - received_at)
+            if len(exchange.order_received_at) > num_orders:
+                tick_to_order_seconds.append(exchange.order_received_at[num_orders] - received_at)
+            if seconds_per_ohlc is not None:
+                time.sleep(max(started_at + len(cycle_seconds) * seconds_per_ohlc - time.perf_counter(), 0.0))
+
+        return ReplayResult(
+            num_ohlcs=len(cycle_seconds),
+            elapsed_seconds=time.perf_counter() - started_at,
+            cycle_seconds=np.array(cycle_seconds),
+            tick_to_order_seconds=np.array(tick_to_order_seconds),
+            fills=exchange.fills,
+            initial_wallet_balance=initial_wallet_balance,
+            final_wallet_balance=exchange.wallet_balance)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--symbol', default='BTCUSD')
+    parser.add_argument('--time-interval', default=constants.DURATION_1M)
+    parser.add_argument('--num-ohlcs', type=int, default=10000, help='再生する足の数（ウォームアップを除く）')
+    parser.add_argument('--speed', type=float, default=1000.0, help='実時間に対する再生速度の倍率。0の場合は待機しない')
+    parser.add_argument('--latency', type=float, default=0.0, help='1回のリクエストの往復にかかる秒数')
+    parser.add_argument('--fill-delay-bars', type=int, default=0)
+    args = parser.parse_args()
+
+    archive = CandleArchive(symbol=args.symbol, time_interval=args.time_interval)
+    recorded_ohlcs = archive.read_last(args.num_ohlcs + constants.NUMBER_OF_OHLCS)
+    driver = ReplayDriver(
+        ohlcs=recorded_ohlcs,
+        symbol=args.symbol,
+        time_interval=args.time_interval,
+        speed=args.speed or None,
+        latency=args.latency,
+        fill_delay_bars=args.fill_delay_bars)
+    for name, value in driver.run().summary().items():
+        print(f'{name:<24} {value:12.4f}')
@@ -0,0 +1,11 @@
+"""全てのテストで、損益のデータベースをリポジトリのルートではなく一時フォルダに作成する"""
+import pytest
+
+from profit_and_loss import base_db
+
+
+@pytest.fixture(autouse=True)
+def pl_database(tmp_path):
+    base_db.configure(str(tmp_path / 'bybit_pl.sql'))
+    yield
+    base_db.Session.remove()
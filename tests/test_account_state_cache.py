@@ -0,0 +1,99 @@
+"""WebSocketでポジションを受け取っている間は、判断の度にREST APIでポジションを取得し直さないことを確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+from typing import Any, List
+
+import numpy as np
+
+import constants
+from trading_api.trading_api import AccountStateCache, ApiClient, OhlcBuffer, Order, Position
+from trading_api.rate_limiter import RequestScheduler
+from simulator.exchange import SimulatedExchange
+from simulator.replay import unlimited_rate_limits
+
+symbol = 'BTCUSD'
+
+
+def make_exchange() -> SimulatedExchange:
+    ohlcs : OhlcBuffer = OhlcBuffer(capacity=10)
+    close : np.ndarray = np.full(10, 30000.0)
+    ohlcs.extend(1609459200 + 60 * np.arange(10, dtype=np.int64), np.column_stack([close, close + 5, close - 5, close]))
+    return SimulatedExchange(symbol=symbol, ohlcs=ohlcs, cursor=9)
+
+
+def make_api_client(exchange: SimulatedExchange) -> ApiClient:
+    # ttlを0とし、WebSocketで受け取ったポジションが有効期間によらず使われることを確かめる
+    api_client : ApiClient = ApiClient(
+        account_state_cache=AccountStateCache(ttl=0.0),
+        request_scheduler=RequestScheduler(limits=unlimited_rate_limits),
+        client=exchange,
+        clock=exchange.clock)
+    exchange.subscribe(on_position=lambda position: api_client.account_state_cache.set_position(symbol, position))
+    return api_client
+
+
+def record_position_requests(exchange: SimulatedExchange) -> List[str]:
+    """private_position_listが呼ばれた通貨を記録する"""
+    requested : List[str] = []
+    fetch_position = exchange.private_position_list
+
+    def private_position_list(**params: Any):
+        requested.append(params['symbol'])
+        return fetch_position(**params)
+
+    exchange.private_position_list = private_position_list
+    return requested
+
+
+def run_cycles(api_client: ApiClient, num_cycles: int) -> Position:
+    for _ in range(num_cycles):
+        api_client.begin_cycle(symbol)
+        position : Position = api_client.get_position(symbol)
+    return position
+
+
+def test_streamed_position_is_kept_across_cycles():
+    exchange : SimulatedExchange = make_exchange()
+    api_client : ApiClient = make_api_client(exchange)
+    requested : List[str] = record_position_requests(exchange)
+    api_client.account_state_cache.set_streaming(True)
+
+    assert run_cycles(api_client, 5).side == constants.NONE
+    assert requested == [symbol]  # 接続直後の1回のみ
+
+    # 他の経路（手動の注文など）でポジションが変わっても、WebSocketで受け取ったものを用いる
+    exchange.private_order_create(symbol=symbol, side=constants.BUY, order_type=constants.MARKET, qty=100)
+    assert run_cycles(api_client, 5).size == 100
+    assert requested == [symbol]
+
+
+def test_own_order_invalidates_the_streamed_position():
+    exchange : SimulatedExchange = make_exchange()
+    api_client : ApiClient = make_api_client(exchange)
+    requested : List[str] = record_position_requests(exchange)
+    api_client.account_state_cache.set_streaming(True)
+    run_cycles(api_client, 2)
+
+    api_client.create_order(symbol, Order(side=constants.SELL, order_type=constants.MARKET, qty=50, price=None))
+    position : Position = run_cycles(api_client, 3)
+    assert (position.side, position.size) == (constants.SELL, 50)
+    assert requested == [symbol, symbol]  # 注文の後の1回のみ取得し直す
+
+
+def test_position_is_fetched_every_cycle_while_the_stream_is_down():
+    exchange : SimulatedExchange = make_exchange()
+    api_client : ApiClient = make_api_client(exchange)
+    requested : List[str] = record_position_requests(exchange)
+    api_client.account_state_cache.set_streaming(True)
+    run_cycles(api_client, 3)
+    assert len(requested) == 1
+
+    api_client.account_state_cache.set_streaming(False)  # 切断された
+    run_cycles(api_client, 3)
+    assert len(requested) == 4
+
+    api_client.account_state_cache.set_streaming(True)  # 再接続した。切断中の更新を取りこぼした可能性がある
+    run_cycles(api_client, 3)
+    assert len(requested) == 5
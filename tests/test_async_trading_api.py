@@ -0,0 +1,236 @@
+"""AsyncApiClientを、bybitのREST APIを模したローカルのaiohttpサーバーに対して確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+from typing import Any, Callable, Dict, List, Tuple, Union
+import asyncio
+import hashlib
+import hmac
+import time
+
+from aiohttp import web
+import numpy as np
+
+import constants
+from trading_api.async_trading_api import AsyncApiClient
+from trading_api.trading_api import Order, Position
+from trading_api.rate_limiter import RequestScheduler, PRIORITY_MARKET_DATA
+from simulator.replay import unlimited_rate_limits
+
+response_delay = 0.2  # 1回のリクエストにかかる時間（秒）
+
+
+class StubBybitServer:
+    """/v2/public/kline/listと、認証が必要なエンドポイントを受け付けるローカルのHTTPサーバー
+
+    ローソク足はfromから200個の1分足を返却する。足の終値はopen_timeから決まるため、ページをまたいでも同じ足は同じ値になる。
+    同時に処理したリクエストの最大数と、受け取ったfromを記録する。
+    認証が必要なエンドポイントはprivate_responsesの応答を返却し、受け取った(メソッド, パス, パラメータ)を記録する
+    """
+    def __init__(self, respond: Union[Callable[[int], Dict[str, Any]], None] = None) -> None:
+        self.respond : Callable[[int], Dict[str, Any]] = respond if respond is not None else self.klines
+        self.requested_from : List[int] = []
+        self.max_in_flight : int = 0
+        self._in_flight : int = 0
+        self.private_responses : Dict[str, Dict[str, Any]] = {}
+        self.private_requests : List[Tuple[str, str, Dict[str, Any]]] = []
+        self._runner : Union[web.AppRunner, None] = None
+        self.url : str = ''
+
+    @staticmethod
+    def klines(from_time: int) -> Dict[str, Any]:
+        start : int = from_time - from_time % 60
+        now : int = int(time.time())
+        return {'ret_code': 0, 'ret_msg': 'OK', 'result': [
+            {'open_time': open_time, 'open': str(open_time % 1000), 'high': str(open_time % 1000 + 1),
+             'low': str(open_time % 1000 - 1), 'close': str(open_time % 1000)}
+            for open_time in range(start, min(start + 200 * 60, now), 60)]}
+
+    async def handle_kline(self, request: web.Request) -> web.Response:
+        from_time : int = int(request.query['from'])
+        self.requested_from.append(from_time)
+        self._in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            await asyncio.sleep(response_delay)
+            resp_json : Dict[str, Any] = self.respond(from_time)
+        finally:
+            self._in_flight -= 1
+        return web.json_response(resp_json, headers=resp_json.pop('headers', {}))
+
+    async def handle_private(self, request: web.Request) -> web.Response:
+        params : Dict[str, Any] = dict(request.query) if request.method == 'GET' else await request.json()
+        self.private_requests.append((request.method, request.path, params))
+        return web.json_response(self.private_responses[request.path])
+
+    async def __aenter__(self) -> 'StubBybitServer':
+        app : web.Application = web.Application()
+        app.router.add_get('/v2/public/kline/list', self.handle_kline)
+        app.router.add_route('*', '/v2/private/{endpoint:.*}', self.handle_private)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site : web.TCPSite = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}'
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self._runner.cleanup()
+
+
+def make_client(server: StubBybitServer, limits=unlimited_rate_limits) -> AsyncApiClient:
+    return AsyncApiClient(base_url=server.url, request_scheduler=RequestScheduler(limits=limits))
+
+
+def test_get_ohlcs_since_fetches_pages_concurrently_and_drops_duplicates():
+    async def run():
+        async with StubBybitServer() as server, make_client(server) as api_client:
+            start_time : int = int(time.time()) // 60 * 60 - 999 * 60  # 形成中の足を含めて1000個
+            started_at : float = time.monotonic()
+            ohlcs = await api_client.get_ohlcs_since(
+                symbol='BTCUSD', start_time=start_time, time_interval=constants.DURATION_1M)
+            return server, ohlcs, time.monotonic() - started_at, start_time
+
+    server, ohlcs, elapsed, start_time = asyncio.run(run())
+    assert len(server.requested_from) == 5
+    assert server.max_in_flight == 5
+    assert elapsed < 2 * response_delay  # 5回分を順に待たず、およそ1回分の時間で取得する
+    assert len(ohlcs) == 1000
+    assert ohlcs.open_time[0] == start_time
+    assert np.all(np.diff(ohlcs.open_time) == 60)
+    np.testing.assert_array_equal(ohlcs.values[:, 3], ohlcs.open_time % 1000)
+
+
+def test_get_ohlcs_since_removes_overlapping_candles():
+    def overlapping_klines(from_time: int) -> Dict[str, Any]:
+        # 前のページの末尾と重なるよう、fromの1つ前の足から返却する
+        return StubBybitServer.klines(from_time - 60)
+
+    async def run():
+        async with StubBybitServer(overlapping_klines) as server, make_client(server) as api_client:
+            start_time : int = int(time.time()) // 60 * 60 - 600 * 60
+            return await api_client.get_ohlcs_since(
+                symbol='BTCUSD', start_time=start_time, time_interval=constants.DURATION_1M), start_time
+
+    ohlcs, start_time = asyncio.run(run())
+    assert ohlcs.open_time[0] == start_time - 60
+    assert len(np.unique(ohlcs.open_time)) == len(ohlcs)
+    assert np.all(np.diff(ohlcs.open_time) == 60)
+
+
+def test_error_response_is_returned_and_failed_page_is_skipped():
+    start_time : int = int(time.time()) // 60 * 60 - 399 * 60  # 形成中の足を含めて2ページ
+    failed_from : int = start_time + 200 * 60
+
+    def fail_second_page(from_time: int) -> Dict[str, Any]:
+        if from_time == failed_from:
+            return {'ret_code': 10006, 'ret_msg': 'too many visits!', 'result': None}
+        return StubBybitServer.klines(from_time)
+
+    async def run():
+        async with StubBybitServer(fail_second_page) as server, make_client(server) as api_client:
+            resp_json = await api_client._request(
+                'GET', '/v2/public/kline/list', {'symbol': 'BTCUSD', 'interval': constants.DURATION_1M, 'from': failed_from},
+                is_private=False, priority=PRIORITY_MARKET_DATA)
+            ohlcs = await api_client.get_ohlcs_since(
+                symbol='BTCUSD', start_time=start_time, time_interval=constants.DURATION_1M)
+            return resp_json, ohlcs
+
+    resp_json, ohlcs = asyncio.run(run())
+    assert resp_json['ret_code'] == 10006
+    assert resp_json['result'] is None
+    # 失敗したページの足は含まず、取得できたページの足のみを返却する
+    assert len(ohlcs) == 200
+    assert ohlcs.open_time[0] == start_time
+    assert ohlcs.open_time[-1] < failed_from
+
+
+def test_rate_limit_headers_hold_back_the_next_request():
+    reset_after : float = 0.5
+
+    def exhausted(from_time: int) -> Dict[str, Any]:
+        resp_json : Dict[str, Any] = StubBybitServer.klines(from_time)
+        resp_json['headers'] = {
+            'X-Bapi-Limit-Status': '0',
+            'X-Bapi-Limit-Reset-Timestamp': str(int((time.time() + reset_after) * 1000))}
+        return resp_json
+
+    async def run():
+        async with StubBybitServer(exhausted) as server, make_client(server) as api_client:
+            start_time : int = int(time.time()) // 60 * 60 - 100 * 60
+            await api_client.get_ohlcs_since(symbol='BTCUSD', start_time=start_time, time_interval=constants.DURATION_1M)
+            started_at : float = time.monotonic()
+            await api_client.get_ohlcs_since(symbol='BTCUSD', start_time=start_time, time_interval=constants.DURATION_1M)
+            return time.monotonic() - started_at
+
+    elapsed : float = asyncio.run(run())
+    # 残数0を通知された後は、解除時刻まで次のリクエストを送らない
+    assert elapsed >= reset_after - 0.1 + response_delay
+
+
+def assert_signed(api_client: AsyncApiClient, params: Dict[str, Any]) -> None:
+    """パラメータにapi_keyと、残りのパラメータから求めた署名が含まれることを確かめる"""
+    params = dict(params)
+    sign : str = params.pop('sign')
+    assert params['api_key'] == api_client._api_key
+    query : str = '&'.join(f'{key}={params[key]}' for key in sorted(params))
+    assert sign == hmac.new(api_client._api_secret_key.encode(), query.encode(), hashlib.sha256).hexdigest()
+
+
+def test_account_endpoints_are_signed_and_parsed():
+    async def run():
+        async with StubBybitServer() as server, make_client(server) as api_client:
+            server.private_responses = {
+                '/v2/private/position/list': {'ret_code': 0, 'result': {
+                    'side': 'Buy', 'size': 100, 'entry_price': '29003.5', 'leverage': '1', 'liq_price': '15000',
+                    'created_at': '2021-01-01T00:00:00.000Z', 'updated_at': '2021-01-01T00:01:00.000Z',
+                    'wallet_balance': 0.1}},
+                '/v2/private/order/list': {'ret_code': 0, 'result': {'data': [{
+                    'side': 'Sell', 'order_type': 'Limit', 'qty': 50, 'price': '29100', 'leaves_qty': 20,
+                    'created_at': '2021-01-01T00:00:00.000Z', 'updated_at': '2021-01-01T00:01:00.000Z',
+                    'order_id': 'order-1', 'order_link_id': 'link-1', 'order_status': 'PartiallyFilled'}]}},
+                '/v2/private/wallet/balance': {'ret_code': 0, 'result': {
+                    'BTC': {'wallet_balance': 0.1, 'available_balance': 0.08}}},
+            }
+            position = await api_client.get_position('BTCUSD')
+            orders = await api_client.get_active_orders('BTCUSD')
+            balance = await api_client.get_available_balance('BTC')
+            return server, api_client, position, orders, balance
+
+    server, api_client, position, orders, balance = asyncio.run(run())
+    assert isinstance(position, Position)
+    assert (position.side, position.size, position.entry_price, position.wallet_balance) == ('Buy', 100, 29003.5, 0.1)
+    assert [(order.order_id, order.order_link_id, order.leaves_qty) for order in orders] == [('order-1', 'link-1', 20)]
+    assert balance == 0.08
+
+    assert [(method, path) for method, path, _ in server.private_requests] == [
+        ('GET', '/v2/private/position/list'), ('GET', '/v2/private/order/list'), ('GET', '/v2/private/wallet/balance')]
+    assert server.private_requests[1][2]['order_status'] == 'New,PartiallyFilled'
+    for _, _, params in server.private_requests:
+        assert_signed(api_client, params)
+
+
+def test_order_endpoints_send_signed_json():
+    async def run():
+        async with StubBybitServer() as server, make_client(server) as api_client:
+            server.private_responses = {
+                '/v2/private/order/create': {'ret_code': 0, 'result': {'order_id': 'order-1'}},
+                '/v2/private/order/cancelAll': {'ret_code': 0, 'result': []},
+            }
+            order : Order = Order(side='Buy', order_type='Market', qty=100, price=None, order_link_id='link-1')
+            resp_json = await api_client.create_order('BTCUSD', order)
+            await api_client.cancel_all_active_orders('BTCUSD')
+            return server, api_client, resp_json
+
+    server, api_client, resp_json = asyncio.run(run())
+    assert resp_json['result']['order_id'] == 'order-1'
+    (create_method, create_path, create_params), (cancel_method, cancel_path, cancel_params) = server.private_requests
+    assert (create_method, create_path) == ('POST', '/v2/private/order/create')
+    assert create_params['time_in_force'] == constants.GOOD_TILL_CANCEL
+    assert create_params['order_link_id'] == 'link-1'
+    assert 'price' not in create_params  # 成行注文は価格を送らない
+    assert_signed(api_client, create_params)
+    assert (cancel_method, cancel_path, cancel_params['symbol']) == ('POST', '/v2/private/order/cancelAll', 'BTCUSD')
+    assert_signed(api_client, cancel_params)
@@ -0,0 +1,110 @@
+"""Backtesterがまとめて求めたトレードが、実際の判断（DonchianStrategy）と損切り（FundManager）で
+1本ずつ判断した場合のトレードと一致することを確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+from datetime import datetime
+from types import SimpleNamespace
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import constants
+from backtesting.backtester import Backtester, BacktestResult
+from fund_management.fund_management import FundManager
+from trading_api.trading_api import Position
+from trading_brain.feature_builder import build_features
+from trading_brain.feature_snapshot import LatestBars
+from trading_brain.judgement import Judgement
+
+num_bars = 3000
+
+
+@pytest.fixture
+def df_ohlcs() -> pd.DataFrame:
+    """トレンドと揉み合いが入れ替わるランダムウォーク。ブレイクによる決済と損切りのいずれも起きる"""
+    rng : np.random.Generator = np.random.default_rng(11)
+    drift : np.ndarray = np.repeat(rng.normal(0, 8, num_bars // 100), 100)
+    close : np.ndarray = 30000 + np.cumsum(drift + rng.normal(0, 40, num_bars))
+    open : np.ndarray = np.r_[close[0], close[:-1]]
+    spread : np.ndarray = np.abs(rng.normal(0, 15, num_bars))
+    return pd.DataFrame({
+        'open_time': 1609459200 + 60 * np.arange(num_bars),
+        'open': open,
+        'high': np.maximum(open, close) + spread,
+        'low': np.minimum(open, close) - spread,
+        'close': close})
+
+
+def replay_bar_by_bar(df_ohlcs: pd.DataFrame, initial_balance: float, fee_rate: float) -> List[Tuple]:
+    """特徴量の足を1本ずつ、実際のトレードと同じ順序（売買の判断、続けて損切りの判断）で判断する"""
+    df_features : pd.DataFrame = build_features(
+        df_ohlcs['open_time'].to_numpy(), df_ohlcs['open'].to_numpy(), df_ohlcs['high'].to_numpy(),
+        df_ohlcs['low'].to_numpy(), df_ohlcs['close'].to_numpy(), terms=[10, 50])
+    columns : List[str] = list(df_features.columns[1:])
+    values : np.ndarray = df_features[columns].to_numpy()
+    open_time : np.ndarray = df_features['open_time'].to_numpy()
+
+    judgement : Judgement = Judgement(strategy_weights={'donchian': 1.0})
+    bars : LatestBars = LatestBars(columns=columns, values=values[:1])
+    fund_manager : FundManager = FundManager(
+        api_client=None,
+        features_creator=SimpleNamespace(symbol='BTCUSD', channel=SimpleNamespace(latest=SimpleNamespace(latest_bars=bars))))
+    balance : float = initial_balance
+    position : Union[Position, None] = None
+    entry_time : int = 0
+    trades : List[Tuple] = []
+
+    def settle(i: int, reason: str) -> None:
+        nonlocal balance, position
+        side_sign : int = 1 if position.side == constants.BUY else -1
+        exit_price : float = float(values[i, columns.index('close')])
+        pnl : float = side_sign * position.size * (1 / position.entry_price - 1 / exit_price)
+        fee : float = position.size * fee_rate * (1 / position.entry_price + 1 / exit_price)
+        balance += pnl - fee
+        trades.append((entry_time, open_time[i], position.side, position.size, position.entry_price, exit_price, reason))
+        position = None
+
+    for i in range(1, len(values)):
+        bars = LatestBars(columns=columns, values=values[i - 1:i + 1])
+        fund_manager.on_snapshot(SimpleNamespace(latest_bars=bars))
+        position_side : str = position.side if position is not None else constants.NONE
+        signal : float = judgement.judge(position_side=position_side, bars=bars)
+        if position is not None:
+            if (signal >= 1 and position.side == constants.SELL) or (signal <= -1 and position.side == constants.BUY):
+                settle(i, 'signal')
+            elif fund_manager.decide_if_stop_position(position):
+                settle(i, 'stop')
+            continue
+        if abs(signal) < 1:
+            continue
+        fund_manager.on_position(Position(
+            side=constants.NONE, size=0, entry_price=0.0, leverage=1.0, liq_price=0.0,
+            created_at=datetime.now(), updated_at=datetime.now(), wallet_balance=balance))
+        qty : int = fund_manager.cul_qty()
+        if qty <= 0:
+            continue
+        entry_price : float = fund_manager.now_price
+        position = Position(
+            side=constants.BUY if signal >= 1 else constants.SELL, size=qty, entry_price=entry_price, leverage=1.0,
+            liq_price=0.0, created_at=datetime.now(), updated_at=datetime.now())
+        entry_time = open_time[i]
+    if position is not None:
+        settle(len(values) - 1, 'end')
+    return trades
+
+
+def test_vectorized_trades_match_bar_by_bar_replay(df_ohlcs):
+    backtester : Backtester = Backtester(initial_balance=1.0)
+    result : BacktestResult = backtester.run(df_ohlcs)
+    expected : List[Tuple] = replay_bar_by_bar(df_ohlcs, backtester.initial_balance, backtester.fee_rate)
+
+    actual : List[Tuple] = list(result.trades[
+        ['entry_time', 'exit_time', 'side', 'qty', 'entry_price', 'exit_price', 'reason']].itertuples(index=False, name=None))
+    assert {'signal', 'stop'} <= {trade[-1] for trade in expected}
+    assert len(actual) == len(expected)
+    for actual_trade, expected_trade in zip(actual, expected):
+        assert actual_trade == expected_trade
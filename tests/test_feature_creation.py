@@ -0,0 +1,159 @@
+"""FeaturesCreatorを、SimulatedExchangeから取得したローソク足に対して確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+import numpy as np
+
+import constants
+from trading_api.trading_api import AccountStateCache, ApiClient, OhlcBuffer, unit_minutes
+from trading_api.rate_limiter import RequestScheduler
+from trading_api.candle_archive import CandleArchive
+from trading_brain import feature_creation
+from trading_brain.feature_creation import FeaturesCreator
+from trading_brain.indicators import IndicatorEngine
+from trading_brain.resampler import TimeframeFeatures
+from simulator.exchange import SimulatedExchange
+from simulator.replay import unlimited_rate_limits
+from utils.metrics import metrics
+
+start_time = 1609459200
+num_ohlcs = constants.NUMBER_OF_OHLCS + 50
+
+
+def make_ohlcs(num_ohlcs: int) -> OhlcBuffer:
+    rng = np.random.default_rng(0)
+    close : np.ndarray = 29000 + np.cumsum(rng.normal(0, 20, num_ohlcs))
+    open : np.ndarray = np.r_[close[0], close[:-1]]
+    spread : np.ndarray = np.abs(rng.normal(0, 10, num_ohlcs))
+    ohlcs : OhlcBuffer = OhlcBuffer(capacity=num_ohlcs)
+    ohlcs.extend(
+        start_time + 60 * np.arange(num_ohlcs, dtype=np.int64),
+        np.column_stack([open, np.maximum(open, close) + spread, np.minimum(open, close) - spread, close]))
+    return ohlcs
+
+
+def make_features_creator() -> FeaturesCreator:
+    exchange : SimulatedExchange = SimulatedExchange(symbol='BTCUSD', ohlcs=make_ohlcs(num_ohlcs), cursor=num_ohlcs - 1)
+    api_client : ApiClient = ApiClient(
+        account_state_cache=AccountStateCache(),
+        request_scheduler=RequestScheduler(limits=unlimited_rate_limits),
+        client=exchange,
+        clock=exchange.clock)
+    return FeaturesCreator(api_client=api_client, symbol='BTCUSD', time_interval=constants.DURATION_1M, uses_archive=False)
+
+
+def stream_ohlcs(open_times, closes) -> OhlcBuffer:
+    ohlcs : OhlcBuffer = OhlcBuffer(capacity=len(open_times))
+    ohlcs.extend(
+        np.array(open_times, dtype=np.int64),
+        np.array([[close, close + 5, close - 5, close] for close in closes], dtype=np.float64))
+    return ohlcs
+
+
+def test_update_from_stream_drops_frames_older_than_the_last_bar():
+    features_creator : FeaturesCreator = make_features_creator()
+    last_open_time : int = features_creator.ohlc_store.ohlcs.last_open_time()
+    num_stored : int = len(features_creator.ohlc_store.ohlcs)
+    version : int = features_creator.channel.latest.version
+    dropped : float = metrics.counter('stale_klines_dropped_BTCUSD').value
+
+    # REST APIで補った後に届いた古い足のみのメッセージは、何も変えずに捨てる
+    features_creator.update_from_stream(stream_ohlcs([last_open_time - 120, last_open_time - 60], [1.0, 2.0]))
+    assert features_creator.ohlc_store.ohlcs.last_open_time() == last_open_time
+    assert len(features_creator.ohlc_store.ohlcs) == num_stored
+    assert features_creator.channel.latest.version == version
+    assert metrics.counter('stale_klines_dropped_BTCUSD').value == dropped + 2
+
+    # 古い足と最後の足を含むメッセージは、最後の足のみを反映する
+    features_creator.update_from_stream(stream_ohlcs([last_open_time - 60, last_open_time], [1.0, 29100.0]))
+    assert features_creator.ohlc_store.ohlcs.last_open_time() == last_open_time
+    assert features_creator.ohlc_store.ohlcs.column('close')[-1] == 29100.0
+    assert features_creator.channel.latest.latest_bars.last('close') == 29100.0
+    assert features_creator.channel.latest.version == version + 1
+
+
+def test_update_from_stream_appends_the_next_bar():
+    features_creator : FeaturesCreator = make_features_creator()
+    last_open_time : int = features_creator.ohlc_store.ohlcs.last_open_time()
+    features_creator.update_from_stream(stream_ohlcs([last_open_time + 60], [29200.0]))
+    assert features_creator.ohlc_store.ohlcs.last_open_time() == last_open_time + 60
+    assert features_creator.channel.latest.latest_bars.last('close') == 29200.0
+
+
+class ResamplingApiClient(ApiClient):
+    """1分足以外のローソク足を、SimulatedExchangeの1分足を集計して返すApiClient"""
+    def get_ohlcs(self, symbol: str, time_interval: str = constants.DURATION_1M, num_ohlcs: int = constants.NUMBER_OF_OHLCS) -> OhlcBuffer:
+        if time_interval == constants.DURATION_1M:
+            return super().get_ohlcs(symbol=symbol, time_interval=time_interval, num_ohlcs=num_ohlcs)
+        self.higher_intervals_fetched.append(time_interval)
+        unit_seconds : int = unit_minutes[time_interval] * 60
+        open_time : np.ndarray = self.client.ohlcs.open_time[:self.client.cursor + 1]
+        values : np.ndarray = self.client.ohlcs.values[:self.client.cursor + 1]
+        bar_open_time : np.ndarray = open_time - open_time % unit_seconds
+        starts : np.ndarray = np.flatnonzero(np.r_[True, bar_open_time[1:] != bar_open_time[:-1]])
+        ohlcs : OhlcBuffer = OhlcBuffer(capacity=len(starts))
+        ohlcs.extend(bar_open_time[starts], np.column_stack([
+            values[starts, 0],
+            np.maximum.reduceat(values[:, 1], starts),
+            np.minimum.reduceat(values[:, 2], starts),
+            values[np.r_[starts[1:], len(values)] - 1, 3]]))
+        return ohlcs
+
+
+def test_higher_timeframe_is_seeded_from_rest_without_archive():
+    # 保持する最初の1分足が5分足の途中から始まるよう、2分ずらす
+    ohlcs : OhlcBuffer = make_ohlcs(num_ohlcs + 2)
+    exchange : SimulatedExchange = SimulatedExchange(symbol='BTCUSD', ohlcs=ohlcs, cursor=len(ohlcs) - 1)
+    api_client : ResamplingApiClient = ResamplingApiClient(
+        account_state_cache=AccountStateCache(),
+        request_scheduler=RequestScheduler(limits=unlimited_rate_limits),
+        client=exchange,
+        clock=exchange.clock)
+    api_client.higher_intervals_fetched = []
+    features_creator : FeaturesCreator = FeaturesCreator(
+        api_client=api_client, symbol='BTCUSD', time_interval=constants.DURATION_1M,
+        resampled_time_intervals=[constants.DURATION_5M], uses_archive=False)
+    assert int(features_creator.ohlc_store.ohlcs.open_time[0]) % 300 != 0
+    features_creator.update()
+    assert api_client.higher_intervals_fetched == [constants.DURATION_5M]  # 上位足は最初の1度のみ取得する
+
+    # 全ての1分足から集計した場合と一致する
+    expected : TimeframeFeatures = TimeframeFeatures(
+        time_interval=constants.DURATION_5M, indicator_engine=IndicatorEngine(terms=features_creator.terms))
+    expected.warm_up(ohlcs)
+    actual : OhlcBuffer = features_creator.timeframes[constants.DURATION_5M].indicator_engine.features
+    np.testing.assert_array_equal(actual.open_time, expected.indicator_engine.features.open_time)
+    np.testing.assert_allclose(actual.values, expected.indicator_engine.features.values, equal_nan=True)
+
+
+def test_higher_timeframe_is_warmed_up_from_the_archive_in_simulated_time(tmp_path, monkeypatch):
+    # 1000本の5分足と保持する1分足の期間を含む足を、直近の20分を除いてアーカイブに保存しておく
+    ohlcs : OhlcBuffer = make_ohlcs(1000 * 5 + num_ohlcs + 2)
+    archived : OhlcBuffer = OhlcBuffer(capacity=len(ohlcs) - 20)
+    archived.extend(ohlcs.open_time[:-20], ohlcs.values[:-20])
+    CandleArchive(symbol='BTCUSD', time_interval=constants.DURATION_1M, folder_path=str(tmp_path)).append(archived)
+    monkeypatch.setattr(
+        feature_creation, 'CandleArchive',
+        lambda symbol, time_interval: CandleArchive(symbol=symbol, time_interval=time_interval, folder_path=str(tmp_path)))
+
+    exchange : SimulatedExchange = SimulatedExchange(symbol='BTCUSD', ohlcs=ohlcs, cursor=len(ohlcs) - 1)
+    api_client : ResamplingApiClient = ResamplingApiClient(
+        account_state_cache=AccountStateCache(),
+        request_scheduler=RequestScheduler(limits=unlimited_rate_limits),
+        client=exchange,
+        clock=exchange.clock)
+    api_client.higher_intervals_fetched = []
+    features_creator : FeaturesCreator = FeaturesCreator(
+        api_client=api_client, symbol='BTCUSD', time_interval=constants.DURATION_1M,
+        resampled_time_intervals=[constants.DURATION_5M])
+    # アーカイブの期間はシミュレーションの時刻（2021年）で判断するため、上位足をREST APIで取得しない
+    assert api_client.higher_intervals_fetched == []
+
+    expected : TimeframeFeatures = TimeframeFeatures(
+        time_interval=constants.DURATION_5M, indicator_engine=IndicatorEngine(terms=features_creator.terms))
+    expected.warm_up(ohlcs)
+    actual : OhlcBuffer = features_creator.timeframes[constants.DURATION_5M].indicator_engine.features
+    # 読み込み始めの足は移動平均などの期間が足りないため、直近の足を比べる
+    np.testing.assert_array_equal(actual.open_time[-500:], expected.indicator_engine.features.open_time[-500:])
+    np.testing.assert_allclose(actual.values[-500:], expected.indicator_engine.features.values[-500:], rtol=1e-9)
@@ -0,0 +1,96 @@
+"""IndicatorEngineで逐次求めた特徴量が、build_featuresでまとめて求めた特徴量と一致することを確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from trading_brain.feature_builder import build_features
+from trading_brain.indicators import IndicatorEngine
+
+terms = [10, 50]
+number_of_bars = 1000
+
+
+def random_bars(seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    """ランダムウォークするローソク足を作成する
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        open_timeの配列と、(足の数, 4)のohlcの配列
+    """
+    rng : np.random.Generator = np.random.default_rng(seed)
+    close : np.ndarray = 30000 + np.cumsum(rng.normal(0, 50, number_of_bars))
+    open : np.ndarray = np.concatenate([[close[0]], close[:-1]])
+    high : np.ndarray = np.maximum(open, close) + rng.uniform(0, 30, number_of_bars)
+    low : np.ndarray = np.minimum(open, close) - rng.uniform(0, 30, number_of_bars)
+    open_time : np.ndarray = 1600000000 + 60 * np.arange(number_of_bars)
+    return open_time, np.column_stack([open, high, low, close])
+
+
+def feed(engine: IndicatorEngine, open_time: np.ndarray, ohlcs: np.ndarray, seed: int) -> None:
+    """足を順に追加する。一部の足は、形成中の足を何度か追加してから確定した足で置き換える"""
+    rng : np.random.Generator = np.random.default_rng(seed)
+    for t, (open, high, low, close) in zip(open_time.tolist(), ohlcs.tolist()):
+        for _ in range(rng.integers(0, 3)):
+            live_close : float = open + rng.normal(0, 50)
+            engine.update(t, open, max(open, live_close), min(open, live_close), live_close)
+        engine.update(t, open, high, low, close)
+
+
+def assert_same_features(actual: pd.DataFrame, expected: pd.DataFrame, columns: List[str]) -> None:
+    assert len(actual) == len(expected)
+    for column in columns:
+        np.testing.assert_allclose(
+            actual[column].to_numpy(), expected[column].to_numpy(), rtol=1e-9, atol=1e-6, err_msg=column)
+
+
+def test_engine_matches_build_features_with_live_bar_replacements():
+    open_time, ohlcs = random_bars(seed=0)
+    engine : IndicatorEngine = IndicatorEngine(terms=terms, max_ohlcs=number_of_bars)
+    feed(engine, open_time, ohlcs, seed=1)
+
+    expected : pd.DataFrame = build_features(open_time, *ohlcs.T, terms=terms)
+    actual : pd.DataFrame = engine.to_frame()
+    np.testing.assert_array_equal(actual.index.to_numpy(), expected.index.to_numpy())
+    np.testing.assert_array_equal(engine.features.open_time[actual.index], expected['open_time'].to_numpy())
+    assert list(actual.columns[1:]) == list(expected.columns[1:])
+    assert_same_features(actual, expected, engine.columns)
+
+
+def test_engine_keeps_matching_after_old_bars_are_dropped():
+    max_ohlcs : int = 300
+    open_time, ohlcs = random_bars(seed=2)
+    engine : IndicatorEngine = IndicatorEngine(terms=terms, max_ohlcs=max_ohlcs)
+    feed(engine, open_time, ohlcs, seed=3)
+
+    # EMAは最初に追加された足から計算し続けるため、全ての足から求めた特徴量の末尾と一致する
+    expected : pd.DataFrame = build_features(open_time, *ohlcs.T, terms=terms).iloc[-max_ohlcs:]
+    actual : pd.DataFrame = engine.to_frame()
+    np.testing.assert_array_equal(actual.index.to_numpy(), np.arange(max_ohlcs))
+    np.testing.assert_array_equal(engine.features.open_time, expected['open_time'].to_numpy())
+    assert_same_features(actual, expected, engine.columns)
+
+
+def test_build_features_matches_pandas_rolling():
+    open_time, ohlcs = random_bars(seed=4)
+    df : pd.DataFrame = pd.DataFrame(ohlcs, columns=['open', 'high', 'low', 'close'])
+    # FeaturesCreatorがpandasで求めていたときと同じ式
+    df['ATR'] = (df['high'].rolling(window=5).sum() - df['low'].rolling(window=5).sum()) / 5
+    for term in terms:
+        df[f'sma_{term}'] = df['close'].rolling(window=term).mean()
+        df[f'std_{term}'] = df['close'].rolling(window=term).std()
+        df[f'ema_{term}'] = df['close'].ewm(span=term, adjust=False).mean()
+    df['macd'] = df['close'].ewm(span=9, adjust=False).mean() - df['close'].ewm(span=17, adjust=False).mean()
+    df['macd_signal'] = df['macd'].ewm(span=7, adjust=False).mean()
+    df['max_price'] = df['high'].rolling(window=20).max()
+    df['min_price'] = df['low'].rolling(window=20).min()
+    expected : pd.DataFrame = df.dropna()
+
+    actual : pd.DataFrame = build_features(open_time, *ohlcs.T, terms=terms)
+    np.testing.assert_array_equal(actual.index.to_numpy(), expected.index.to_numpy())
+    assert_same_features(actual, expected, list(expected.columns))
@@ -0,0 +1,27 @@
+"""戦略の登録とJudgementの作成を確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+import pytest
+
+from trading_brain.judgement import Judgement, Strategy, register_strategy, strategy_registry
+
+
+def test_strategy_without_vote_fails_when_judgement_is_created():
+    @register_strategy
+    class IncompleteStrategy(Strategy):
+        name = 'incomplete'
+        columns = ['close']
+
+    try:
+        # トレードの周期の途中ではなく、起動時（Judgementの作成時）に失敗する
+        with pytest.raises(TypeError):
+            Judgement(strategy_weights={'donchian': 1.0, 'incomplete': 1.0})
+    finally:
+        del strategy_registry['incomplete']
+
+
+def test_registered_strategies_are_instantiated():
+    judgement : Judgement = Judgement(strategy_weights={'donchian': 1.0, 'macd': 0.5})
+    assert [(strategy.name, weight) for strategy, weight in judgement.strategies] == [('donchian', 1.0), ('macd', 0.5)]
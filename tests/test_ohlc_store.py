@@ -0,0 +1,95 @@
+"""OhlcStoreが、再起動時にアーカイブから読み込み、長く停止した後もアーカイブに欠けた期間を残さないことを確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+from typing import Any, List
+
+import numpy as np
+
+import constants
+from trading_api.trading_api import AccountStateCache, ApiClient, OhlcBuffer
+from trading_api.rate_limiter import RequestScheduler
+from trading_api.candle_archive import CandleArchive
+from trading_api.ohlc_store import OhlcStore
+from simulator.exchange import SimulatedExchange
+from simulator.replay import unlimited_rate_limits
+
+start_time = 1609459200
+num_ohlcs = 1500
+
+
+def make_ohlcs(num_ohlcs: int) -> OhlcBuffer:
+    close : np.ndarray = 29000 + np.arange(num_ohlcs, dtype=np.float64)
+    ohlcs : OhlcBuffer = OhlcBuffer(capacity=num_ohlcs)
+    ohlcs.extend(
+        start_time + 60 * np.arange(num_ohlcs, dtype=np.int64),
+        np.column_stack([close, close + 5, close - 5, close]))
+    return ohlcs
+
+
+def make_api_client(exchange: SimulatedExchange) -> ApiClient:
+    return ApiClient(
+        account_state_cache=AccountStateCache(),
+        request_scheduler=RequestScheduler(limits=unlimited_rate_limits),
+        client=exchange,
+        clock=exchange.clock)
+
+
+def record_kline_requests(exchange: SimulatedExchange) -> List[int]:
+    """public_kline_listに渡されたfrom_を記録する"""
+    requested_from : List[int] = []
+    fetch_klines = exchange.public_kline_list
+
+    def public_kline_list(**params: Any):
+        requested_from.append(params['from_'])
+        return fetch_klines(**params)
+
+    exchange.public_kline_list = public_kline_list
+    return requested_from
+
+
+def test_update_after_restart_reads_the_archive_and_fetches_only_the_tail(tmp_path):
+    ohlcs : OhlcBuffer = make_ohlcs(num_ohlcs)
+    archive : CandleArchive = CandleArchive(
+        symbol='BTCUSD', time_interval=constants.DURATION_1M, folder_path=str(tmp_path))
+    exchange : SimulatedExchange = SimulatedExchange(symbol='BTCUSD', ohlcs=ohlcs, cursor=1199)
+    OhlcStore(
+        api_client=make_api_client(exchange), symbol='BTCUSD', time_interval=constants.DURATION_1M,
+        max_ohlcs=1000, archive=archive).update()
+    assert archive.last_open_time() == int(ohlcs.open_time[1198])
+
+    # 10分停止した後に再起動する。時刻はシミュレーションのもの（2021年）を用いる
+    for _ in range(10):
+        exchange.advance()
+    requested_from : List[int] = record_kline_requests(exchange)
+    ohlc_store : OhlcStore = OhlcStore(
+        api_client=make_api_client(exchange), symbol='BTCUSD', time_interval=constants.DURATION_1M,
+        max_ohlcs=1000, archive=CandleArchive(
+            symbol='BTCUSD', time_interval=constants.DURATION_1M, folder_path=str(tmp_path)))
+    updated : OhlcBuffer = ohlc_store.update()
+
+    # アーカイブの最後の足以降の1ページのみを取得する
+    assert requested_from == [int(ohlcs.open_time[1198])]
+    np.testing.assert_array_equal(ohlc_store.ohlcs.open_time, ohlcs.open_time[210:1210])
+    np.testing.assert_array_equal(ohlc_store.ohlcs.values, ohlcs.values[210:1210])
+    assert len(updated) == len(ohlc_store.ohlcs)  # アーカイブから読み込んだ足も、更新された足として返却する
+
+
+def test_update_backfills_the_archive_after_a_long_downtime(tmp_path):
+    ohlcs : OhlcBuffer = make_ohlcs(num_ohlcs)
+    archive : CandleArchive = CandleArchive(
+        symbol='BTCUSD', time_interval=constants.DURATION_1M, folder_path=str(tmp_path))
+    archived : OhlcBuffer = OhlcBuffer(capacity=100)
+    archived.extend(ohlcs.open_time[:100], ohlcs.values[:100])
+    archive.append(archived)  # 最初の100分のみを保存した後に停止していた
+
+    exchange : SimulatedExchange = SimulatedExchange(symbol='BTCUSD', ohlcs=ohlcs, cursor=num_ohlcs - 1)
+    ohlc_store : OhlcStore = OhlcStore(
+        api_client=make_api_client(exchange), symbol='BTCUSD', time_interval=constants.DURATION_1M, max_ohlcs=1000, archive=archive)
+    ohlc_store.update()
+
+    assert int(ohlc_store.ohlcs.open_time[0]) > int(ohlcs.open_time[100])
+    # 確定した足（最後の足以外）が欠けずに保存される
+    np.testing.assert_array_equal(archive.read_range(start_time=start_time).open_time, ohlcs.open_time[:-1])
+    np.testing.assert_array_equal(archive.read_range(start_time=start_time).values, ohlcs.values[:-1])
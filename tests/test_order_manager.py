@@ -0,0 +1,171 @@
+"""OrderManagerが、注文作成のレスポンスとWebSocketの注文の更新から注文の状態を遷移させることを確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+from typing import Any, Dict
+import time
+
+import constants
+from orders import order_manager as order_manager_module
+from orders.order_manager import OrderManager, CREATED, NEW, PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED
+from trading_api.trading_api import Order
+
+symbol = 'BTCUSD'
+
+
+def ok(order_id: str) -> Dict[str, Any]:
+    """注文作成に成功したレスポンスのJSON"""
+    return {'ret_code': 0, 'ret_msg': 'OK', 'result': {'order_id': order_id}}
+
+
+def order_info(order: Order, order_id: str, status: str, leaves_qty: int, with_link_id: bool = True) -> Dict[str, Any]:
+    """WebSocketのorderトピックで受け取る1つの注文の情報"""
+    return {
+        'order_id': order_id,
+        'order_link_id': order.order_link_id if with_link_id else '',
+        'symbol': symbol,
+        'side': order.side,
+        'order_type': order.order_type,
+        'price': '0',
+        'qty': order.qty,
+        'leaves_qty': leaves_qty,
+        'order_status': status}
+
+
+def make_manager() -> OrderManager:
+    manager : OrderManager = OrderManager(symbol=symbol)
+    manager.reconcile([])  # 起動直後の取得を済ませた状態
+    return manager
+
+
+def registered(manager: OrderManager, side: str = constants.BUY, qty: int = 100) -> Order:
+    order : Order = Order(side=side, order_type=constants.MARKET, qty=qty, price=None)
+    assert manager.register(order)
+    return order
+
+
+def test_order_moves_from_new_through_partially_filled_to_filled():
+    manager : OrderManager = make_manager()
+    order : Order = registered(manager)
+    assert order.order_status == CREATED
+    assert manager.open_qty(constants.BUY) == 100
+
+    manager.on_create_response(order.order_link_id, ok('order-1'))
+    assert manager.get('order-1') is order
+
+    manager.on_stream([order_info(order, 'order-1', NEW, 100)])
+    assert order.order_status == NEW
+    manager.on_stream([order_info(order, 'order-1', PARTIALLY_FILLED, 30)])
+    assert (order.order_status, order.leaves_qty) == (PARTIALLY_FILLED, 30)
+    assert manager.open_qty() == 30
+    manager.on_stream([order_info(order, 'order-1', FILLED, 0)])
+    assert order.order_status == FILLED
+    assert manager.open_qty() == 0
+    assert not manager.has_open_order()
+    assert manager.get('order-1') is None
+
+
+def test_partially_filled_order_can_be_cancelled_and_releases_its_qty():
+    manager : OrderManager = make_manager()
+    order : Order = registered(manager, side=constants.SELL, qty=50)
+    manager.on_create_response(order.order_link_id, ok('order-1'))
+    manager.on_stream([order_info(order, 'order-1', PARTIALLY_FILLED, 20, with_link_id=False)])  # order_idのみで引ける
+    assert manager.open_qty() == -20
+    manager.on_stream([order_info(order, 'order-1', CANCELLED, 20)])
+    assert order.order_status == CANCELLED
+    assert manager.open_qty(constants.SELL) == 0
+    assert not manager.has_open_order()
+
+
+def test_stale_update_after_a_fill_is_ignored():
+    manager : OrderManager = make_manager()
+    order : Order = registered(manager)
+    manager.on_create_response(order.order_link_id, ok('order-1'))
+    manager.on_stream([order_info(order, 'order-1', PARTIALLY_FILLED, 40)])
+    manager.on_stream([order_info(order, 'order-1', NEW, 100)])  # 順序が入れ替わった古い更新
+    assert (order.order_status, order.leaves_qty) == (PARTIALLY_FILLED, 40)
+
+
+def test_stream_update_before_the_create_response_is_applied():
+    manager : OrderManager = make_manager()
+    order : Order = registered(manager)
+    manager.on_stream([order_info(order, 'order-1', FILLED, 0)])
+    manager.on_create_response(order.order_link_id, ok('order-1'))
+    assert order.order_status == FILLED
+    assert not manager.has_open_order()
+
+
+def test_rejected_create_response_releases_the_order():
+    manager : OrderManager = make_manager()
+    order : Order = registered(manager)
+    manager.on_create_response(order.order_link_id, {'ret_code': 30031, 'ret_msg': 'insufficient balance', 'result': None})
+    assert order.order_status == REJECTED
+    assert manager.open_qty() == 0
+    assert registered(manager).order_link_id != order.order_link_id  # 同じ向きの注文を出し直せる
+
+
+def test_register_rejects_a_duplicate_order_on_the_same_side():
+    manager : OrderManager = make_manager()
+    order : Order = registered(manager)
+    duplicate : Order = Order(side=constants.BUY, order_type=constants.MARKET, qty=100, price=None)
+    assert not manager.register(duplicate)
+    assert duplicate.order_link_id is None
+    assert manager.open_qty(constants.BUY) == 100
+
+    opposite : Order = Order(side=constants.SELL, order_type=constants.MARKET, qty=100, price=None)
+    assert manager.register(opposite)  # 逆向きの注文は重複ではない
+
+    manager.on_create_response(order.order_link_id, ok('order-1'))
+    manager.on_stream([order_info(order, 'order-1', FILLED, 0)])
+    assert manager.register(Order(side=constants.BUY, order_type=constants.MARKET, qty=100, price=None))
+
+
+def test_unconfirmed_order_is_reconciled_after_the_confirm_timeout(monkeypatch):
+    manager : OrderManager = make_manager()
+    assert not manager.needs_reconcile()
+    sent_at : float = time.monotonic()
+    monkeypatch.setattr(order_manager_module.time, 'monotonic', lambda: sent_at)
+    order : Order = registered(manager)
+    manager.on_create_response(order.order_link_id, ok('order-1'))
+
+    monkeypatch.setattr(order_manager_module.time, 'monotonic', lambda: sent_at + constants.ORDER_CONFIRM_TIMEOUT - 0.1)
+    assert not manager.needs_reconcile()
+    monkeypatch.setattr(order_manager_module.time, 'monotonic', lambda: sent_at + constants.ORDER_CONFIRM_TIMEOUT + 0.1)
+    assert manager.needs_reconcile()  # 注文の更新を取りこぼした可能性がある
+
+    # REST APIで取得した一覧では一部約定している
+    active : Order = Order(
+        side=constants.BUY, order_type=constants.LIMIT, qty=100, price=29000.0, order_id='order-1',
+        order_link_id=order.order_link_id, order_status=PARTIALLY_FILLED, leaves_qty=60)
+    manager.reconcile([active])
+    assert not manager.needs_reconcile()
+    assert manager.open_qty() == 60
+    assert manager.get('order-1') is active
+
+    manager.on_stream([order_info(active, 'order-1', FILLED, 0)])
+    assert not manager.has_open_order()
+
+
+def test_confirmed_order_does_not_need_reconcile(monkeypatch):
+    manager : OrderManager = make_manager()
+    sent_at : float = time.monotonic()
+    monkeypatch.setattr(order_manager_module.time, 'monotonic', lambda: sent_at)
+    order : Order = registered(manager)
+    manager.on_create_response(order.order_link_id, ok('order-1'))
+    manager.on_stream([order_info(order, 'order-1', NEW, 100)])
+    monkeypatch.setattr(order_manager_module.time, 'monotonic', lambda: sent_at + constants.ORDER_CONFIRM_TIMEOUT + 1)
+    assert not manager.needs_reconcile()
+
+    manager.mark_stale()  # 再接続後は確認済みでも取り直す
+    assert manager.needs_reconcile()
+
+
+def test_reconcile_drops_orders_missing_from_the_active_list():
+    manager : OrderManager = make_manager()
+    order : Order = registered(manager)
+    manager.on_create_response(order.order_link_id, ok('order-1'))
+    manager.reconcile([])  # 一覧にない注文は約定、もしくはキャンセルされた
+    assert manager.open_qty() == 0
+    assert manager.get('order-1') is None
+    assert manager.register(Order(side=constants.BUY, order_type=constants.MARKET, qty=100, price=None))
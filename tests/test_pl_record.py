@@ -0,0 +1,141 @@
+"""損益の挿入と取り込みで、EquityStatsとDailyPLが全体から作り直した集計と一致することを確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+from datetime import datetime, timedelta
+from typing import Any, List, Tuple
+import sqlite3
+
+from sqlalchemy import event
+
+from profit_and_loss import base_db
+from profit_and_loss.importer import import_pl_files
+from profit_and_loss.pl_analytics import get_daily_pls, get_equity_stats
+from profit_and_loss.pl_record import PL, ProfitAndLoss
+
+start = datetime(2021, 1, 1, 0, 0)
+
+
+def make_pls(num_rows: int, offset: int = 0) -> List[PL]:
+    """5時間ごとの損益。評価額は上下させ、ドローダウンと日ごとの損益がいずれも変わるようにする"""
+    return [
+        PL(timestamp=start + timedelta(hours=5 * i), equity=1.0 + 0.01 * ((i * 7) % 11) - 0.002 * i, side='Buy')
+        for i in range(offset, offset + num_rows)]
+
+
+def analytics() -> Tuple[Any, List[Tuple[Any, ...]]]:
+    """全期間の集計と日ごとの集計を、比較できるタプルとして返却する"""
+    stats = get_equity_stats()
+    stats_values : Tuple[Any, ...] = (
+        stats.last_timestamp, stats.last_equity, stats.peak_equity, round(stats.max_drawdown, 12), stats.num_rows)
+    daily_values : List[Tuple[Any, ...]] = [
+        (daily_pl.date, daily_pl.open_equity, daily_pl.close_equity, daily_pl.min_equity, daily_pl.max_equity, daily_pl.num_rows)
+        for daily_pl in get_daily_pls()]
+    return stats_values, daily_values
+
+
+def assert_equal_to_rebuild() -> None:
+    incremental = analytics()
+    ProfitAndLoss.rebuild_analytics()
+    assert incremental == analytics()
+
+
+def count_rebuilds(monkeypatch) -> List[int]:
+    calls : List[int] = []
+    rebuild = ProfitAndLoss._rebuild_analytics
+
+    def counting_rebuild(session) -> None:
+        calls.append(1)
+        rebuild(session)
+    monkeypatch.setattr(ProfitAndLoss, '_rebuild_analytics', counting_rebuild)
+    return calls
+
+
+def write_legacy_db(path: str, pls: List[PL]) -> None:
+    """起動ごとに作成していた損益のデータベースと同じ形式のファイルを作成する"""
+    connection : sqlite3.Connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(
+            'CREATE TABLE profit_and_loss (timestamp DATETIME NOT NULL PRIMARY KEY, equity FLOAT NOT NULL, side VARCHAR(255) NOT NULL)')
+        connection.executemany(
+            'INSERT INTO profit_and_loss VALUES (?, ?, ?)',
+            [(pl.timestamp.strftime('%Y-%m-%d %H:%M:%S.%f'), pl.equity, pl.side) for pl in pls])
+    connection.close()
+
+
+def test_incremental_analytics_equal_a_full_rebuild(monkeypatch):
+    rebuilds : List[int] = count_rebuilds(monkeypatch)
+    pls : List[PL] = make_pls(60)
+    for pl in pls[:10]:
+        ProfitAndLoss.insert(pl)
+    ProfitAndLoss.bulk_insert(pls[10:30])
+    ProfitAndLoss.bulk_insert(pls[30:60] + pls[30:32])  # 同じ時刻の行は最初の行のみ挿入される
+    assert rebuilds == []  # 時刻順の挿入は差分のみで集計する
+
+    stats = get_equity_stats()
+    assert stats.num_rows == 60
+    assert stats.peak_equity == max(pl.equity for pl in pls)
+    assert sum(daily_pl.num_rows for daily_pl in get_daily_pls()) == 60
+    assert_equal_to_rebuild()
+
+
+def test_out_of_order_batch_rebuilds_the_analytics(monkeypatch):
+    pls : List[PL] = make_pls(40)
+    ProfitAndLoss.bulk_insert(pls[20:])
+    rebuilds : List[int] = count_rebuilds(monkeypatch)
+    ProfitAndLoss.bulk_insert(pls[:20])  # 最後に集計した時刻より前の行
+    assert rebuilds == [1]
+
+    stats = get_equity_stats()
+    assert stats.num_rows == 40
+    daily_pls = get_daily_pls()
+    assert daily_pls[0].date == start.date()
+    assert daily_pls[0].open_equity == pls[0].equity
+    assert_equal_to_rebuild()
+
+
+def test_importing_the_same_file_twice_is_idempotent(tmp_path):
+    legacy_paths : List[str] = [str(tmp_path / 'bybit_pl_1.sql'), str(tmp_path / 'bybit_pl_2.sql')]
+    pls : List[PL] = make_pls(30)
+    write_legacy_db(legacy_paths[0], pls[:20])
+    write_legacy_db(legacy_paths[1], pls[15:])  # 前のファイルと5行重なる
+    ProfitAndLoss.insert(pls[0])  # 既に取り込み先にある行
+
+    assert import_pl_files(legacy_paths) == 35
+    imported = analytics()
+    assert [pl.__dict__ for pl in ProfitAndLoss.get_range()] == [pl.__dict__ for pl in pls]
+    assert imported[0][-1] == 30
+
+    assert import_pl_files(legacy_paths) == 35  # 読み込みはするが、同じ時刻の行は取り込まない
+    assert [pl.__dict__ for pl in ProfitAndLoss.get_range()] == [pl.__dict__ for pl in pls]
+    assert analytics() == imported
+    assert_equal_to_rebuild()
+
+
+def test_iter_range_reads_in_keyset_pages():
+    pls : List[PL] = make_pls(25)
+    ProfitAndLoss.bulk_insert(pls)
+    statements : List[Tuple[str, Any]] = []
+
+    def record(conn, cursor, statement, parameters, context, executemany) -> None:
+        if 'FROM profit_and_loss' in statement:
+            statements.append((statement, parameters))
+    event.listen(base_db.get_engine(), 'before_cursor_execute', record)
+    try:
+        iterated : List[PL] = list(ProfitAndLoss.iter_range(batch_size=10))
+    finally:
+        event.remove(base_db.get_engine(), 'before_cursor_execute', record)
+
+    assert [pl.__dict__ for pl in iterated] == [pl.__dict__ for pl in pls]
+    assert len(statements) == 3  # 10, 10, 5行
+    # SQLiteではLIMITにOFFSETが付くが、常に0とし、読み飛ばす行は直前の時刻で絞り込む
+    assert all('OFFSET' not in statement or parameters[-1] == 0 for statement, parameters in statements)
+    assert all('profit_and_loss.timestamp >' in statement for statement, _ in statements[1:])
+
+    # 範囲の指定はget_rangeと同じ
+    range_start, range_end = pls[3].timestamp, pls[21].timestamp
+    assert [pl.__dict__ for pl in ProfitAndLoss.iter_range(range_start, range_end, batch_size=4)] == \
+        [pl.__dict__ for pl in ProfitAndLoss.get_range(range_start, range_end)] == \
+        [pl.__dict__ for pl in pls[3:21]]
+    assert list(ProfitAndLoss.iter_range(pls[-1].timestamp + timedelta(hours=1))) == []
@@ -0,0 +1,81 @@
+"""RequestSchedulerが、privateのエンドポイントごとの制限と、サーバーから通知されたレート制限をエンドポイントごとに反映することを確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+from typing import List
+import threading
+import time
+
+import constants
+from trading_api.rate_limiter import (
+    RequestScheduler, PUBLIC, PRIVATE, PRIORITY_ORDER, PRIORITY_ACCOUNT, PRIORITY_MARKET_DATA)
+from simulator.replay import unlimited_rate_limits
+
+reset_after = 0.5
+
+
+def exhaust(scheduler: RequestScheduler, endpoint: str) -> None:
+    scheduler.record_response(
+        endpoint, {'rate_limit_status': 0, 'rate_limit_reset_ms': int((time.time() + reset_after) * 1000)}, {})
+
+
+def test_exhausted_endpoint_does_not_hold_back_orders():
+    scheduler : RequestScheduler = RequestScheduler(limits=unlimited_rate_limits)
+    exhaust(scheduler, 'private_position_list')
+    started_at : float = time.monotonic()
+    scheduler.acquire(PRIVATE, PRIORITY_ORDER, 'private_order_create')
+    scheduler.acquire(PUBLIC, PRIORITY_MARKET_DATA, 'public_kline_list')
+    assert time.monotonic() - started_at < 0.1
+
+
+def test_exhausted_endpoint_waits_until_reset_without_blocking_the_queue():
+    scheduler : RequestScheduler = RequestScheduler(limits=unlimited_rate_limits)
+    exhaust(scheduler, 'private_position_list')
+    waited : List[float] = []
+
+    def acquire_position_list() -> None:
+        started_at : float = time.monotonic()
+        scheduler.acquire(PRIVATE, PRIORITY_ORDER, 'private_position_list')
+        waited.append(time.monotonic() - started_at)
+
+    thread : threading.Thread = threading.Thread(target=acquire_position_list)
+    thread.start()
+    time.sleep(0.05)
+    started_at : float = time.monotonic()
+    scheduler.acquire(PRIVATE, PRIORITY_ORDER, 'private_order_create')  # 待機中のリクエストに妨げられない
+    assert time.monotonic() - started_at < 0.1
+    thread.join(timeout=5.0)
+    assert waited[0] >= reset_after - 0.1
+
+
+def test_remaining_requests_do_not_block():
+    scheduler : RequestScheduler = RequestScheduler(limits=unlimited_rate_limits)
+    scheduler.record_response(
+        'public_kline_list', {}, {'X-Bapi-Limit-Status': '3', 'X-Bapi-Limit-Reset-Timestamp': str(int(time.time() * 1000) + 5000)})
+    started_at : float = time.monotonic()
+    scheduler.acquire(PUBLIC, PRIORITY_MARKET_DATA, 'public_kline_list')
+    assert time.monotonic() - started_at < 0.1
+
+
+def test_private_endpoints_have_separate_budgets():
+    scheduler : RequestScheduler = RequestScheduler(limits={
+        PUBLIC: (1e9, 1e9), PRIVATE: (1.0, 1.0), 'private_position_list': (1.0, 2.0), 'private_order_create': (1.0, 1.0)})
+    started_at : float = time.monotonic()
+    for _ in range(2):
+        scheduler.acquire(PRIVATE, PRIORITY_ACCOUNT, 'private_position_list')
+    # ポジションの取得で使い切っても、注文とそれ以外のprivateのエンドポイントは待たない
+    scheduler.acquire(PRIVATE, PRIORITY_ORDER, 'private_order_create')
+    scheduler.acquire(PRIVATE, PRIORITY_ACCOUNT, 'private_wallet_balance')
+    assert time.monotonic() - started_at < 0.1
+
+    # 同じエンドポイントは、そのエンドポイントの制限で待つ
+    scheduler.acquire(PRIVATE, PRIORITY_ACCOUNT, 'private_position_list')
+    assert time.monotonic() - started_at >= 0.9
+
+
+def test_default_limits_budget_each_private_endpoint():
+    scheduler : RequestScheduler = RequestScheduler()
+    for endpoint, (_, capacity) in constants.PRIVATE_ENDPOINT_RATE_LIMITS.items():
+        assert scheduler._buckets[endpoint].capacity == capacity
+    assert scheduler._buckets[PRIVATE].rate == constants.PRIVATE_RATE_LIMIT[0]
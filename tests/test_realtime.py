@@ -0,0 +1,76 @@
+"""RealtimeClientを、記録したメッセージを再生するローカルのWebSocketサーバー（FakeRealtimeServer）に接続して確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+from typing import Any, Dict, List
+import os
+import threading
+import time
+
+from trading_api.realtime import RealtimeClient
+from trading_api.trading_api import OhlcBuffer, Position
+from simulator.fake_realtime_server import FakeRealtimeServer
+
+frames_path = os.path.join(os.path.dirname(__file__), 'data', 'realtime_frames.json')
+
+
+def wait_until(condition, timeout: float = 10.0) -> bool:
+    deadline : float = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_realtime_client_dispatches_recorded_frames_and_reconnects():
+    server : FakeRealtimeServer = FakeRealtimeServer.from_file(frames_path)
+    server.start()
+    klines : List[OhlcBuffer] = []
+    positions : List[Position] = []
+    orders : List[List[Dict[str, Any]]] = []
+    stop_orders : List[List[Dict[str, Any]]] = []
+    reconnects : List[int] = []
+    connection_changes : List[bool] = []
+    client : RealtimeClient = RealtimeClient(
+        on_kline={('BTCUSD', '1'): klines.append},
+        endpoint=server.url,
+        on_position={'BTCUSD': positions.append},
+        on_order={'BTCUSD': orders.append},
+        on_stop_order={'BTCUSD': stop_orders.append},
+        on_reconnect=lambda: reconnects.append(len(klines)),
+        on_connection_change=connection_changes.append)
+    thread : threading.Thread = threading.Thread(target=client.run_forever, daemon=True)
+    thread.start()
+    try:
+        assert server.wait_for_sessions(timeout=10.0)
+        assert wait_until(lambda: len(klines) == 3)
+    finally:
+        client.stop()
+        server.stop()
+    thread.join(timeout=5.0)
+
+    # ローソク足: 2本目のメッセージは確定した足と新しい足を含む
+    assert [ohlcs.open_time.tolist() for ohlcs in klines] == [[1609459200], [1609459200, 1609459260], [1609459320]]
+    assert klines[1].column('close').tolist() == [29005.0, 29012.0]
+    assert klines[1].column('low').tolist() == [28980.0, 29001.0]
+
+    assert len(positions) == 1
+    assert (positions[0].side, positions[0].size) == ('Buy', 100)
+    assert positions[0].entry_price == 29003.5
+    assert positions[0].wallet_balance == 0.1
+
+    # 注文は通貨ごとに振り分けられ、購読していない通貨（ETHUSD）の注文は捨てられる
+    assert [[info['order_id'] for info in infos] for infos in orders] == [['2d7b6c48-3f46-4fb4-9a8f-4a973eb5c418']]
+    assert orders[0][0]['order_status'] == 'Filled'
+    assert len(stop_orders) == 1 and stop_orders[0][0]['trigger_price'] == '28900.5'
+
+    # 最初のセッションの後に切断され、再接続時に1度だけon_reconnectが呼ばれる
+    assert server.num_connections == 2
+    assert reconnects == [2]
+    assert connection_changes == [True, False, True, False]  # 切断と、stopによる終了を通知する
+    subscribes : List[Dict[str, Any]] = [msg for msg in server.received if msg.get('op') == 'subscribe']
+    assert len(subscribes) == 2
+    assert subscribes[0]['args'] == ['klineV2.1.BTCUSD', 'position', 'order', 'stop_order']
+    assert sum(msg.get('op') == 'auth' for msg in server.received) == 2
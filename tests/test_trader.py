@@ -0,0 +1,180 @@
+"""Trader.trade_onceを、SimulatedExchangeに対して実際のFeaturesCreatorとともに1本ずつ動かし、損切りの逆指値注文を確かめる
+
+リポジトリのルートで以下のように実行する
+    python -m pytest tests
+"""
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+import constants
+from trading_api.trading_api import AccountStateCache, ApiClient, OhlcBuffer, round_to_tick
+from trading_api.rate_limiter import RequestScheduler
+from trading_brain.feature_creation import FeaturesCreator
+from orders.orders import Trader
+from simulator.exchange import SimulatedExchange
+from simulator.replay import unlimited_rate_limits
+
+symbol = 'BTCUSD'
+start_time = 1609459200
+entry_price = 30000.0
+warmup_range = 20.0  # ウォームアップの足の高値と安値の差。ATRはこの値となる
+
+
+class TraderHarness:
+    """ウォームアップの足の後に、指定した足を1本ずつ流してTrader.trade_onceを呼ぶ
+
+    ウォームアップの足は終値entry_price、高値と安値の差warmup_rangeで一定とする。
+    売買の判断はjudgementを置き換えて、signalsの値を先頭から順に返却させる
+    """
+    def __init__(self, bars: List[Tuple[float, float]]) -> None:
+        """
+        Parameters
+        ----------
+        bars : List[Tuple[float, float]]
+            ウォームアップの後に流す足の(終値, 高値と安値の差)
+        """
+        closes : List[float] = [entry_price] * constants.NUMBER_OF_OHLCS + [close for close, _ in bars]
+        ranges : List[float] = [warmup_range] * constants.NUMBER_OF_OHLCS + [bar_range for _, bar_range in bars]
+        close : np.ndarray = np.array(closes)
+        half : np.ndarray = np.array(ranges) / 2
+        ohlcs : OhlcBuffer = OhlcBuffer(capacity=len(close))
+        ohlcs.extend(
+            start_time + 60 * np.arange(len(close), dtype=np.int64),
+            np.column_stack([close, close + half, close - half, close]))
+        self.exchange : SimulatedExchange = SimulatedExchange(
+            symbol=symbol, ohlcs=ohlcs, cursor=constants.NUMBER_OF_OHLCS - 1)
+        self.api_client : ApiClient = ApiClient(
+            account_state_cache=AccountStateCache(),
+            request_scheduler=RequestScheduler(limits=unlimited_rate_limits),
+            client=self.exchange,
+            clock=self.exchange.clock)
+        self.features_creator : FeaturesCreator = FeaturesCreator(
+            api_client=self.api_client, symbol=symbol, time_interval=constants.DURATION_1M, uses_archive=False)
+        self.trader : Trader = Trader(api_client=self.api_client, features_creator=self.features_creator)
+        self.subscribe()
+        self.api_client.account_state_cache.set_streaming(True)  # simulator.replayと同じく、ポジションは約定の度に通知される
+        self.signals : List[float] = []
+        self.trader.algorithms.judgement.judge = lambda position_side, bars: self.signals.pop(0) if self.signals else 0.0
+
+    def subscribe(self, receives_stop_orders: bool = True) -> None:
+        self.exchange.subscribe(
+            on_order=self.trader.on_order,
+            on_stop_order=self.trader.on_stop_order if receives_stop_orders else None,
+            on_position=self.trader.on_position)
+
+    def step(self) -> None:
+        """次の足に進め、WebSocketで受け取った場合と同じ経路で特徴量を更新してから判断する"""
+        assert self.exchange.advance()
+        self.features_creator.update_from_stream(self.exchange.current_ohlc())
+        self.trader.trade_once(self.features_creator.channel.latest)
+
+    def open_position(self, side: str, qty: int = 100) -> None:
+        """Traderの外で出した成行注文でポジションを持つ（再起動前から持っていたポジションに相当する）"""
+        self.exchange.private_order_create(symbol=symbol, side=side, order_type=constants.MARKET, qty=qty)
+
+    def stop_orders(self) -> List[Dict[str, Any]]:
+        """取引所に置かれている逆指値注文"""
+        return self.exchange.private_stoporder_list(symbol=symbol).json()['result']['data']
+
+    def ATR(self) -> float:
+        return self.features_creator.channel.latest.latest_bars.last('ATR')
+
+
+def expected_stop_px(harness: TraderHarness) -> float:
+    return round_to_tick(symbol, entry_price - harness.ATR() * constants.STOP_RANGE)
+
+
+def test_stop_order_is_placed_on_entry():
+    harness : TraderHarness = TraderHarness(bars=[(entry_price, warmup_range)] * 3)
+    harness.signals = [1.0]
+    harness.step()
+
+    position = harness.api_client.get_position(symbol)
+    assert (position.side, position.entry_price) == (constants.BUY, entry_price)
+    (stop_order,) = harness.stop_orders()
+    assert (stop_order['side'], stop_order['qty']) == (constants.SELL, position.size)
+    assert stop_order['stop_px'] == expected_stop_px(harness)
+    assert stop_order['close_on_trigger']
+
+
+def test_stop_order_is_replaced_only_when_atr_moves_enough():
+    # ATRが1本ごとに2ずつ広がる足の後、呼値1つ分だけ損切りの価格が動く足を流す
+    widening : List[Tuple[float, float]] = [(entry_price, warmup_range + 10)] * 5
+    steady : List[Tuple[float, float]] = [(entry_price, warmup_range + 11)]
+    harness : TraderHarness = TraderHarness(bars=[(entry_price, warmup_range)] + widening + steady)
+    harness.signals = [1.0]
+    harness.step()
+    (stop_order,) = harness.stop_orders()
+    stop_order_id : str = stop_order['stop_order_id']
+
+    for _ in widening:
+        harness.step()
+        (stop_order,) = harness.stop_orders()
+        assert stop_order['stop_order_id'] == stop_order_id  # 置き直さずに変更する
+        assert stop_order['stop_px'] == expected_stop_px(harness)
+
+    last_stop_px : float = stop_order['stop_px']
+    harness.step()
+    # 損切りの価格の変化がATRのSTOP_REPLACE_RATE未満の場合は変更しない
+    assert abs(expected_stop_px(harness) - last_stop_px) < harness.ATR() * constants.STOP_REPLACE_RATE
+    assert expected_stop_px(harness) != last_stop_px
+    (stop_order,) = harness.stop_orders()
+    assert stop_order['stop_px'] == last_stop_px
+
+
+def test_duplicate_and_opposite_stop_orders_are_cancelled():
+    harness : TraderHarness = TraderHarness(bars=[(entry_price, warmup_range)] * 2)
+    harness.open_position(constants.BUY)
+    for side, stop_px in [(constants.SELL, entry_price - 100), (constants.SELL, entry_price - 200), (constants.BUY, entry_price + 100)]:
+        harness.exchange.private_stoporder_create(
+            symbol=symbol, side=side, order_type=constants.MARKET, qty=100, stop_px=stop_px, base_price=entry_price)
+    harness.step()
+
+    (stop_order,) = harness.stop_orders()
+    assert (stop_order['side'], stop_order['qty']) == (constants.SELL, 100)
+    assert stop_order['stop_px'] == expected_stop_px(harness)
+
+
+def test_position_is_closed_at_market_when_price_is_past_the_stop():
+    # 損切りの価格（entry_price - ATR * STOP_RANGE）を下回った足。逆指値注文はまだ置かれていない
+    harness : TraderHarness = TraderHarness(bars=[(entry_price - 100, warmup_range)])
+    harness.open_position(constants.BUY)
+    harness.step()
+
+    assert harness.exchange.private_position_list(symbol=symbol).json()['result']['side'] == constants.NONE
+    fill : Dict[str, Any] = harness.exchange.fills[-1]
+    assert (fill['side'], fill['qty'], fill['price']) == (constants.SELL, 100, entry_price - 100)
+    assert harness.stop_orders() == []
+    assert not harness.trader.order_manager.has_open_order()
+
+
+def test_stop_order_book_is_reconciled_after_mark_stale():
+    harness : TraderHarness = TraderHarness(
+        bars=[(entry_price, warmup_range)] * 3 + [(entry_price, warmup_range + 10)] * 2)
+    harness.signals = [1.0]
+    harness.step()
+    assert len(harness.stop_orders()) == 1
+
+    # 切断中にキャンセルされ、WebSocketの更新を受け取れなかった
+    harness.subscribe(receives_stop_orders=False)
+    harness.exchange.private_stoporder_cancelall(symbol=symbol)
+    harness.subscribe()
+    harness.step()
+    assert harness.stop_orders() == []  # ローカルには残っているため置き直さない
+
+    harness.trader.on_reconnect()  # mark_staleを呼ぶ
+    harness.step()
+    (stop_order,) = harness.stop_orders()
+    assert stop_order['stop_px'] == expected_stop_px(harness)
+
+    # 変更に失敗した場合もmark_staleし、次の周期で照合し直して置き直す
+    harness.subscribe(receives_stop_orders=False)
+    harness.exchange.private_stoporder_cancelall(symbol=symbol)
+    harness.subscribe()
+    harness.step()  # ATRが広がり変更を試みるが、注文が存在しない
+    assert harness.trader.stop_order_book.needs_reconcile
+    assert harness.stop_orders() == []
+    harness.step()
+    (stop_order,) = harness.stop_orders()
+    assert stop_order['stop_px'] == expected_stop_px(harness)
@@ -0,0 +1,282 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Union
+import asyncio
+import hashlib
+import hmac
+import time
+
+import aiohttp
+import numpy as np
+
+import constants
+import settings
+from trading_api.trading_api import (
+    Order, OhlcBuffer, Position, number_of_ohlcs_to_get, parse_ohlcs_into, parse_order,
+    parse_position, unit_minutes, unit_time_to_get_a_ohlc)
+from trading_api.rate_limiter import (
+    RequestScheduler, shared_request_scheduler, PUBLIC, PRIVATE,
+    PRIORITY_ORDER, PRIORITY_ACCOUNT, PRIORITY_MARKET_DATA)
+from logger import Logger
+from utils.metrics import metrics
+
+logger = Logger()
+
+base_url_mainnet = 'https://api.bybit.com'
+base_url_testnet = 'https://api-testnet.bybit.com'
+
+max_connections = 8  # 1つのホストに対して同時に張るkeep-aliveの接続数
+keepalive_timeout = 60
+
+
+class AsyncApiClient:
+    """bybitのAPIをasyncioで使用するクラス。ApiClientと同じメソッドを持つ
+
+    1つのkeep-aliveな接続プールを使い回し、ローソク足の複数ページを並行して取得する。
+    async withで使用し、抜ける際に接続プールを閉じる
+        e.g.) async with AsyncApiClient() as api_client:
+                  ohlcs = await api_client.get_ohlcs(symbol='BTCUSD')
+
+    Attributes
+    ----------
+    base_url : str
+        接続先のURL。テスト時はローカルのHTTPサーバーを指定できる
+    request_scheduler : RequestScheduler
+        レート制限を超えないようにリクエストを待機させるインスタンス。ApiClientと共有する
+
+    Methods
+    -------
+    get_available_balance -> float
+        現在の残高（Bitcoinの残高など）を取得する
+    get_ohlcs -> OhlcBuffer
+        現在時刻から指定の分数間のローソク足情報を取得する
+    get_ohlcs_since -> OhlcBuffer
+        指定の時刻から現在時刻までのローソク足情報を取得する
+    get_position -> Position
+        現在のポジション情報を取得する
+    get_active_orders -> List[Order | None]
+        現在確約していない全ての注文のリストで返却する。存在しなければ空リストを返却する
+    create_order -> Dict[str, Any]
+        注文を出す
+    cancel_all_active_orders -> None:
+        現在確約していない全ての注文をキャンセルする
+    """
+    def __init__(
+            self,
+            base_url: Union[str, None] = None,
+            request_scheduler: Union[RequestScheduler, None] = None) -> None:
+        if base_url is None:
+            base_url = base_url_testnet if settings.is_testnet else base_url_mainnet
+        if request_scheduler is None:
+            request_scheduler = shared_request_scheduler
+        self.base_url : str = base_url
+        self.request_scheduler : RequestScheduler = request_scheduler
+        if settings.is_testnet:
+            self._api_key, self._api_secret_key = settings.testnet_api_key, settings.tesetnet_api_secret_key
+        else:
+            self._api_key, self._api_secret_key = settings.api_key, settings.api_secret_key
+        self._session : Union[aiohttp.ClientSession, None] = None
+
+    async def __aenter__(self) -> 'AsyncApiClient':
+        connector : aiohttp.TCPConnector = aiohttp.TCPConnector(
+            limit_per_host=max_connections,
+            keepalive_timeout=keepalive_timeout)
+        self._session = aiohttp.ClientSession(connector=connector)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """接続プールを閉じる"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _sign(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """認証が必要なリクエストのパラメータに、api_key, timestamp, 署名を加える"""
+        params = {key: value for key, value in params.items() if value is not None}
+        params['api_key'] = self._api_key
+        params['timestamp'] = int(time.time() * 1000)
+        query : str = '&'.join(f'{key}={params[key]}' for key in sorted(params))
+        params['sign'] = hmac.new(self._api_secret_key.encode(), query.encode(), hashlib.sha256).hexdigest()
+        return params
+
+    async def _request(
+            self,
+            method: str,
+            path: str,
+            params: Dict[str, Any],
+            is_private: bool,
+            priority: int) -> Dict[str, Any]:
+        """レート制限の範囲内でリクエストを送り、レスポンスのJSONを返却する"""
+        kind : str = PRIVATE if is_private else PUBLIC
+        # ApiClient（pybybitのメソッド名）と同じ名前で扱う e.g.) /v2/private/order/cancelAll -> private_order_cancelall
+        endpoint : str = path.split('/', 2)[2].replace('/', '_').replace('-', '').lower()
+        # 待機はスレッドで行い、イベントループを止めない
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.request_scheduler.acquire, kind, priority, endpoint)
+        if is_private:
+            params = self._sign(params)  # 待機後に署名し、timestampを送信時刻に合わせる
+        if method == 'GET':
+            request = self._session.get(self.base_url + path, params=params)
+        else:
+            request = self._session.post(self.base_url + path, json=params)
+        with metrics.span(f'api_request_seconds_{endpoint}'):
+            async with request as resp:
+                resp_json : Dict[str, Any] = await resp.json(content_type=None)
+        self.request_scheduler.record_response(endpoint, resp_json, resp.headers)
+        if resp_json.get('ret_code', 0) != 0:
+            logger.error(f"request failed: {path} {resp_json.get('ret_msg')}", exc_info=False)
+        return resp_json
+
+    async def get_available_balance(self, coin: str) -> float:
+        """現在の残高（Bitcoinの残高など）を取得する
+
+        Parameters
+        ----------
+        coin : str
+            残高を取得するコイン e.g.) BTC
+
+        Returns
+        -------
+        float
+            現在の残高（Bitcoinの残高など）
+        """
+        resp_json : Dict[str, Any] = await self._request(
+            'GET', '/v2/private/wallet/balance', {'coin': coin}, is_private=True, priority=PRIORITY_ACCOUNT)
+        return resp_json['result'][coin]['available_balance']
+
+    async def get_ohlcs(
+            self,
+            symbol: str,
+            time_interval: str = unit_time_to_get_a_ohlc,
+            num_ohlcs: int = number_of_ohlcs_to_get) -> OhlcBuffer:
+        """現在時刻から指定の分数間のローソク足情報を取得する
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
+        time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
+            ローソク足を取得する単位時間
+        num_ohlcs : int
+            取得するohlcの個数
+
+        Returns
+        -------
+        OhlcBuffer
+            現在時刻から指定の単位時間間のローソク足情報
+        """
+        delta : timedelta = timedelta(minutes=num_ohlcs*unit_minutes[time_interval])
+        start_time : int = int((datetime.now() - delta).timestamp())
+        return await self.get_ohlcs_since(symbol=symbol, start_time=start_time, time_interval=time_interval)
+
+    async def get_ohlcs_since(
+            self,
+            symbol: str,
+            start_time: int,
+            time_interval: str = unit_time_to_get_a_ohlc) -> OhlcBuffer:
+        """指定の時刻から現在時刻までのローソク足情報を取得する。
+        200個ごとのページを並行して取得し、重複する足を取り除いて時刻順に並べる
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
+        start_time : int
+            取得を開始する時刻のタイムスタンプ。この時刻に始まるローソク足も含めて取得する
+        time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
+            ローソク足を取得する単位時間
+
+        Returns
+        -------
+        OhlcBuffer
+            指定の時刻から現在時刻までのローソク足情報
+        """
+        now : int = int(datetime.now().timestamp())
+        page_seconds : int = 200 * 60 * unit_minutes[time_interval]  # 1ページで取得できる時間
+        page_start_times : List[int] = list(range(start_time, now, page_seconds))
+        pages : List[Dict[str, Any]] = await asyncio.gather(*[
+            self._request(
+                'GET',
+                '/v2/public/kline/list',
+                {'symbol': symbol, 'interval': time_interval, 'from': page_start_time},
+                is_private=False,
+                priority=PRIORITY_MARKET_DATA)
+            for page_start_time in page_start_times])
+
+        fetched : OhlcBuffer = OhlcBuffer(capacity=max(200 * len(pages), 1))
+        for page in pages:
+            parse_ohlcs_into(fetched, page['result'] or [])
+        # ページの境界で重複した足を取り除き、時刻順に並べる（後から取得した足を優先する）
+        reversed_open_time : np.ndarray = fetched.open_time[::-1]
+        _, reversed_index = np.unique(reversed_open_time, return_index=True)
+        index : np.ndarray = len(fetched) - 1 - reversed_index
+        ohlcs : OhlcBuffer = OhlcBuffer(capacity=max(len(index), 1))
+        ohlcs.extend(fetched.open_time[index], fetched.values[index])
+        return ohlcs
+
+    async def get_position(self, symbol: str) -> Position:
+        """現在のポジション情報を取得する
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
+
+        Returns
+        -------
+        Position
+            現在のポジション情報。ポジションを持っていない時のsideは'None'
+        """
+        resp_json : Dict[str, Any] = await self._request(
+            'GET', '/v2/private/position/list', {'symbol': symbol}, is_private=True, priority=PRIORITY_ACCOUNT)
+        return parse_position(resp_json['result'])
+
+    async def get_active_orders(self, symbol: str) -> List[Union[Order, None]]:
+        """現在確約していない全ての注文のリストで返却する。存在しなければ空リストを返却する
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
+
+        Returns
+        -------
+        List[Union[Order, None]]
+            現在確約していない全ての注文のリスト。存在しなければ空リスト
+        """
+        resp_json : Dict[str, Any] = await self._request(
+            'GET', '/v2/private/order/list', {'symbol': symbol, 'order_status': 'New,PartiallyFilled'},
+            is_private=True, priority=PRIORITY_ACCOUNT)
+        return [parse_order(order_info) for order_info in resp_json['result']['data'] or []]
+
+    async def create_order(self, symbol: str, order: Order) -> Dict[str, Any]:
+        """注文を出す
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
+        order : Order
+            出す注文の情報
+
+        Returns
+        -------
+        Dict[str, Any]
+            レスポンスのJSON
+        """
+        params : Dict[str, Any] = {
+            'symbol': symbol,
+            'qty': order.qty,
+            'side': order.side,
+            'order_type': order.order_type,
+            'price': order.price,
+            'time_in_force': constants.GOOD_TILL_CANCEL}
+        if order.order_link_id is not None:
+            params['order_link_id'] = order.order_link_id
+        return await self._request('POST', '/v2/private/order/create', params, is_private=True, priority=PRIORITY_ORDER)
+
+    async def cancel_all_active_orders(self, symbol: str) -> None:
+        """現在確約していない全ての注文をキャンセルする"""
+        await self._request('POST', '/v2/private/order/cancelAll', {'symbol': symbol}, is_private=True, priority=PRIORITY_ORDER)
@@ -0,0 +1,143 @@
+from typing import Dict, Union
+import os
+
+import numpy as np
+
+from trading_api.trading_api import OhlcBuffer, unit_time_to_get_a_ohlc
+
+archive_folder_path = 'candles'
+
+# 列ごとのファイル名と型。リトルエンディアンの生の配列として追記する
+column_dtypes : Dict[str, np.dtype] = {
+    'open_time': np.dtype('<i8'),
+    'open': np.dtype('<f8'),
+    'high': np.dtype('<f8'),
+    'low': np.dtype('<f8'),
+    'close': np.dtype('<f8'),
+}
+
+
+class CandleArchive:
+    """確定したローソク足を、通貨・単位時間ごとにディスクへ保存するクラス
+
+    列ごとに1つのバイナリファイル（candles/{symbol}/{time_interval}/{列名}.bin）へ追記のみを行い、
+    読み込みはnp.memmapで行うため、全体をメモリに読み込まずに参照できる。
+    時刻による範囲の検索は、open_timeの列に対する二分探索で行う
+
+    追記の途中で終了した場合に備え、行数は最も短い列のファイルに合わせる
+
+    Attributes
+    ----------
+    symbol : str
+        通貨 e.g.) BTCUSD
+    time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
+        ローソク足の単位時間
+    folder_path : str
+        列ごとのファイルを置くフォルダ
+
+    Methods
+    -------
+    last_open_time -> int | None
+        保存している最後のローソク足の取得時刻のタイムスタンプ
+    append -> None
+        保存している最後の足より新しいローソク足を追記する
+    read_range -> OhlcBuffer
+        指定の時刻の範囲のローソク足を読み込む
+    read_last -> OhlcBuffer
+        最後のn個のローソク足を読み込む
+    """
+    def __init__(
+            self,
+            symbol: str,
+            time_interval: str = unit_time_to_get_a_ohlc,
+            folder_path: Union[str, None] = None) -> None:
+        self.symbol : str = symbol
+        self.time_interval : str = time_interval
+        if folder_path is None:
+            folder_path = os.path.join(archive_folder_path, symbol, time_interval)
+        self.folder_path : str = folder_path
+        os.makedirs(self.folder_path, exist_ok=True)
+        self._columns : Dict[str, np.memmap] = {}
+        self._num_rows : int = 0
+        self._open_files()
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.folder_path, f'{name}.bin')
+
+    def _open_files(self) -> None:
+        """列ごとのファイルをnp.memmapで開き直す"""
+        sizes : Dict[str, int] = {
+            name: os.path.getsize(self._path(name)) // dtype.itemsize if os.path.exists(self._path(name)) else 0
+            for name, dtype in column_dtypes.items()}
+        self._num_rows = min(sizes.values())
+        self._columns = {}
+        if self._num_rows == 0:
+            return None
+        for name, dtype in column_dtypes.items():
+            self._columns[name] = np.memmap(self._path(name), dtype=dtype, mode='r', shape=(self._num_rows,))
+
+    def last_open_time(self) -> Union[int, None]:
+        """保存している最後のローソク足の取得時刻のタイムスタンプ。空の場合はNone"""
+        if self._num_rows == 0:
+            return None
+        return int(self._columns['open_time'][-1])
+
+    def append(self, ohlcs: OhlcBuffer) -> None:
+        """保存している最後の足より新しいローソク足を追記する。確定した足のみを渡すこと
+
+        Parameters
+        ----------
+        ohlcs : OhlcBuffer
+            追記するローソク足。古い順に並ぶ
+        """
+        last_open_time = self.last_open_time()
+        start : int = 0 if last_open_time is None else int(np.searchsorted(ohlcs.open_time, last_open_time, side='right'))
+        if start == len(ohlcs):
+            return None
+        new_columns : Dict[str, np.ndarray] = {'open_time': ohlcs.open_time[start:]}
+        for name in OhlcBuffer.ohlc_columns:
+            new_columns[name] = ohlcs.column(name)[start:]
+        # 途中で終了した場合に行数の合わない列が残らないよう、各列を保存済みの行数に切り詰めてから追記する
+        self._columns = {}  # 書き込み中のファイルへのmemmapを閉じる
+        for name, dtype in column_dtypes.items():
+            with open(self._path(name), 'ab') as f:
+                f.truncate(self._num_rows * dtype.itemsize)
+                f.write(np.ascontiguousarray(new_columns[name], dtype=dtype).tobytes())
+        self._open_files()
+
+    def _slice(self, start: int, end: int) -> OhlcBuffer:
+        """[start, end)行目をOhlcBufferにコピーする"""
+        ohlcs : OhlcBuffer = OhlcBuffer(capacity=max(end - start, 1))
+        if end > start:
+            values : np.ndarray = np.column_stack([self._columns[name][start:end] for name in OhlcBuffer.ohlc_columns])
+            ohlcs.extend(np.asarray(self._columns['open_time'][start:end]), values)
+        return ohlcs
+
+    def read_range(self, start_time: int, end_time: Union[int, None] = None) -> OhlcBuffer:
+        """指定の時刻の範囲のローソク足を読み込む
+
+        Parameters
+        ----------
+        start_time : int
+            範囲の開始時刻のタイムスタンプ。この時刻に始まるローソク足も含む
+        end_time : int | None
+            範囲の終了時刻のタイムスタンプ。この時刻に始まるローソク足は含まない。Noneの場合は最後まで
+
+        Returns
+        -------
+        OhlcBuffer
+            指定の時刻の範囲のローソク足
+        """
+        if self._num_rows == 0:
+            return OhlcBuffer(capacity=1)
+        open_time : np.memmap = self._columns['open_time']
+        start : int = int(np.searchsorted(open_time, start_time, side='left'))
+        end : int = self._num_rows if end_time is None else int(np.searchsorted(open_time, end_time, side='left'))
+        return self._slice(start, end)
+
+    def read_last(self, num_ohlcs: int) -> OhlcBuffer:
+        """最後のnum_ohlcs個のローソク足を読み込む"""
+        return self._slice(max(self._num_rows - num_ohlcs, 0), self._num_rows)
@@ -0,0 +1,141 @@
+from typing import Union
+
+import numpy as np
+
+from trading_api.trading_api import ApiClient, OhlcBuffer, unit_minutes, unit_time_to_get_a_ohlc, number_of_ohlcs_to_get
+from trading_api.candle_archive import CandleArchive
+
+
+class OhlcStore:
+    """取得済みのローソク足を保持し、新しいローソク足のみをAPIから取得して更新するクラス
+
+    Attributes
+    ----------
+    api_client : ApiClient
+        bybitAPIラッパーインスタンス
+    symbol : str
+        通貨 e.g.) BTCUSD
+    time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
+        ローソク足の単位時間
+    max_ohlcs : int
+        保持するローソク足の最大個数。超えた分は古いものから破棄する
+    ohlcs : OhlcBuffer
+        保持しているローソク足。古い順に並ぶ
+    archive : CandleArchive | None
+        確定したローソク足を保存するディスク上のアーカイブ。指定した場合は起動時にここから読み込み、
+        足りない期間のみをAPIから取得する
+
+    Methods
+    -------
+    update -> OhlcBuffer
+        最後に保持しているローソク足以降の情報を取得し、保持しているローソク足を更新する
+    merge -> None
+        受け取ったローソク足を、保持しているローソク足に反映する。
+        アーカイブとの間に欠けた期間がある場合は、先にREST APIで取得してアーカイブに追記する
+    """
+    def __init__(
+            self,
+            api_client: ApiClient,
+            symbol: str,
+            time_interval: str = unit_time_to_get_a_ohlc,
+            max_ohlcs: int = number_of_ohlcs_to_get,
+            archive: Union[CandleArchive, None] = None) -> None:
+        self.api_client : ApiClient = api_client
+        self.symbol : str = symbol
+        self.time_interval : str = time_interval
+        self.max_ohlcs : int = max_ohlcs
+        self.ohlcs : OhlcBuffer = OhlcBuffer(capacity=max_ohlcs)
+        self.archive : Union[CandleArchive, None] = archive
+
+    def update(self) -> OhlcBuffer:
+        """最後に保持しているローソク足以降の情報を取得し、保持しているローソク足を更新する。
+        初回のみmax_ohlcs個のローソク足をまとめて取得する。
+        アーカイブがある場合は、初回もアーカイブの最後の足以降（最大でmax_ohlcs個）のみを取得する
+
+        最後に保持しているローソク足は確定前の可能性があるため、その足から取得し直して置き換える
+
+        Returns
+        -------
+        OhlcBuffer
+            今回取得したローソク足。先頭の足は、保持していた最後の足を置き換えたものである場合がある。
+            アーカイブから読み込んだ場合は、読み込んだ足も含めた保持している全てのローソク足
+        """
+        has_loaded_archive : bool = False
+        if len(self.ohlcs) == 0 and self.archive is not None:
+            self._load_archive()
+            has_loaded_archive = len(self.ohlcs) > 0
+        last_open_time = self.ohlcs.last_open_time()
+        if last_open_time is None:
+            fetched_ohlcs : OhlcBuffer = self.api_client.get_ohlcs(
+                symbol=self.symbol,
+                time_interval=self.time_interval,
+                num_ohlcs=self.max_ohlcs)
+        else:
+            fetched_ohlcs : OhlcBuffer = self.api_client.get_ohlcs_since(
+                symbol=self.symbol,
+                start_time=last_open_time,
+                time_interval=self.time_interval)
+        self.merge(fetched_ohlcs)
+        if has_loaded_archive:
+            return self.ohlcs
+        return fetched_ohlcs
+
+    def merge(self, ohlcs: OhlcBuffer) -> None:
+        """REST APIやWebSocketで受け取ったローソク足を、保持しているローソク足に反映する。
+        受け取った足以降に始まる保持済みの足（確定前の最後の足）は受け取ったもので置き換える
+
+        Parameters
+        ----------
+        ohlcs : OhlcBuffer
+            受け取ったローソク足
+        """
+        if len(ohlcs) == 0:
+            return None
+        self.ohlcs.truncate_from(int(ohlcs.open_time[0]))
+        self.ohlcs.extend(ohlcs.open_time, ohlcs.values)  # 容量を超えた古い足は破棄される
+        if self.archive is not None:
+            self._append_to_archive()
+
+    def _load_archive(self) -> None:
+        """アーカイブから直近max_ohlcs個の期間内のローソク足を読み込む"""
+        unit_seconds : int = unit_minutes[self.time_interval] * 60
+        start_time : int = int(self.api_client.clock()) - self.max_ohlcs * unit_seconds  # シミュレーションでは模擬した時刻
+        archived_ohlcs : OhlcBuffer = self.archive.read_range(start_time=start_time)
+        self.ohlcs.extend(archived_ohlcs.open_time, archived_ohlcs.values)
+
+    def _append_to_archive(self) -> None:
+        """確定したローソク足（最後の足以外）のうち、アーカイブに無いものを追記する"""
+        archived_open_time = self.archive.last_open_time()
+        start : int = 0
+        if archived_open_time is not None:
+            start = int(np.searchsorted(self.ohlcs.open_time, archived_open_time, side='right'))
+            unit_seconds : int = unit_minutes[self.time_interval] * 60
+            if start == 0 and int(self.ohlcs.open_time[0]) > archived_open_time + unit_seconds:
+                self._backfill_archive(archived_open_time + unit_seconds)
+        end : int = len(self.ohlcs) - 1
+        if start >= end:
+            return None
+        confirmed_ohlcs : OhlcBuffer = OhlcBuffer(capacity=end - start)
+        confirmed_ohlcs.extend(self.ohlcs.open_time[start:end], self.ohlcs.values[start:end])
+        self.archive.append(confirmed_ohlcs)
+
+    def _backfill_archive(self, start_time: int) -> None:
+        """アーカイブの最後の足から保持している最初の足までの間（長く停止していた期間など）をREST APIで取得し、
+        アーカイブに追記する。アーカイブに欠けた期間を残さないため
+
+        Parameters
+        ----------
+        start_time : int
+            取得を開始する時刻のタイムスタンプ。アーカイブの最後の足の次の足の時刻
+        """
+        first_open_time : int = int(self.ohlcs.open_time[0])
+        fetched_ohlcs : OhlcBuffer = self.api_client.get_ohlcs_since(
+            symbol=self.symbol,
+            start_time=start_time,
+            time_interval=self.time_interval)
+        end : int = int(np.searchsorted(fetched_ohlcs.open_time, first_open_time, side='left'))
+        if end == 0:
+            return None
+        missing_ohlcs : OhlcBuffer = OhlcBuffer(capacity=end)
+        missing_ohlcs.extend(fetched_ohlcs.open_time[:end], fetched_ohlcs.values[:end])
+        self.archive.append(missing_ohlcs)
@@ -0,0 +1,162 @@
+from typing import Any, Dict, List, Mapping, Tuple, Union
+import heapq
+import itertools
+import threading
+import time
+
+import constants
+from utils.metrics import metrics
+
+# エンドポイントの種類
+PUBLIC = 'public'
+PRIVATE = 'private'
+
+# 優先度。値が小さいほど先に送信する
+PRIORITY_ORDER = 0  # 注文の作成・キャンセル
+PRIORITY_ACCOUNT = 1  # ポジション・残高・注文一覧の取得
+PRIORITY_MARKET_DATA = 2  # ローソク足の取得
+
+
+class TokenBucket:
+    """トークンバケット方式でリクエスト数を制限するクラス
+
+    Attributes
+    ----------
+    rate : float
+        1秒あたりに補充するトークン数
+    capacity : float
+        保持できるトークンの最大数（連続して送信できるリクエスト数）
+    """
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate : float = rate
+        self.capacity : float = capacity
+        self._tokens : float = capacity
+        self._updated_at : float = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def time_until_available(self, now: float) -> float:
+        """トークンを1つ取得できるまでの秒数を返却する。取得できる場合は0"""
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def take(self) -> None:
+        """トークンを1つ消費する"""
+        self._tokens -= 1
+
+
+class RequestScheduler:
+    """全てのApiClientで共有し、bybitのレート制限を超えないようにリクエストの送信を待機させるクラス。
+    limitsにエンドポイントの名前で指定したものはエンドポイントごと、それ以外は種類（publicとprivate）ごとのトークンバケットで制限し、
+    待機中のリクエストはバケットごとに優先度の高い順（同じ優先度の場合は到着順）に送信する。
+    bybitはprivateのエンドポイントをそれぞれ別々に制限するため、既定ではconstants.PRIVATE_ENDPOINT_RATE_LIMITSを
+    エンドポイントごとに数え、ある通貨のポジションの取得が他の通貨の注文の送信を待たせないようにする。
+    bybitがレスポンスで通知するレート制限はエンドポイントごとのため、残数0を通知された場合は
+    そのエンドポイントへのリクエストのみを解除時刻まで待機させ、他のエンドポイント（注文など）は止めない
+
+    メトリクスとして、バケットごとに待機中のリクエスト数、待機時間、待機が発生した回数を記録する
+
+    Methods
+    -------
+    acquire -> None
+        リクエストを送信できるようになるまで待機する
+    record_response -> None
+        レスポンスに含まれるレート制限の情報を反映する
+    """
+    def __init__(
+            self,
+            limits: Union[Dict[str, Tuple[float, float]], None] = None) -> None:
+        if limits is None:
+            limits = {
+                PUBLIC: constants.PUBLIC_RATE_LIMIT,
+                PRIVATE: constants.PRIVATE_RATE_LIMIT,
+                **constants.PRIVATE_ENDPOINT_RATE_LIMITS}
+        # 種類（PUBLIC, PRIVATE）、もしくはエンドポイントの名前 -> トークンバケット
+        self._buckets : Dict[str, TokenBucket] = {
+            name: TokenBucket(rate=rate, capacity=capacity) for name, (rate, capacity) in limits.items()}
+        self._condition : threading.Condition = threading.Condition()
+        self._waiters : Dict[str, List[Tuple[int, int]]] = {name: [] for name in self._buckets}
+        self._sequence = itertools.count()
+        self._endpoint_blocked_until : Dict[str, float] = {}  # サーバーから残数0を通知されたエンドポイントの解除時刻
+
+    def acquire(self, kind: str, priority: int, endpoint: Union[str, None] = None) -> None:
+        """リクエストを送信できるようになるまで待機する
+
+        Parameters
+        ----------
+        kind : str = PUBLIC | PRIVATE
+            エンドポイントの種類
+        priority : int = PRIORITY_ORDER | PRIORITY_ACCOUNT | PRIORITY_MARKET_DATA
+            優先度。値が小さいほど先に送信する
+        endpoint : str | None
+            エンドポイントの名前 e.g.) public_kline_list。record_responseに渡す名前と揃える。
+            limitsにこの名前がある場合は、種類ではなくエンドポイントのトークンバケットで制限する
+        """
+        name : str = endpoint if endpoint in self._buckets else kind
+        bucket : TokenBucket = self._buckets[name]
+        waiters : List[Tuple[int, int]] = self._waiters[name]
+        entry : Tuple[int, int] = (priority, next(self._sequence))
+        started_at : float = time.monotonic()
+        with self._condition:
+            # サーバーの制限が解除されるまではキューに入らず、同じ種類の他のエンドポイントを妨げない
+            has_waited : bool = self._wait_for_endpoint(endpoint)
+            heapq.heappush(waiters, entry)
+            metrics.gauge(f'rate_limit_queue_depth_{name}').set(len(waiters))
+            while True:
+                wait_seconds : Union[float, None] = None  # 先頭でなければ、先頭が送信するまで待つ
+                if waiters[0] == entry:
+                    wait_seconds = bucket.time_until_available(time.monotonic())
+                    if wait_seconds <= 0:
+                        bucket.take()
+                        heapq.heappop(waiters)
+                        break
+                has_waited = True
+                self._condition.wait(timeout=wait_seconds)
+            metrics.gauge(f'rate_limit_queue_depth_{name}').set(len(waiters))
+            self._condition.notify_all()  # 次の先頭のリクエストを起こす
+        if has_waited:
+            metrics.counter(f'rate_limit_throttled_{name}').inc()
+        metrics.histogram(f'rate_limit_wait_seconds_{name}').observe(time.monotonic() - started_at)
+
+    def _wait_for_endpoint(self, endpoint: Union[str, None]) -> bool:
+        """エンドポイントの制限が解除されるまで待機する。self._conditionを取得した状態で呼ぶ。待機した場合はTrue"""
+        has_waited : bool = False
+        while endpoint is not None:
+            wait_seconds : float = self._endpoint_blocked_until.get(endpoint, 0.0) - time.monotonic()
+            if wait_seconds <= 0:
+                break
+            has_waited = True
+            self._condition.wait(timeout=wait_seconds)
+        return has_waited
+
+    def record_response(self, endpoint: str, resp_json: Mapping[str, Any], headers: Mapping[str, str]) -> None:
+        """レスポンスに含まれるレート制限の情報（残りのリクエスト数と解除時刻）を反映する。
+        残数が0の場合は、解除時刻までそのエンドポイントへのリクエストを待機させる
+
+        Parameters
+        ----------
+        endpoint : str
+            エンドポイントの名前 e.g.) public_kline_list
+        resp_json : Mapping[str, Any]
+            レスポンスのJSON。rate_limit_status, rate_limit_reset_msを参照する
+        headers : Mapping[str, str]
+            レスポンスヘッダー。X-Bapi-Limit-Status, X-Bapi-Limit-Reset-Timestampを参照する
+        """
+        remaining = resp_json.get('rate_limit_status', headers.get('X-Bapi-Limit-Status'))
+        reset_ms = resp_json.get('rate_limit_reset_ms', headers.get('X-Bapi-Limit-Reset-Timestamp'))
+        if remaining is None:
+            return None
+        metrics.gauge(f'rate_limit_remaining_{endpoint}').set(int(remaining))
+        if int(remaining) > 0 or reset_ms is None:
+            return None
+        reset_at : float = time.monotonic() + max(int(reset_ms) / 1000 - time.time(), 0.0)
+        with self._condition:
+            self._endpoint_blocked_until[endpoint] = max(self._endpoint_blocked_until.get(endpoint, 0.0), reset_at)
+            self._condition.notify_all()
+
+
+shared_request_scheduler = RequestScheduler()
@@ -0,0 +1,200 @@
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple, Union
+import hashlib
+import hmac
+import json
+import threading
+import time
+
+import numpy as np
+import websocket
+
+import settings
+from trading_api.trading_api import OhlcBuffer, Position
+from logger import Logger
+
+logger = Logger()
+
+endpoint_mainnet = 'wss://stream.bybit.com/realtime'
+endpoint_testnet = 'wss://stream-testnet.bybit.com/realtime'
+
+ping_interval = 20  # bybitは30秒以上メッセージがないと接続を切断するため、それより短い間隔でpingを送る
+max_reconnect_interval = 60
+
+
+class RealtimeClient:
+    """bybitのWebSocket APIからローソク足、ポジション、注文、逆指値注文の更新を受け取るクラス。
+    切断された場合は再接続し、購読していたトピックを購読し直す
+
+    1つの接続で複数の(通貨, 単位時間)のローソク足を購読し、トピックや通貨ごとに指定の関数へ振り分ける
+
+    Attributes
+    ----------
+    endpoint : str
+        接続先のURL。テスト時はローカルのWebSocketサーバーを指定できる
+    topics : List[str]
+        購読するトピック
+    on_kline : Dict[Tuple[str, str], Callable[[OhlcBuffer], None]]
+        (通貨, 単位時間)ごとの、ローソク足を受け取った際に呼び出す関数
+    on_position : Dict[str, Callable[[Position], None]]
+        通貨ごとの、ポジションの更新を受け取った際に呼び出す関数
+    on_order : Dict[str, Callable[[List[Dict[str, Any]]], None]]
+        通貨ごとの、注文の更新を受け取った際に呼び出す関数
+    on_stop_order : Dict[str, Callable[[List[Dict[str, Any]]], None]]
+        通貨ごとの、逆指値注文の更新を受け取った際に呼び出す関数
+    on_reconnect : Callable[[], None] | None
+        再接続した際に呼び出す関数。切断中に取りこぼした情報をREST APIで補うために用いる
+    on_connection_change : Callable[[bool], None] | None
+        接続した際にTrue、切断された際にFalseを渡して呼び出す関数。WebSocketで受け取った情報を使い続けてよいかの判断に用いる
+
+    Methods
+    -------
+    run_forever -> None
+        接続し、stopが呼ばれるまで受信を続ける
+    stop -> None
+        受信を終了する
+    """
+    def __init__(
+            self,
+            on_kline: Dict[Tuple[str, str], Callable[[OhlcBuffer], None]],
+            endpoint: Union[str, None] = None,
+            subscribes_private: bool = True,
+            on_position: Union[Dict[str, Callable[[Position], None]], None] = None,
+            on_order: Union[Dict[str, Callable[[List[Dict[str, Any]]], None]], None] = None,
+            on_stop_order: Union[Dict[str, Callable[[List[Dict[str, Any]]], None]], None] = None,
+            on_reconnect: Union[Callable[[], None], None] = None,
+            on_connection_change: Union[Callable[[bool], None], None] = None) -> None:
+        if endpoint is None:
+            endpoint = endpoint_testnet if settings.is_testnet else endpoint_mainnet
+        self.endpoint : str = endpoint
+        self.on_kline : Dict[str, Callable[[OhlcBuffer], None]] = {
+            f'klineV2.{time_interval}.{symbol}': handler for (symbol, time_interval), handler in on_kline.items()}
+        self.topics : List[str] = list(self.on_kline)
+        self.subscribes_private : bool = subscribes_private
+        if subscribes_private:
+            self.topics += ['position', 'order', 'stop_order']
+        self.on_position : Dict[str, Callable[[Position], None]] = on_position or {}
+        self.on_order : Dict[str, Callable[[List[Dict[str, Any]]], None]] = on_order or {}
+        self.on_stop_order : Dict[str, Callable[[List[Dict[str, Any]]], None]] = on_stop_order or {}
+        self.on_reconnect = on_reconnect
+        self.on_connection_change = on_connection_change
+        self._ws : Union[websocket.WebSocketApp, None] = None
+        self._is_running : bool = False
+        self._has_connected : bool = False
+
+    def run_forever(self) -> None:
+        """接続し、stopが呼ばれるまで受信を続ける。切断された場合は間隔をあけて再接続する"""
+        self._is_running = True
+        reconnect_interval : int = 1
+        while self._is_running:
+            self._ws = websocket.WebSocketApp(
+                self.endpoint,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error)
+            started_at : float = time.time()
+            self._ws.run_forever()
+            if self.on_connection_change is not None:
+                self.on_connection_change(False)
+            if not self._is_running:
+                break
+            if time.time() - started_at > max_reconnect_interval:
+                reconnect_interval = 1  # 長く接続できていた場合は待ち時間を戻す
+            logger.warn(f'websocket is disconnected. reconnect in {reconnect_interval}s')
+            time.sleep(reconnect_interval)
+            reconnect_interval = min(reconnect_interval * 2, max_reconnect_interval)
+
+    def stop(self) -> None:
+        """受信を終了する"""
+        self._is_running = False
+        if self._ws is not None:
+            self._ws.close()
+
+    def _on_open(self, ws: websocket.WebSocketApp) -> None:
+        if self.subscribes_private:
+            ws.send(json.dumps({'op': 'auth', 'args': self._auth_args()}))
+        ws.send(json.dumps({'op': 'subscribe', 'args': self.topics}))
+        threading.Thread(target=self._send_ping, args=(ws,), daemon=True).start()
+        if self.on_connection_change is not None:
+            self.on_connection_change(True)
+        if self._has_connected and self.on_reconnect is not None:
+            self.on_reconnect()  # 切断中に取りこぼしたローソク足を補う
+        self._has_connected = True
+        logger.info(f'websocket is connected: {self.topics}')
+
+    def _auth_args(self) -> List[Union[str, int]]:
+        if settings.is_testnet:
+            api_key, api_secret_key = settings.testnet_api_key, settings.tesetnet_api_secret_key
+        else:
+            api_key, api_secret_key = settings.api_key, settings.api_secret_key
+        expires : int = int((time.time() + 10) * 1000)
+        signature : str = hmac.new(
+            api_secret_key.encode(), f'GET/realtime{expires}'.encode(), hashlib.sha256).hexdigest()
+        return [api_key, expires, signature]
+
+    def _send_ping(self, ws: websocket.WebSocketApp) -> None:
+        while self._is_running and ws.sock is not None and ws.sock.connected:
+            try:
+                ws.send(json.dumps({'op': 'ping'}))
+            except websocket.WebSocketException:
+                return None
+            time.sleep(ping_interval)
+
+    def _on_error(self, ws: websocket.WebSocketApp, error: Exception) -> None:
+        logger.error(f'websocket error: {error}', exc_info=False)
+
+    def _on_message(self, ws: websocket.WebSocketApp, message: str) -> None:
+        msg : Dict[str, Any] = json.loads(message)
+        topic : Union[str, None] = msg.get('topic')
+        if topic is None:
+            if msg.get('success') is False:
+                logger.error(f'websocket request failed: {msg}', exc_info=False)
+            return None
+        if topic in self.on_kline:
+            self.on_kline[topic](self._parse_klines(msg['data']))
+        elif topic == 'position':
+            for position_info in msg['data']:
+                handler = self.on_position.get(position_info['symbol'])
+                if handler is not None:
+                    handler(self._parse_position(position_info))
+        elif topic == 'order':
+            self._dispatch_by_symbol(self.on_order, msg['data'])
+        elif topic == 'stop_order':
+            self._dispatch_by_symbol(self.on_stop_order, msg['data'])
+
+    def _dispatch_by_symbol(
+            self,
+            handlers: Dict[str, Callable[[List[Dict[str, Any]]], None]],
+            infos: List[Dict[str, Any]]) -> None:
+        """注文の更新を通貨ごとにまとめ、その通貨の関数に渡す"""
+        infos_by_symbol : Dict[str, List[Dict[str, Any]]] = {}
+        for info in infos:
+            infos_by_symbol.setdefault(info['symbol'], []).append(info)
+        for symbol, symbol_infos in infos_by_symbol.items():
+            handler = handlers.get(symbol)
+            if handler is not None:
+                handler(symbol_infos)
+
+    def _parse_klines(self, kline_info: List[Dict[str, Any]]) -> OhlcBuffer:
+        """WebSocketで受け取ったローソク足情報を、OhlcBufferに変換する"""
+        ohlcs : OhlcBuffer = OhlcBuffer(capacity=max(len(kline_info), 1))
+        if kline_info:
+            ohlcs.extend(
+                np.array([kline['start'] for kline in kline_info], dtype=np.int64),
+                np.array(
+                    [[kline['open'], kline['high'], kline['low'], kline['close']] for kline in kline_info],
+                    dtype=np.float64))
+        return ohlcs
+
+    def _parse_position(self, position_info: Dict[str, Any]) -> Position:
+        """WebSocketで受け取ったポジション情報を、Positionインスタンスに変換する"""
+        now : datetime = datetime.now()
+        return Position(
+            side=position_info['side'],
+            size=int(position_info['size']),
+            entry_price=float(position_info['entry_price']),
+            leverage=float(position_info['leverage']),
+            liq_price=float(position_info['liq_price']),
+            created_at=now,
+            updated_at=now,
+            wallet_balance=float(position_info['wallet_balance']) if 'wallet_balance' in position_info else None)
@@ -1,25 +1,45 @@
 from datetime import datetime, timedelta
 import dateutil.parser
+import dateutil.tz
+import math
+import queue
 import requests
-from typing import Dict, List, Union, Tuple
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Union, Tuple
 
+import numpy as np
+import pandas as pd
 import pybybit
 
 import constants
 import settings
+from trading_api.rate_limiter import (
+    RequestScheduler, shared_request_scheduler, PUBLIC, PRIVATE,
+    PRIORITY_ORDER, PRIORITY_ACCOUNT, PRIORITY_MARKET_DATA)
 from logger import Logger
+from utils.metrics import metrics
 
 
 logger = Logger()
-symbol = settings.symbol
-coin = symbol[:3]
 
 unit_time_to_get_a_ohlc = constants.DURATION_1M
 number_of_ohlcs_to_get = constants.NUMBER_OF_OHLCS
 
+# ローソク足の単位時間を分に換算した値
+unit_minutes : Dict[str, int] = {
+    constants.DURATION_1M: 1,
+    constants.DURATION_5M: 5,
+    constants.DURATION_30M: 30,
+    constants.DURATION_1H: 60,
+    constants.DURATION_4H: 60*4,
+    constants.DURATION_1DAY: 60*24,
+}
+
 
 class Ohlc:
-    """ローソク足の情報をもつクラス
+    """ローソク足の情報をもつクラス。
+    OhlcBufferの1行をオブジェクトとして扱いたい場合に用いる
 
     Attributes
     ----------
@@ -34,6 +54,8 @@ class Ohlc:
     close : float
         終値
     """
+    __slots__ = ('open_time', 'open', 'high', 'low', 'close')
+
     def __init__(
             self, 
             open_time: datetime, 
@@ -48,7 +70,134 @@ class Ohlc:
         self.close : float = close
 
     def __str__(self) -> str:
-        return str(self.__dict__)
+        return str({name: getattr(self, name) for name in self.__slots__})
+
+
+class OhlcBuffer:
+    """ローソク足を列ごとのNumPy配列で保持するリングバッファ。
+    capacityを超えた分は古いものから破棄する
+
+    容量の2倍の領域を確保し、末尾まで使い切った時にのみ直近の行を先頭へ詰め直すため、
+    保持している行は常に連続した領域に並び、コピーを伴わずにビューとして参照できる。
+    ビューは次にバッファを更新するまでの間のみ有効である
+
+    Attributes
+    ----------
+    capacity : int
+        保持するローソク足の最大個数
+    columns : List[str]
+        open_time以外の列名
+    open_time : np.ndarray
+        ローソク足の取得時刻のタイムスタンプ（int64）のビュー
+    values : np.ndarray
+        (行数, 列数)のfloat64配列のビュー
+    """
+    ohlc_columns : List[str] = ['open', 'high', 'low', 'close']
+
+    def __init__(
+            self,
+            capacity: int = number_of_ohlcs_to_get,
+            columns: Union[List[str], None] = None) -> None:
+        self.capacity : int = capacity
+        self.columns : List[str] = list(columns) if columns is not None else list(self.ohlc_columns)
+        self._column_index : Dict[str, int] = {name: i for i, name in enumerate(self.columns)}
+        self._open_time : np.ndarray = np.empty(2 * capacity, dtype=np.int64)
+        self._values : np.ndarray = np.empty((2 * capacity, len(self.columns)), dtype=np.float64)
+        self._start : int = 0
+        self._end : int = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __getitem__(self, i: int) -> Ohlc:
+        open_time : int = int(self.open_time[i])
+        open, high, low, close = self.values[i, :4].tolist()
+        return Ohlc(
+            open_time=datetime.fromtimestamp(open_time),
+            open=open,
+            high=high,
+            low=low,
+            close=close)
+
+    def __iter__(self) -> Iterator[Ohlc]:
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def open_time(self) -> np.ndarray:
+        return self._open_time[self._start:self._end]
+
+    @property
+    def values(self) -> np.ndarray:
+        return self._values[self._start:self._end]
+
+    def column(self, name: str) -> np.ndarray:
+        """指定の列のビューを返却する"""
+        return self._values[self._start:self._end, self._column_index[name]]
+
+    def last_open_time(self) -> Union[int, None]:
+        """最後のローソク足の取得時刻のタイムスタンプ。空の場合はNone"""
+        if len(self) == 0:
+            return None
+        return int(self._open_time[self._end - 1])
+
+    def extend(self, open_time: np.ndarray, values: np.ndarray) -> None:
+        """ローソク足をまとめて末尾に追加する
+
+        Parameters
+        ----------
+        open_time : np.ndarray
+            (行数,)の取得時刻のタイムスタンプ
+        values : np.ndarray
+            (行数, 列数)の値
+        """
+        num_rows : int = len(open_time)
+        if num_rows > self.capacity:
+            open_time, values = open_time[-self.capacity:], values[-self.capacity:]
+            num_rows = self.capacity
+        if self._end + num_rows > 2 * self.capacity:
+            # 確保した領域の末尾に達したため、残す行を先頭に詰め直す
+            num_kept : int = min(len(self), self.capacity - num_rows)
+            self._open_time[:num_kept] = self._open_time[self._end - num_kept:self._end]
+            self._values[:num_kept] = self._values[self._end - num_kept:self._end]
+            self._start, self._end = 0, num_kept
+        self._open_time[self._end:self._end + num_rows] = open_time
+        self._values[self._end:self._end + num_rows] = values
+        self._end += num_rows
+        self._start = max(self._start, self._end - self.capacity)
+
+    def append(self, open_time: int, values: List[float]) -> None:
+        """ローソク足を1本末尾に追加する"""
+        if self._end == 2 * self.capacity:
+            self.extend(np.array([open_time], dtype=np.int64), np.array([values], dtype=np.float64))
+            return
+        self._open_time[self._end] = open_time
+        self._values[self._end] = values
+        self._end += 1
+        if self._end - self._start > self.capacity:
+            self._start += 1
+
+    def set_last(self, values: List[float]) -> None:
+        """最後のローソク足の値を置き換える"""
+        self._values[self._end - 1] = values
+
+    def truncate_from(self, open_time: int) -> None:
+        """指定の時刻以降に始まるローソク足を破棄する"""
+        self._end = self._start + int(np.searchsorted(self.open_time, open_time, side='left'))
+
+    def to_frame(self) -> pd.DataFrame:
+        """保持しているローソク足をDataFrameとして返却する。
+        float64の列はコピーを伴わずvaluesを参照する
+
+        Returns
+        -------
+        pd.DataFrame
+            open_time（ローカル時刻）と各列を持つDataFrame
+        """
+        df : pd.DataFrame = pd.DataFrame(self.values, columns=self.columns, copy=False)
+        open_time : pd.DatetimeIndex = pd.to_datetime(self.open_time, unit='s', utc=True)
+        df.insert(0, 'open_time', open_time.tz_convert(dateutil.tz.tzlocal()).tz_localize(None))
+        return df
 
 
 class Order:
@@ -68,6 +217,14 @@ class Order:
         注文が作成された時刻。注文を出す際はNoneと指定
     updated_at : datetime | None
         注文が更新された時刻。注文を出す際はNoneと指定
+    order_id : str | None
+        取引所が割り振る注文ID。注文を出す際はNoneと指定
+    order_link_id : str | None
+        注文を出す側で割り振る注文ID。OrderManagerが注文を出す前に割り振る
+    order_status : str | None
+        注文の状態 e.g.) New, PartiallyFilled, Filled, Cancelled。注文を出す際はNoneと指定
+    leaves_qty : int
+        約定していない数量。注文を出す際はqtyと同じ
     """
     def __init__(
             self, 
@@ -76,18 +233,53 @@ class Order:
             qty: int, 
             price: Union[float, None], 
             created_at: Union[datetime, None] = None,
-            updated_at: Union[datetime, None] = None) -> None:
+            updated_at: Union[datetime, None] = None,
+            order_id: Union[str, None] = None,
+            order_link_id: Union[str, None] = None,
+            order_status: Union[str, None] = None,
+            leaves_qty: Union[int, None] = None) -> None:
         self.side : str = side
         self.order_type : str = order_type
         self.qty : int = qty
         self.price : Union[float, None] = price
         self.created_at : Union[datetime, None] = created_at
         self.updated_at : Union[datetime, None] = updated_at
+        self.order_id : Union[str, None] = order_id
+        self.order_link_id : Union[str, None] = order_link_id
+        self.order_status : Union[str, None] = order_status
+        self.leaves_qty : int = qty if leaves_qty is None else leaves_qty
 
     def __str__(self) -> str:
         return str(self.__dict__)
 
 
+class StopOrder:
+    """取引所に置いた逆指値注文（損切り）の情報をもつクラス。
+    価格がstop_pxに達すると、取引所でqtyの成行注文が発注される
+
+    Attributes
+    ----------
+    stop_order_id : str
+        逆指値注文のID
+    side : str = constants.BUY | constants.SELL
+        発注される注文の向き。買いポジションの損切りは売り
+    qty : int
+        発注される注文の数量
+    stop_px : float
+        発注される価格（トリガー価格）
+    """
+    __slots__ = ('stop_order_id', 'side', 'qty', 'stop_px')
+
+    def __init__(self, stop_order_id: str, side: str, qty: int, stop_px: float) -> None:
+        self.stop_order_id : str = stop_order_id
+        self.side : str = side
+        self.qty : int = qty
+        self.stop_px : float = stop_px
+
+    def __str__(self) -> str:
+        return str({name: getattr(self, name) for name in self.__slots__})
+
+
 class Position:
     """ポジションの情報をもつクラス
 
@@ -107,6 +299,8 @@ class Position:
         ポジションを持った際の時刻
     updated_at : datetime
         ポジションを更新した際の時刻
+    wallet_balance : float | None
+        ポジション情報と同時に返却される残高（coin建て）。含まれない場合はNone
     """
     def __init__(
             self,
@@ -116,7 +310,8 @@ class Position:
             leverage: float,
             liq_price: float,
             created_at: datetime,
-            updated_at: datetime) -> None:
+            updated_at: datetime,
+            wallet_balance: Union[float, None] = None) -> None:
         self.side : str = side
         self.size : int = size
         self.entry_price : float = entry_price
@@ -124,26 +319,200 @@ class Position:
         self.liq_price : float = liq_price
         self.created_at : datetime = created_at
         self.updated_at : datetime = updated_at
+        self.wallet_balance : Union[float, None] = wallet_balance
     
     def __str__(self) -> str:
         return str(self.__dict__)
 
 
+def parse_ohlcs_into(ohlcs: OhlcBuffer, ohlc_info: List[Dict[str, Union[str, int]]]) -> None:
+    """dictのリストとして返却されるローソク足情報を、OhlcBufferに直接書き込む
+
+    Parameters
+    ----------
+    ohlcs : OhlcBuffer
+        書き込み先のバッファ
+    ohlc_info : List[Dict[str, Union[str, int]]]
+        bybitAPIによって返却されるローソク足情報
+    """
+    if not ohlc_info:
+        return None
+    open_time : np.ndarray = np.fromiter(
+        (dict['open_time'] for dict in ohlc_info), dtype=np.int64, count=len(ohlc_info))
+    values : np.ndarray = np.array(
+        [[dict['open'], dict['high'], dict['low'], dict['close']] for dict in ohlc_info],
+        dtype=np.float64)
+    ohlcs.extend(open_time, values)
+
+
+def parse_time(time_info: str) -> datetime:
+    """bybitAPIが返却するISO 8601形式の時刻を変換する e.g.) 2019-11-30T11:03:43.452Z
+    dateutil.parser.parseは書式の推定を行い遅いため、まずdatetime.fromisoformatで変換する
+    """
+    try:
+        return datetime.fromisoformat(time_info.replace('Z', '+00:00'))
+    except ValueError:
+        return dateutil.parser.parse(time_info)
+
+
+def parse_position(position_info: Dict[str, Union[str, float]]) -> Position:
+    """dictとして返却されるポジション情報を、Positionインスタンスに変換する"""
+    position : Position = Position(
+        side=position_info['side'],
+        size=int(position_info['size']),
+        entry_price=float(position_info['entry_price']),
+        leverage=float(position_info['leverage']),
+        liq_price=float(position_info['liq_price']),
+        created_at=parse_time(position_info['created_at']),
+        updated_at=parse_time(position_info['updated_at']),
+        wallet_balance=float(position_info['wallet_balance']) if 'wallet_balance' in position_info else None)
+    return position
+
+
+def parse_order(order_info: Dict[str, Union[str, float]]) -> Order:
+    """dictとして返却される注文情報を、Orderインスタンスに変換する"""
+    order : Order = Order(
+        side=order_info['side'],
+        order_type=order_info['order_type'],
+        qty=int(order_info['qty']),
+        price=float(order_info['price']),
+        created_at=parse_time(order_info['created_at']),
+        updated_at=parse_time(order_info['updated_at']),
+        order_id=order_info.get('order_id'),
+        order_link_id=order_info.get('order_link_id') or None,
+        order_status=order_info.get('order_status'),
+        leaves_qty=int(order_info['leaves_qty']) if 'leaves_qty' in order_info else None)
+    return order
+
+
+def parse_stop_order(stop_order_info: Dict[str, Union[str, float]]) -> StopOrder:
+    """dictとして返却される逆指値注文の情報を、StopOrderインスタンスに変換する。
+    REST APIとWebSocketではIDとトリガー価格のキーが異なるため、どちらにも対応する
+    """
+    stop_order : StopOrder = StopOrder(
+        stop_order_id=stop_order_info.get('stop_order_id', stop_order_info.get('order_id')),
+        side=stop_order_info['side'],
+        qty=int(stop_order_info['qty']),
+        stop_px=float(stop_order_info.get('stop_px', stop_order_info.get('trigger_price'))))
+    return stop_order
+
+
+def coin_of(symbol: str) -> str:
+    """インバース契約の通貨から、証拠金となるコインを返却する e.g.) BTCUSD -> BTC"""
+    return symbol[:3]
+
+
+def round_to_tick(symbol: str, price: float) -> float:
+    """価格をその通貨の呼値の単位に丸める e.g.) BTCUSD: 40000.3 -> 40000.5"""
+    tick_size : float = constants.PRICE_TICK_SIZES.get(symbol, constants.DEFAULT_PRICE_TICK_SIZE)
+    return round(round(price / tick_size) * tick_size, 8)
+
+
+class AccountStateCache:
+    """ポジション（通貨ごと）と残高（コインごと）をキャッシュするクラス。
+    ApiClientのインスタンス間で共有し、1回のトレードの判断では同じポジション情報を用いる
+
+    WebSocketでポジションの更新を受け取っている間（is_streamingがTrue）は、変化があれば通知されるため、
+    ポジションのキャッシュは判断をまたいで、ttlを過ぎても使い続ける。
+    キャッシュは以下の場合に破棄する
+        * begin_cycleが呼ばれた時（その通貨のトレードの判断を1回行う度）。ただしWebSocketで受け取っている間のポジションは除く
+        * 取得してからttl秒が経過した時。ただしWebSocketで受け取っている間のポジションは除く
+        * 自身の注文の作成・キャンセルが成功した時
+        * WebSocketが切断、再接続した時（ポジションのみ。切断中の更新を取りこぼした可能性があるため）
+
+    取得中の待ち合わせはキーごとに行うため、ある通貨の取得が他の通貨の取得を待たせることはない
+
+    Attributes
+    ----------
+    ttl : float
+        キャッシュの有効期間（秒）
+    is_streaming : bool
+        WebSocketでポジションの更新を受け取っている場合はTrue
+    """
+    def __init__(self, ttl: float = constants.ACCOUNT_CACHE_TTL) -> None:
+        self.ttl : float = ttl
+        self.is_streaming : bool = False
+        self._lock : threading.Lock = threading.Lock()
+        self._key_locks : Dict[str, threading.Lock] = {}
+        self._entries : Dict[str, Tuple[Any, float]] = {}  # キー -> (値, キャッシュした時刻)
+
+    def _get(self, key: str, fetch: Callable[[], Any], ttl: float) -> Any:
+        with self._lock:
+            key_lock : threading.Lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[1] > ttl:
+                value = fetch()
+                latest = self._entries.get(key)
+                if latest is not None and latest is not entry:  # 取得中にWebSocketで受け取った値を優先する
+                    return latest[0]
+                self._entries[key] = (value, time.monotonic())
+                return value
+            return entry[0]
+
+    def get_position(self, symbol: str, fetch: Callable[[], Position]) -> Position:
+        """キャッシュされたポジション情報を返却する。無効な場合はfetchで取得してキャッシュする"""
+        return self._get(f'position:{symbol}', fetch, math.inf if self.is_streaming else self.ttl)
+
+    def get_balance(self, coin: str, fetch: Callable[[], float]) -> float:
+        """キャッシュされた残高を返却する。無効な場合はfetchで取得してキャッシュする"""
+        return self._get(f'balance:{coin}', fetch, self.ttl)
+
+    def set_position(self, symbol: str, position: Position) -> None:
+        """ポジション情報をキャッシュする。WebSocketで受け取ったポジション情報の反映にも用いる"""
+        self._entries[f'position:{symbol}'] = (position, time.monotonic())
+
+    def set_streaming(self, is_streaming: bool) -> None:
+        """WebSocketでポジションの更新を受け取り始めた（True）、もしくは受け取れなくなった（False）ことを記録する。
+        いずれの場合も、切断中の更新を取りこぼした可能性があるため、全てのポジションのキャッシュを破棄する
+        """
+        self.is_streaming = is_streaming
+        for key in [key for key in self._entries if key.startswith('position:')]:
+            self._entries.pop(key, None)
+
+    def invalidate(self, symbol: Union[str, None] = None) -> None:
+        """指定の通貨のポジションと、その証拠金の残高のキャッシュを破棄する。Noneの場合は全て破棄する"""
+        if symbol is None:
+            self._entries.clear()
+            return None
+        self._entries.pop(f'position:{symbol}', None)
+        self.invalidate_balance(coin_of(symbol))
+
+    def invalidate_balance(self, coin: str) -> None:
+        """指定のコインの残高のキャッシュを破棄する"""
+        self._entries.pop(f'balance:{coin}', None)
+
+
+shared_account_state_cache = AccountStateCache()
+
+
 class ApiClient:
-    """bybitのAPIを使用するクラス
+    """bybitのAPIを使用するクラス。
+    通貨を引数で指定するため、1つのインスタンスを複数の通貨のパイプラインで共有できる
 
     Attributes
     ----------
     client : pybybit.API
         pybybitライブラリを用いたAPIラッパーインスタンス。
-        settings.iniでtestnet環境か本番環境かを指定する
+        settings.iniでtestnet環境か本番環境かを指定する。
+        同じメソッドを持つインスタンス（simulator.exchange.SimulatedExchangeなど）を指定することもできる
+    clock : Callable[[], float]
+        現在時刻のタイムスタンプを返却する関数。ローソク足の取得範囲を決めるのに用いる
+    account_state_cache : AccountStateCache
+        ポジションと残高のキャッシュ。指定しなければ全インスタンスで共有のものを用いる
+    request_scheduler : RequestScheduler
+        レート制限を超えないようにリクエストを待機させるインスタンス。指定しなければ全インスタンスで共有のものを用いる
     
     Methods
     -------
+    begin_cycle -> None
+        トレードの判断を1回行う前に呼び、ポジション（WebSocketで受け取っている間を除く）と残高のキャッシュを破棄する
     get_available_balance -> flaot
         現在の残高（Bitcoinの残高など）を取得する
-    get_ohlcs -> List[Ohlc]
+    get_ohlcs -> OhlcBuffer
         現在時刻から指定の分数間のローソク足情報を取得する
+    get_ohlcs_since -> OhlcBuffer
+        指定の時刻から現在時刻までのローソク足情報を取得する
     get_realtime_ohlc -> Iterator[Ohlc]
         ローソク足の情報が更新される度にその情報を取得する
     get_position -> Position
@@ -151,12 +520,34 @@ class ApiClient:
     get_active_orders -> List[Order | None]
         現在確約していない全ての注文のリストで返却する。存在しなければ空リストを返却する
     create_order -> requests.Response
-        注文を出す
+        注文を出す。order_link_idが割り振られている場合は、それも送信する
     cancel_all_active_orders -> None:
         現在確約していない全ての注文をキャンセルする
+    get_active_stop_orders -> List[StopOrder]
+        発注されていない全ての逆指値注文（損切り）を取得する
+    create_stop_order -> StopOrder | None
+        逆指値注文（損切り）を出す
+    replace_stop_order -> bool
+        逆指値注文（損切り）の数量とトリガー価格を変更する
+    cancel_all_stop_orders -> bool
+        発注されていない全ての逆指値注文（損切り）をキャンセルする
     """
-    def __init__(self) -> None:
-        if settings.is_testnet:
+    def __init__(
+            self,
+            account_state_cache: Union[AccountStateCache, None] = None,
+            request_scheduler: Union[RequestScheduler, None] = None,
+            client: Union[pybybit.API, None] = None,
+            clock: Callable[[], float] = time.time) -> None:
+        if account_state_cache is None:
+            account_state_cache = shared_account_state_cache
+        if request_scheduler is None:
+            request_scheduler = shared_request_scheduler
+        self.account_state_cache : AccountStateCache = account_state_cache
+        self.request_scheduler : RequestScheduler = request_scheduler
+        self.clock : Callable[[], float] = clock
+        if client is not None:
+            self.client : pybybit.API = client
+        elif settings.is_testnet:
             self.client : pybybit.API = pybybit.API(
                 key=settings.testnet_api_key, 
                 secret=settings.tesetnet_api_secret_key,
@@ -166,26 +557,72 @@ class ApiClient:
                 key=settings.api_key, 
                 secret=settings.api_secret_key)
 
-    def get_available_balance(self) -> float:
-        """現在の残高（Bitcoinの残高など）を取得する
+    def _request(self, kind: str, priority: int, method: Callable[..., requests.Response], **params) -> requests.Response:
+        """レート制限の範囲内でリクエストを送り、レスポンスに含まれるレート制限の情報を反映する
+
+        Parameters
+        ----------
+        kind : str = PUBLIC | PRIVATE
+            エンドポイントの種類
+        priority : int = PRIORITY_ORDER | PRIORITY_ACCOUNT | PRIORITY_MARKET_DATA
+            優先度。値が小さいほど先に送信する
+        method : Callable[..., requests.Response]
+            pybybitのメソッド
+        """
+        self.request_scheduler.acquire(kind, priority, method.__name__)
+        with metrics.span(f'api_request_seconds_{method.__name__}'):  # レート制限の待ち時間は含めない
+            resp : requests.Response = method(**params)
+        self.request_scheduler.record_response(method.__name__, resp.json(), resp.headers)
+        return resp
+
+    def begin_cycle(self, symbol: str) -> None:
+        """トレードの判断を1回行う前に呼び、その通貨のポジションと残高のキャッシュを破棄する。
+        以降、キャッシュが破棄されるまでの間は同じポジション情報を用いる。
+        WebSocketでポジションの更新を受け取っている間は、ポジションのキャッシュは破棄せずに使い続ける
+
+        Parameters
+        ----------
+        symbol : str
+            判断を行う通貨 e.g.) BTCUSD
+        """
+        if self.account_state_cache.is_streaming:
+            self.account_state_cache.invalidate_balance(coin_of(symbol))
+        else:
+            self.account_state_cache.invalidate(symbol)
+
+    def get_available_balance(self, coin: str) -> float:
+        """現在の残高（Bitcoinの残高など）を取得する。キャッシュが有効な場合はキャッシュを返却する
+
+        Parameters
+        ----------
+        coin : str
+            残高を取得するコイン e.g.) BTC
 
         Returns
         -------
         float
             現在の残高（Bitcoinの残高など）
         """
-        resp : requests.Response = self.client.rest.inverse.private_wallet_balance(coin=coin)
+        return self.account_state_cache.get_balance(coin, lambda: self._fetch_available_balance(coin))
+
+    def _fetch_available_balance(self, coin: str) -> float:
+        """現在の残高（Bitcoinの残高など）をAPIから取得する"""
+        resp : requests.Response = self._request(
+            PRIVATE, PRIORITY_ACCOUNT, self.client.rest.inverse.private_wallet_balance, coin=coin)
         wallet_balance : float = resp.json()["result"][f"{coin}"]["available_balance"]
         return wallet_balance
 
     def get_ohlcs(
             self,
+            symbol: str,
             time_interval: str = unit_time_to_get_a_ohlc, 
-            num_ohlcs: int = number_of_ohlcs_to_get) -> List[Ohlc]:
+            num_ohlcs: int = number_of_ohlcs_to_get) -> OhlcBuffer:
         """現在時刻から指定の分数間のローソク足情報を取得する
 
         Parameters
         ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
         time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
             ローソク足を取得する単位時間
 
@@ -195,109 +632,130 @@ class ApiClient:
 
         Returns
         -------
-        List[Ohlc]
+        OhlcBuffer
             現在時刻から指定の単位時間間のローソク足情報
         """
-        def __cal_start_time(time_interval: int, num_ohlcs: int) -> Tuple[int, int]:
-            if time_interval == constants.DURATION_1M:
-                delta, unit_time = timedelta(minutes=num_ohlcs), 1
-            elif time_interval == constants.DURATION_5M:
-                delta, unit_time = timedelta(minutes=num_ohlcs*5), 5
-            elif time_interval == constants.DURATION_30M:
-                delta, unit_time = timedelta(minutes=num_ohlcs*30), 30
-            elif time_interval == constants.DURATION_1H:
-                delta, unit_time = timedelta(hours=num_ohlcs), 60
-            elif time_interval == constants.DURATION_4H:
-                delta, unit_time = timedelta(hours=num_ohlcs*4), 60*4
-            elif time_interval == constants.DURATION_1DAY:
-                delta, unit_time = timedelta(days=num_ohlcs), 60*24
-            return int((datetime.now() - delta).timestamp()), unit_time
-
-        ohlcs : List[Ohlc] = []
-        now : int = int(datetime.now().timestamp())  # 現在時刻のタイムスタンプ
-        start_time, unit_time = __cal_start_time(time_interval, num_ohlcs)  # ohlcの取得開始時刻のタイムスタンプ, ohlcを取得する単位時間
+        delta : timedelta = timedelta(minutes=num_ohlcs*unit_minutes[time_interval])
+        start_time : int = int(self.clock() - delta.total_seconds())  # ohlcの取得開始時刻のタイムスタンプ
+        return self.get_ohlcs_since(symbol=symbol, start_time=start_time, time_interval=time_interval)
+
+    def get_ohlcs_since(
+            self,
+            symbol: str,
+            start_time: int,
+            time_interval: str = unit_time_to_get_a_ohlc) -> OhlcBuffer:
+        """指定の時刻から現在時刻までのローソク足情報を取得する
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
+        start_time : int
+            取得を開始する時刻のタイムスタンプ。この時刻に始まるローソク足も含めて取得する
+        time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
+            ローソク足を取得する単位時間
+
+        Returns
+        -------
+        OhlcBuffer
+            指定の時刻から現在時刻までのローソク足情報
+        """
+        now : int = int(self.clock())  # 現在時刻のタイムスタンプ
+        unit_time : int = unit_minutes[time_interval]  # ohlcを取得する単位時間
+        num_pages : int = max((now - start_time) // (200 * 60 * unit_time) + 1, 1)
+        ohlcs : OhlcBuffer = OhlcBuffer(capacity=200 * num_pages)
         while start_time < now:
-            resp : requests.Response = self.client.rest.inverse.public_kline_list(
+            resp : requests.Response = self._request(
+                PUBLIC, PRIORITY_MARKET_DATA, self.client.rest.inverse.public_kline_list,
                 symbol=symbol,
                 interval=time_interval,
                 from_=start_time)
             ohlc_info : List[Dict[str, Union[str, int]]] = resp.json()['result']
-            ohlcs += [self._parse_ohlc_from_dict(dict) for dict in ohlc_info]
+            parse_ohlcs_into(ohlcs, ohlc_info)
             start_time += 200 * 60 * unit_time  # 200単位時間すすめる
 
         return ohlcs
 
-    def _parse_ohlc_from_dict(self, dict) -> Ohlc:
-        """dictとして返却されるローソク足情報を、Ohlcインスタンスに変換する
+    def get_realtime_ohlc(self, symbol: str, time_interval: str = unit_time_to_get_a_ohlc) -> Iterator[Ohlc]:
+        """ローソク足の情報が更新される度にその情報を取得する。
+        WebSocketで受信するため、REST APIへのポーリングは行わない
 
         Parameters
         ----------
-        dict : Dict[str, Union[str, int]]
-            bybitAPIによって返却されるローソク足情報
+        symbol : str
+            通貨 e.g.) BTCUSD
+        time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
+            ローソク足を取得する単位時間
 
-        Returns
-        -------
+        Yields
+        ------
         Ohlc
-            Ohlcインスタンスに変換されたローソク足情報
+            更新されたローソク足。確定前の足は確定するまで同じ取得時刻で繰り返し返却される
         """
-        ohlc : Ohlc = Ohlc(
-            open_time=datetime.fromtimestamp(dict['open_time']),
-            open=float(dict['open']),
-            high=float(dict['high']),
-            low=float(dict['low']),
-            close=float(dict['close']))
-        return ohlc
-    
-    def get_position(self) -> Position:
-        """現在のポジション情報を取得する。ポジションを持っていなければNoneを返却する
+        from trading_api.realtime import RealtimeClient
+
+        received : queue.Queue = queue.Queue()
+        realtime_client : RealtimeClient = RealtimeClient(
+            on_kline={(symbol, time_interval): lambda ohlcs: [received.put(ohlc) for ohlc in ohlcs]},
+            subscribes_private=False)
+        threading.Thread(target=realtime_client.run_forever, daemon=True).start()
+        try:
+            while True:
+                yield received.get()
+        finally:
+            realtime_client.stop()
+
+    def get_position(self, symbol: str) -> Position:
+        """現在のポジション情報を取得する。キャッシュが有効な場合はキャッシュを返却する
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
 
         Returns
         -------
         Position
-            現在のポジション情報
+            現在のポジション情報。ポジションを持っていない時のsideは'None'
         """
-        resp : requests.Response = self.client.rest.inverse.private_position_list(symbol=symbol)
+        return self.account_state_cache.get_position(symbol, lambda: self._fetch_position(symbol))
+
+    def _fetch_position(self, symbol: str) -> Position:
+        """現在のポジション情報をAPIから取得する"""
+        resp : requests.Response = self._request(
+            PRIVATE, PRIORITY_ACCOUNT, self.client.rest.inverse.private_position_list, symbol=symbol)
         position_info : Dict[str: Union[str, float]] = resp.json()['result']
-        position : Position = Position(
-            side=position_info['side'],
-            size=int(position_info['size']),
-            entry_price=float(position_info['entry_price']),
-            leverage=float(position_info['leverage']),
-            liq_price=float(position_info['liq_price']),
-            created_at=dateutil.parser.parse(position_info['created_at']),
-            updated_at=dateutil.parser.parse(position_info['updated_at']))
-        return position
+        return parse_position(position_info)
         
-    def get_active_orders(self) -> List[Union[Order, None]]:
-        """現在確約していない全ての注文のリストで返却する。存在しなければ空リストを返却する
+    def get_active_orders(self, symbol: str) -> List[Union[Order, None]]:
+        """現在確約していない全ての注文のリストで返却する。存在しなければ空リストを返却する。
+        一部が約定した注文も含む
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
 
         Returns
         -------
         List[Union[Order, None]]
             現在確約していない全ての注文のリスト。存在しなければ空リスト
         """
-        def __parse_order_from_dict(dict : Dict[str, Union[str, float]]) -> Order:
-            order : Order = Order(
-                side=dict['side'],
-                order_type=dict['order_type'],
-                qty=int(dict['qty']),
-                price=float(dict['price']),
-                created_at=dateutil.parser.parse(dict['created_at']),
-                updated_at=dateutil.parser.parse(dict['updated_at']))
-            return order
-            
-        resp : requests.Response = self.client.rest.inverse.private_order_list(
+        resp : requests.Response = self._request(
+            PRIVATE, PRIORITY_ACCOUNT, self.client.rest.inverse.private_order_list,
             symbol=symbol,
-            order_status='New')
-        active_orders_info : List[Union[Dict[str, Union[str, float]]], None] = resp.json()['result']['data']
-        Orders : List[Union[Order, None]] = [__parse_order_from_dict(dict) for dict in active_orders_info]
+            order_status='New,PartiallyFilled')
+        active_orders_info : List[Union[Dict[str, Union[str, float]]], None] = resp.json()['result']['data'] or []
+        Orders : List[Union[Order, None]] = [parse_order(dict) for dict in active_orders_info]
         return Orders
 
-    def create_order(self, order: Order) -> requests.Response:
+    def create_order(self, symbol: str, order: Order) -> requests.Response:
         """注文を出す
 
         Parameters
         ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
         order : Order
             出す注文の情報
 
@@ -306,15 +764,145 @@ class ApiClient:
         resp : requests.Response
             ステータスコード
         """
-        resp : requests.Response = self.client.rest.inverse.private_order_create(
+        params : Dict[str, Any] = {}
+        if order.order_link_id is not None:
+            params['order_link_id'] = order.order_link_id
+        resp : requests.Response = self._request(
+            PRIVATE, PRIORITY_ORDER, self.client.rest.inverse.private_order_create,
             symbol=symbol,
             qty=order.qty,
             side=order.side,
             order_type=order.order_type,
             price=order.price,
-            time_in_force='Good-Till-Canceled')
+            time_in_force=constants.GOOD_TILL_CANCEL,
+            **params)
+        self._invalidate_cache_if_succeeded(symbol, resp)  # ポジションと残高が変わるため
         return resp
 
-    def cancel_all_active_orders(self) -> None:
+    def cancel_all_active_orders(self, symbol: str) -> None:
         """現在確約していない全ての注文をキャンセルする"""
-        self.client.rest.inverse.private_order_cancelall(symbol=symbol)
\ No newline at end of file
+        resp : requests.Response = self._request(
+            PRIVATE, PRIORITY_ORDER, self.client.rest.inverse.private_order_cancelall, symbol=symbol)
+        self._invalidate_cache_if_succeeded(symbol, resp)
+
+    def get_active_stop_orders(self, symbol: str) -> List[StopOrder]:
+        """発注されていない全ての逆指値注文（損切り）を取得する。存在しなければ空リストを返却する
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
+
+        Returns
+        -------
+        List[StopOrder]
+            発注されていない全ての逆指値注文。利確など、損切り以外の条件付き注文は含まない
+        """
+        resp : requests.Response = self._request(
+            PRIVATE, PRIORITY_ACCOUNT, self.client.rest.inverse.private_stoporder_list,
+            symbol=symbol,
+            stop_order_status='Untriggered')
+        stop_orders_info : List[Dict[str, Union[str, float]]] = resp.json()['result']['data'] or []
+        return [
+            parse_stop_order(dict) for dict in stop_orders_info
+            if dict.get('stop_order_type', constants.STOP) == constants.STOP]
+
+    def create_stop_order(
+            self,
+            symbol: str,
+            side: str,
+            qty: int,
+            stop_px: float,
+            base_price: float) -> Union[StopOrder, None]:
+        """逆指値注文（損切り）を出す。トリガーされると、ポジションを決済する成行注文が発注される
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
+        side : str = constants.BUY | constants.SELL
+            発注される注文の向き
+        qty : int
+            発注される注文の数量
+        stop_px : float
+            トリガー価格
+        base_price : float
+            現在の価格。取引所はstop_pxとの大小からトリガーの方向を決める
+
+        Returns
+        -------
+        StopOrder | None
+            作成した逆指値注文。作成に失敗した場合はNone
+        """
+        resp : requests.Response = self._request(
+            PRIVATE, PRIORITY_ORDER, self.client.rest.inverse.private_stoporder_create,
+            symbol=symbol,
+            side=side,
+            order_type=constants.MARKET,
+            qty=qty,
+            stop_px=stop_px,
+            base_price=base_price,
+            time_in_force=constants.GOOD_TILL_CANCEL,
+            close_on_trigger=True)
+        if resp.json()['ret_code'] != 0:
+            logger.error(f"failed to create stop order: {resp.json()['ret_msg']}", exc_info=False)
+            return None
+        return parse_stop_order(resp.json()['result'])
+
+    def replace_stop_order(self, symbol: str, stop_order_id: str, qty: int, stop_px: float) -> bool:
+        """逆指値注文（損切り）の数量とトリガー価格を変更する。注文を置き直さないため、注文が途切れない
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
+        stop_order_id : str
+            変更する逆指値注文のID
+        qty : int
+            変更後の数量
+        stop_px : float
+            変更後のトリガー価格
+
+        Returns
+        -------
+        bool
+            変更に成功した場合はTrue。注文が既にトリガー、キャンセルされている場合などはFalse
+        """
+        resp : requests.Response = self._request(
+            PRIVATE, PRIORITY_ORDER, self.client.rest.inverse.private_stoporder_replace,
+            symbol=symbol,
+            stop_order_id=stop_order_id,
+            p_r_qty=qty,
+            p_r_trigger_price=stop_px)
+        if resp.json()['ret_code'] != 0:
+            logger.error(f"failed to replace stop order: {resp.json()['ret_msg']}", exc_info=False)
+            return False
+        return True
+
+    def cancel_all_stop_orders(self, symbol: str) -> bool:
+        """発注されていない全ての逆指値注文（損切り）をキャンセルする
+
+        Parameters
+        ----------
+        symbol : str
+            通貨 e.g.) BTCUSD
+
+        Returns
+        -------
+        bool
+            キャンセルに成功した場合はTrue
+        """
+        resp : requests.Response = self._request(
+            PRIVATE, PRIORITY_ORDER, self.client.rest.inverse.private_stoporder_cancelall, symbol=symbol)
+        if resp.json()['ret_code'] != 0:
+            logger.error(f"failed to cancel stop orders: {resp.json()['ret_msg']}", exc_info=False)
+            return False
+        return True
+
+    def _invalidate_cache_if_succeeded(self, symbol: str, resp: requests.Response) -> None:
+        """注文の作成・キャンセルが成功した場合に、その通貨のポジションと残高のキャッシュを破棄する"""
+        ret_code : int = resp.json()['ret_code']
+        if ret_code == 0:
+            self.account_state_cache.invalidate(symbol)
+        else:
+            logger.error(f"request failed: {resp.json()['ret_msg']}", exc_info=False)
\ No newline at end of file
@@ -1,7 +1,5 @@
-from concurrent.futures import ThreadPoolExecutor
-
-from trading_brain.feature_creation import SingletonFeaturesCreator
-from orders.orders import Trader
+import settings
+from trading_runtime.trading_runtime import TradingRuntime
 from logger import Logger
 
 logger = Logger()
@@ -10,9 +8,6 @@ logger.remove_oldlog()
 
 if __name__ == '__main__':
 
-    features_creator = SingletonFeaturesCreator()
-    trader = Trader()
-
-    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="thread") as executor:
-            executor.submit(features_creator.create_features_in_realtime)
-            executor.submit(trader.trade)
\ No newline at end of file
+    # 全ての(通貨, 単位時間)のパイプラインでレート制限とポジション・残高のキャッシュを共有する
+    runtime = TradingRuntime(symbols=settings.symbols, time_intervals=settings.time_intervals)
+    runtime.run()
@@ -4,36 +4,38 @@ import numpy as np
 
 import constants
 from trading_api.trading_api import ApiClient
-from trading_brain.feature_creation import SingletonFeaturesCreator
+from trading_brain.feature_snapshot import FeatureSnapshot
 from trading_brain.judgement import Judgement
 from logger import Logger
+from utils.metrics import metrics
 
 logger = Logger()
 
 
 class Algorithms:
-    """特徴量を吟味して、注文を出すか否かを判断する
-
-    Todo
-    ----
-    吟味する指標を増やして、重みつきアンサンブルをとるように改修
+    """特徴量を吟味して、注文を出すか否かを判断する。
+    判断はJudgementに登録された戦略の重みつきアンサンブルで行う
     """
-    def __init__(self) -> None:
-        self.api_client = ApiClient()
+    def __init__(self, api_client: ApiClient, symbol: str) -> None:
+        self.api_client : ApiClient = api_client
+        self.symbol : str = symbol
         self.position_side : str
+        self.judgement : Judgement = Judgement()  # 前回の判断の入力を覚えておくため、使い回す
         
-    def send_trading_signal(self):
+    def send_trading_signal(self, snapshot: FeatureSnapshot):
         # シグナルの初期化
         has_position : bool = self._check_if_has_position()
-        judgement = Judgement(position_side=self.position_side)  # judgementインスタンスの初期化
-        
-        if judgement.signal_to_create_order >= 1:
+        with metrics.span(f'judgement_seconds_{self.symbol}'):
+            signal_to_create_order : float = self.judgement.judge(
+                position_side=self.position_side, bars=snapshot.latest_bars)
+
+        if signal_to_create_order >= 1:
             return constants.BUY, has_position
-        if judgement.signal_to_create_order <= -1:
+        if signal_to_create_order <= -1:
             return constants.SELL, has_position
         return None, has_position
 
     def _check_if_has_position(self) -> bool:
-        self.position_side : str = self.api_client.get_position().side
+        self.position_side : str = self.api_client.get_position(self.symbol).side
         has_position : bool = False if self.position_side == constants.NONE else True
         return has_position
\ No newline at end of file
@@ -0,0 +1,126 @@
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy.signal import lfilter
+
+# 窓関数をまとめて適用する際の1回あたりの行数。一時配列の大きさを chunk_size * term に抑える
+chunk_size = 65536
+
+
+def _apply_rolling(x: np.ndarray, term: int, func: Callable[[np.ndarray], np.ndarray]) -> np.ndarray:
+    """直近term個の値からなる窓ごとにfuncを適用する。先頭のterm-1個はnanとする
+
+    Parameters
+    ----------
+    x : np.ndarray
+        1次元の配列
+    term : int
+        計算する期間
+    func : Callable[[np.ndarray], np.ndarray]
+        (窓の数, term)の配列を受け取り、窓ごとの値を返す関数
+
+    Returns
+    -------
+    np.ndarray
+        xと同じ長さの配列
+    """
+    result : np.ndarray = np.full(len(x), np.nan)
+    if len(x) < term:
+        return result
+    windows : np.ndarray = sliding_window_view(x, term)  # コピーを伴わないビュー
+    for start in range(0, len(windows), chunk_size):
+        end : int = start + chunk_size
+        result[term - 1 + start: term - 1 + min(end, len(windows))] = func(windows[start:end])
+    return result
+
+
+def rolling_mean(x: np.ndarray, term: int) -> np.ndarray:
+    """直近term個の平均を求める"""
+    return _apply_rolling(x, term, lambda w: w.mean(axis=1))
+
+
+def rolling_std(x: np.ndarray, term: int) -> np.ndarray:
+    """直近term個の標準偏差（不偏）を求める"""
+    return _apply_rolling(x, term, lambda w: w.std(axis=1, ddof=1))
+
+
+def rolling_max(x: np.ndarray, term: int) -> np.ndarray:
+    """直近term個の最大値を求める"""
+    return _apply_rolling(x, term, lambda w: w.max(axis=1))
+
+
+def rolling_min(x: np.ndarray, term: int) -> np.ndarray:
+    """直近term個の最小値を求める"""
+    return _apply_rolling(x, term, lambda w: w.min(axis=1))
+
+
+def ema(x: np.ndarray, term: int) -> np.ndarray:
+    """EMAを求める。pandasのewm(span=term, adjust=False).mean()と同じ値となる"""
+    if len(x) == 0:
+        return np.array([], dtype=np.float64)
+    alpha : float = 2 / (term + 1)
+    # y[t] = alpha * x[t] + (1 - alpha) * y[t-1], y[0] = x[0]
+    y, _ = lfilter([alpha], [1, alpha - 1], x, zi=[(1 - alpha) * x[0]])
+    return y
+
+
+def build_features(
+        open_time: np.ndarray,
+        open: np.ndarray,
+        high: np.ndarray,
+        low: np.ndarray,
+        close: np.ndarray,
+        terms: List[int],
+        atr_term: int = 5,
+        macd_terms: Tuple[int, int, int] = (9, 17, 7),
+        donchian_term: int = 20) -> pd.DataFrame:
+    """ohlcの配列から全ての特徴量をまとめて求め、DataFrameを一度だけ作成する
+
+    Parameters
+    ----------
+    open_time, open, high, low, close : np.ndarray
+        ローソク足の取得時刻、始値、高値、安値、終値の配列
+    terms : List[int]
+        SMA, std, EMAを求める期間のパターン
+    atr_term : int
+        ATRを求める期間
+    macd_terms : Tuple[int, int, int]
+        MACDの短期期間、長期期間、シグナルの期間
+    donchian_term : int
+        最高値、最安値を求める期間
+
+    Returns
+    -------
+    pd.DataFrame
+        ohlcと特徴量の情報を持つDataFrame。特徴量が求まっていない先頭の行は含まない
+    """
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    short_term, long_term, signal_term = macd_terms
+
+    columns : Dict[str, np.ndarray] = {
+        'open_time': np.asarray(open_time),
+        'open': np.asarray(open, dtype=np.float64),
+        'high': high,
+        'low': low,
+        'close': close,
+        'ATR': rolling_mean(high, atr_term) - rolling_mean(low, atr_term),
+    }
+    for term in terms:
+        columns[f'sma_{term}'] = rolling_mean(close, term)
+        columns[f'std_{term}'] = rolling_std(close, term)
+        columns[f'ema_{term}'] = ema(close, term)
+    macd : np.ndarray = ema(close, short_term) - ema(close, long_term)
+    columns['macd'] = macd
+    columns['macd_signal'] = ema(macd, signal_term)
+    columns['max_price'] = rolling_max(high, donchian_term)
+    columns['min_price'] = rolling_min(low, donchian_term)
+
+    # 全ての特徴量が求まる最初の行から切り出す（dropnaと同じ結果となる）
+    warmup : int = min(max(terms + [atr_term, donchian_term]) - 1, len(close))
+    return pd.DataFrame(
+        {name: values[warmup:] for name, values in columns.items()},
+        index=pd.RangeIndex(warmup, len(close)))
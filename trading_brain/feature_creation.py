@@ -1,206 +1,233 @@
 from typing import List, Dict, Union
+import threading
 import time
 
+import numpy as np
 import pandas as pd
 
 import constants
-from trading_api.trading_api import ApiClient, Ohlc
+from trading_api.trading_api import ApiClient, OhlcBuffer, unit_minutes, unit_time_to_get_a_ohlc
+from trading_api.candle_archive import CandleArchive
+from trading_api.ohlc_store import OhlcStore
+from trading_brain.indicators import IndicatorEngine
+from trading_brain.feature_builder import build_features
+from trading_brain.feature_snapshot import FeatureSnapshot, SnapshotChannel
+from trading_brain.resampler import TimeframeFeatures
 from logger import Logger
+from utils.metrics import metrics
 
 logger = Logger()
 
 
-class Singleton:
-    def __new__(cls, *args, **kargs):
-        if not hasattr(cls, '_instance'):
-            cls._instance = super(Singleton, cls).__new__(cls)
-        return cls._instance
+class FeaturesCreator:
+    """Ohlcから特徴量を作成し、DataFrameに格納する役割をもつクラス。
+    通貨ごとにインスタンスを作成し、それぞれが独立した特徴量を保持する
 
-
-class SingletonFeaturesCreator(Singleton):
-    """Ohlcから特徴量を作成し、DataFrameに格納する役割をもつクラス、
-    Singletonを継承しているため、プロパティはそれぞれのインスタンスで共有される
+    上位足の特徴量は、APIから別に取得せず、time_intervalのローソク足を集計して同時に更新する
 
     Attributes
     ----------
     api_client : ApiClinet
-        bybitAPIラッパーインスタンス
+        bybitAPIラッパーインスタンス。全てのインスタンスで共有する
+    symbol : str
+        通貨 e.g.) BTCUSD
+    time_interval : str = constants.DURATION_1M | constants.DURATION_5M | ...
+        ローソク足の単位時間
+    ohlc_store : OhlcStore
+        取得済みのローソク足を保持し、差分のみを取得して更新するインスタンス。
+        確定した足はディスク上のCandleArchiveに保存し、次回の起動時はそこから読み込む。
+        uses_archive=Falseの場合（シミュレーションなど）は保存しない
     terms : List[int]
         特徴量を生成に使用する期間のパターン
-    has_updated : bool
-        リアルタイムでohlcの情報を取得する際、更新が行われたか否かの情報
+    indicator_engine : IndicatorEngine
+        ローソク足の追加・更新の度に特徴量を逐次的に更新するインスタンス
+    channel : SnapshotChannel
+        特徴量が更新される度に、その時点のスナップショットを公開するチャネル
     df_features : pd.DataFrame
-        指定の期間内のohlcと特徴量の情報を持つDataFrame
+        指定の期間内のohlcと特徴量の情報を持つDataFrame（最新のスナップショットのもの）
+    timeframes : Dict[str, TimeframeFeatures]
+        上位足の単位時間ごとの、time_intervalのローソク足から作成した上位足と特徴量
 
     Methods
     -------
     create_features_in_realtime -> None
         リアルタイムでdf_featuresの情報を更新する。
         更新間隔は、constants.UPDATE_INTERVALで指定
+    update -> None
+        前回以降のローソク足をREST APIで取得し、df_featuresの情報を更新する
+    update_from_stream -> None
+        WebSocketで受け取ったローソク足でdf_featuresの情報を更新する
+    backfill -> None
+        前回以降のローソク足をREST APIで取得し、df_featuresの情報を更新する
     """
-    def __init__(self) -> None:
-        self.api_client : ApiClient = ApiClient()
+    def __init__(
+            self,
+            api_client: ApiClient,
+            symbol: str,
+            time_interval: str = unit_time_to_get_a_ohlc,
+            resampled_time_intervals: Union[List[str], None] = None,
+            uses_archive: bool = True) -> None:
+        self.api_client : ApiClient = api_client
+        self.symbol : str = symbol
+        self.time_interval : str = time_interval
+        self.ohlc_store : OhlcStore = OhlcStore(
+            api_client=self.api_client,
+            symbol=symbol,
+            time_interval=time_interval,
+            archive=CandleArchive(symbol=symbol, time_interval=time_interval) if uses_archive else None)
         self.terms : List[int] = [10, 50]
-        self.has_updated : bool = False
-        self._update_df_features()
+        self.indicator_engine : IndicatorEngine = IndicatorEngine(terms=self.terms)
+        self.channel : SnapshotChannel = SnapshotChannel()
+        self.timeframes : Dict[str, TimeframeFeatures] = {}
+        for resampled_time_interval in resampled_time_intervals or []:
+            if unit_minutes[resampled_time_interval] % unit_minutes[time_interval] != 0:
+                raise ValueError(f'{resampled_time_interval} is not a multiple of {time_interval}')
+            self.timeframes[resampled_time_interval] = TimeframeFeatures(
+                time_interval=resampled_time_interval,
+                indicator_engine=IndicatorEngine(terms=self.terms))
+        self._lock : threading.Lock = threading.Lock()
+        self._has_warmed_up_timeframes : bool = False
+        self.update()
+
+    @property
+    def df_features(self) -> pd.DataFrame:
+        """指定の期間内のohlcと特徴量の情報を持つDataFrame（最新のスナップショットのもの）"""
+        return self.channel.latest.df_features
 
     def create_features_in_realtime(self) -> None:
         """リアルタイムでdf_featuresの情報を更新する。
         更新間隔は、constants.UPDATE_INTERVALで指定
         """
         while True:
-            self._update_df_features()
-            self.has_updated = True
-            logger.debug(f'{self.df_features}')
+            self.update()
+            # DataFrame全体を文字列にすると重いため、最新の足のみを記録する
+            snapshot : FeatureSnapshot = self.channel.latest
+            logger.debug(f'{self.symbol} features are updated: version={snapshot.version} open_time={snapshot.open_time}')
             time.sleep(constants.UPDATE_INTERVAL)
 
-    def _update_df_features(self) -> None:
-        """df_featuresの情報を更新する"""
-        _ohlcs : List[Ohlc] = self.api_client.get_ohlcs()
-        _df_ohlcs : pd.DataFrame = pd.DataFrame([ohlc.__dict__ for ohlc in _ohlcs])
-        self.df_features : pd.DataFrame = self._create_features(df=_df_ohlcs)
-
-    def _create_features(self, df: pd.DataFrame) -> pd.DataFrame:
-        """ohlcの情報を用いて、特徴量を求める
-
-        Parameters
-        ----------
-        df : pd.DataFrame
-            ohlcの情報を持つDataFrame
-
-        Returns
-        -------
-        pd.DataFrame
-            ohlcと特徴量の情報を持つDataFrame
-        """
-        df = df.copy()
-        df = self._cal_ATR(df=df, term=5)
-        for term in self.terms:
-            df = self._cal_SMA(df=df, term=term)
-            df = self._cal_std(df=df, term=term)
-            df = self._cal_EMA(df=df, term=term)
-        df = self._cal_MACD(df=df, short_term=9, long_term=17, signal_term=7)
-        df = self._cal_max_min_price(df=df, term=20)
-        return df.dropna()
-
-    def _cal_ATR(self, df: pd.DataFrame, term: int) -> pd.DataFrame:
-        """ATR(Average True Range)を求める
-
-        Parameters
-        ----------
-        df : pd.DataFrame
-            ohlcの情報を持つDataFrame
-        term : int
-            計算する期間
-
-        Returns
-        -------
-        pd.DataFrame
-            ohlcとATRの情報を持つDataFrame
-        """
-        df = df.copy()
-        df['ATR'] = (df['high'].rolling(window=term).sum() - df['low'].rolling(window=term).sum()) / term
-        return df
-
-    def _cal_SMA(self, df: pd.DataFrame, term: int) -> pd.DataFrame:
-        """SMA(Simple Moving Average)を求める
+    def update_from_stream(self, ohlcs: OhlcBuffer) -> None:
+        """WebSocketで受け取ったローソク足でdf_featuresの情報を更新する。
+        受け取った足との間に欠けている足がある場合は、先にREST APIで補う。
+        REST APIで補った後や再接続後に届いた、保持している最後の足より古い足は捨てる
 
         Parameters
         ----------
-        df : pd.DataFrame
-            ohlcの情報を持つDataFrame
-        term : int
-            計算する期間
-
-        Returns
-        -------
-        pd.DataFrame
-            ohlcとSMAの情報を持つDataFrame
+        ohlcs : OhlcBuffer
+            WebSocketで受け取ったローソク足
         """
-        df = df.copy()
-        df[f'sma_{term}'] = df['close'].rolling(window=term).mean()
-        return df
-
-    def _cal_std(self, df: pd.DataFrame, term: int) -> pd.DataFrame:
-        """ある期間の標準偏差を求める
-
-        Parameters
-        ----------
-        df : pd.DataFrame
-            ohlcの情報を持つDataFrame
-        term : int
-            計算する期間
-
-        Returns
-        -------
-        pd.DataFrame
-            ohlcとstdの情報を持つDataFrame
+        if len(ohlcs) == 0:
+            return None
+        received_at : float = time.perf_counter()
+        last_open_time = self.ohlc_store.ohlcs.last_open_time()
+        unit_seconds : int = unit_minutes[self.ohlc_store.time_interval] * 60
+        if last_open_time is None or int(ohlcs.open_time[0]) > last_open_time + unit_seconds:
+            self.update()
+        with self._lock, metrics.span(f'feature_update_seconds_{self.symbol}'):
+            last_open_time = self.ohlc_store.ohlcs.last_open_time()
+            if last_open_time is not None and int(ohlcs.open_time[0]) < last_open_time:
+                # 古い足をmergeすると、それ以降の新しい足が切り詰められてしまう
+                start : int = int(np.searchsorted(ohlcs.open_time, last_open_time, side='left'))
+                metrics.counter(f'stale_klines_dropped_{self.symbol}').inc(start)
+                if start == len(ohlcs):
+                    return None
+                fresh_ohlcs : OhlcBuffer = OhlcBuffer(capacity=len(ohlcs) - start)
+                fresh_ohlcs.extend(ohlcs.open_time[start:], ohlcs.values[start:])
+                ohlcs = fresh_ohlcs
+            self.ohlc_store.merge(ohlcs)
+            self.indicator_engine.update_from_buffer(ohlcs)
+            for timeframe in self.timeframes.values():
+                timeframe.update_from_buffer(ohlcs)
+            self._publish(received_at)
+
+    def backfill(self) -> None:
+        """前回以降のローソク足をREST APIで取得し、df_featuresの情報を更新する。
+        WebSocketの再接続時に、切断中に取りこぼした足を補うために用いる
         """
-        df = df.copy()
-        df[f'std_{term}'] = df['close'].rolling(window=term).std()
-        return df
-
-    def _cal_EMA(self, df: pd.DataFrame, term: int) -> pd.DataFrame:
-        """EMA(Exponential Moving Average)を求める
-
-        Parameters
-        ----------
-        df : pd.DataFrame
-            ohlcの情報を持つDataFrame
-        term : int
-            計算する期間
-
-        Returns
-        -------
-        pd.DataFrame
-            ohlcとEMAの情報を持つDataFrame
+        self.update()
+
+    def update(self) -> None:
+        """前回以降のローソク足をREST APIで取得してdf_featuresの情報を更新し、スナップショットを公開する"""
+        _ohlcs : OhlcBuffer = self.ohlc_store.update()  # 前回以降のローソク足のみを取得する
+        received_at : float = time.perf_counter()
+        with self._lock, metrics.span(f'feature_update_seconds_{self.symbol}'):
+            if not self._has_warmed_up_timeframes:
+                self._warm_up_timeframes()
+            self.indicator_engine.update_from_buffer(_ohlcs)  # 追加・更新された足の分だけ特徴量を更新する
+            for timeframe in self.timeframes.values():
+                timeframe.update_from_buffer(_ohlcs)
+            self._publish(received_at)
+
+    def _warm_up_timeframes(self) -> None:
+        """保持しているローソク足より前の期間を、上位足ごとに集計する。
+        上位足の特徴量を求めるには、保持しているローソク足の期間だけでは足りないため
+
+        アーカイブがその期間（max_ohlcs個の上位足）を含む場合はアーカイブから集計し、
+        含まない場合（初回の起動時やuses_archive=Falseの場合）は、上位足ごとに1度だけREST APIで取得する
         """
-        df = df.copy()
-        df[f'ema_{term}'] = df['close'].ewm(span=term, adjust=False).mean()
-        return df
-
-    def _cal_MACD(self, df: pd.DataFrame, short_term: int, long_term: int, signal_term: int) -> pd.DataFrame:
-        """MACDを求める
+        self._has_warmed_up_timeframes = True
+        first_open_time = int(self.ohlc_store.ohlcs.open_time[0]) if len(self.ohlc_store.ohlcs) else None
+        if first_open_time is None:
+            return None
+        now : int = int(self.api_client.clock())  # シミュレーションでは模擬した時刻
+        base_unit_seconds : int = unit_minutes[self.time_interval] * 60
+        for timeframe in self.timeframes.values():
+            unit_seconds : int = timeframe.resampler.unit_seconds
+            start_time : int = now - self.ohlc_store.max_ohlcs * unit_seconds
+            start_time -= start_time % unit_seconds  # 上位足の区切りから読み込む
+            if self.ohlc_store.archive is not None:
+                archived_ohlcs : OhlcBuffer = self.ohlc_store.archive.read_range(
+                    start_time=start_time, end_time=first_open_time)
+                if len(archived_ohlcs) and int(archived_ohlcs.open_time[0]) < start_time + base_unit_seconds:
+                    timeframe.warm_up(archived_ohlcs)
+                    continue
+            timeframe.seed(
+                self.api_client.get_ohlcs(
+                    symbol=self.symbol,
+                    time_interval=timeframe.time_interval,
+                    num_ohlcs=self.ohlc_store.max_ohlcs),
+                until=first_open_time)
+
+    def _publish(self, received_at: float) -> None:
+        """現在の特徴量のスナップショットを公開する
 
         Parameters
         ----------
-        df : pd.DataFrame
-            ohlcの情報を持つDataFrame
-        short_term : int
-            macdの短期期間
-        long_term : int
-            macdの長期期間
-        signal_term : int
-            シグナルの期間
-
-        Returns
-        -------
-        pd.DataFrame
-            ohlcとMACD, シグナルの情報を持つDataFrame
+        received_at : float
+            最後のローソク足を受け取った時刻（time.perf_counter）
         """
-        df = df.copy()
-        ema_short = df['close'].ewm(span=short_term, adjust=False).mean()
-        ema_long= df['close'].ewm(span=long_term, adjust=False).mean()
-        df[f'macd'] = (ema_short - ema_long)
-        df[f'macd_signal'] = (ema_short - ema_long).ewm(span=signal_term, adjust=False).mean()
-        return df
+        features : OhlcBuffer = self.indicator_engine.features
+        self.channel.publish(
+            open_time=self.ohlc_store.ohlcs.last_open_time(),
+            received_at=received_at,
+            latest_bars=self.indicator_engine.latest_bars(),
+            columns=self.indicator_engine.columns,
+            feature_open_time=features.open_time.copy(),  # バッファは次の足で書き換わるため
+            feature_values=features.values.copy())
+        for timeframe in self.timeframes.values():
+            timeframe.publish(received_at)
 
-    def _cal_max_min_price(self, df: pd.DataFrame, term: int) -> pd.DataFrame:
-        """指定の期間の最高値、最安値を求める
+    def _create_features(self, df: pd.DataFrame) -> pd.DataFrame:
+        """ohlcの情報を用いて、特徴量をまとめて求める。
+        indicator_engineと同じ特徴量を求めるため、結果の検証に用いる
 
         Parameters
         ----------
         df : pd.DataFrame
             ohlcの情報を持つDataFrame
-        term : int
-            計算する期間
 
         Returns
         -------
         pd.DataFrame
-            ohlcと指定の期間の最高値、最安値の情報を持つDataFrame
+            ohlcと特徴量の情報を持つDataFrame
         """
-        df = df.copy()
-        df[f'max_price'] = df['high'].rolling(window=term).max()
-        df[f'min_price'] = df['low'].rolling(window=term).min()
-        return df
+        with metrics.span(f'feature_build_seconds_{self.symbol}'):
+            return build_features(
+                open_time=df['open_time'].to_numpy(),
+                open=df['open'].to_numpy(),
+                high=df['high'].to_numpy(),
+                low=df['low'].to_numpy(),
+                close=df['close'].to_numpy(),
+                terms=self.terms,
+                atr_term=5,
+                macd_terms=(9, 17, 7),
+                donchian_term=20)
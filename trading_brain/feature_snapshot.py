@@ -0,0 +1,170 @@
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, List, Tuple, Union
+import threading
+
+import dateutil.tz
+import numpy as np
+import pandas as pd
+
+from utils.metrics import metrics
+
+
+class LatestBars:
+    """直近の数本のローソク足の特徴量を、Pythonのfloatとして保持するクラス。
+    判断のたびにDataFrameの行（Series）を作らずに、最新の値と1本前の値を参照するために用いる
+
+    Attributes
+    ----------
+    columns : List[str]
+        特徴量の列名
+    """
+    __slots__ = ('columns', '_column_index', '_rows')
+
+    def __init__(self, columns: List[str], values: np.ndarray) -> None:
+        """
+        Parameters
+        ----------
+        columns : List[str]
+            特徴量の列名
+        values : np.ndarray
+            (足の数, 列数)の値。古い順に並ぶ
+        """
+        self.columns : List[str] = columns
+        self._column_index : Dict[str, int] = {name: i for i, name in enumerate(columns)}
+        self._rows : List[List[float]] = values.tolist()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def last(self, column: str) -> float:
+        """最新の足の値"""
+        return self._rows[-1][self._column_index[column]]
+
+    def previous(self, column: str) -> float:
+        """1本前の足の値"""
+        return self._rows[-2][self._column_index[column]]
+
+    def window(self, column: str, num_bars: int) -> List[float]:
+        """直近num_bars本の値（古い順）"""
+        i : int = self._column_index[column]
+        return [row[i] for row in self._rows[-num_bars:]]
+
+    def key(self, columns: List[str], num_bars: int) -> Tuple[float, ...]:
+        """指定の列の直近num_bars本の値をまとめたタプル。値が変わったかの判定に用いる"""
+        indices : List[int] = [self._column_index[column] for column in columns]
+        return tuple(row[i] for row in self._rows[-num_bars:] for i in indices)
+
+
+@dataclass(frozen=True)
+class FeatureSnapshot:
+    """ある時点の特徴量を保持する変更不可のクラス
+
+    売買の判断はlatest_barsのみを参照するため、公開時には特徴量の配列をコピーするのみとし、
+    DataFrame（df_features）は最初に参照された時に作成する
+
+    Attributes
+    ----------
+    version : int
+        スナップショットが公開される度に1ずつ増える番号（SnapshotChannelごと）
+    open_time : int
+        最後のローソク足の取得時刻のタイムスタンプ
+    received_at : float
+        最後のローソク足を受け取った時刻（time.perf_counter）。判断までの遅延の計測に用いる
+    latest_bars : LatestBars
+        直近の数本の特徴量。売買の判断はこちらを参照する
+    columns : List[str]
+        特徴量を含めた列名
+    feature_open_time : np.ndarray
+        (足の数,)の取得時刻のタイムスタンプ。他のスナップショットと共有しないコピー
+    feature_values : np.ndarray
+        (足の数, 列数)のohlcと特徴量の値。他のスナップショットと共有しないコピー
+    df_features : pd.DataFrame
+        ohlcと特徴量の情報を持つDataFrame。特徴量が求まっていない行は含まない。最初に参照された時に作成する
+    """
+    version : int
+    open_time : int
+    received_at : float
+    latest_bars : LatestBars
+    columns : List[str]
+    feature_open_time : np.ndarray
+    feature_values : np.ndarray
+
+    @cached_property
+    def df_features(self) -> pd.DataFrame:
+        df : pd.DataFrame = pd.DataFrame(self.feature_values, columns=self.columns, copy=False)
+        open_time : pd.DatetimeIndex = pd.to_datetime(self.feature_open_time, unit='s', utc=True)
+        df.insert(0, 'open_time', open_time.tz_convert(dateutil.tz.tzlocal()).tz_localize(None))
+        return df.dropna()
+
+
+class SnapshotChannel:
+    """特徴量を作成するスレッドから、判断を行うスレッドへスナップショットを受け渡すクラス。
+    受け取る側は、まだ処理していない最新のスナップショットを一度だけ受け取る。
+    処理が追いつかずに上書きされたスナップショットは読み飛ばし、その数を記録する
+
+    Attributes
+    ----------
+    latest : FeatureSnapshot | None
+        最新のスナップショット
+    """
+    def __init__(self) -> None:
+        self._condition : threading.Condition = threading.Condition()
+        self._version : int = 0  # 公開した回数
+        self.latest : Union[FeatureSnapshot, None] = None
+
+    def publish(
+            self,
+            open_time: int,
+            received_at: float,
+            latest_bars: LatestBars,
+            columns: List[str],
+            feature_open_time: np.ndarray,
+            feature_values: np.ndarray) -> FeatureSnapshot:
+        """公開した回数をversionとしてスナップショットを作成して公開し、待機しているスレッドを起こす。
+        引数はFeatureSnapshotの同名の属性。配列はコピーしてから渡すこと
+
+        Returns
+        -------
+        FeatureSnapshot
+            公開したスナップショット
+        """
+        with self._condition:
+            self._version += 1
+            snapshot : FeatureSnapshot = FeatureSnapshot(
+                version=self._version,
+                open_time=open_time,
+                received_at=received_at,
+                latest_bars=latest_bars,
+                columns=columns,
+                feature_open_time=feature_open_time,
+                feature_values=feature_values)
+            self.latest = snapshot
+            self._condition.notify_all()
+        return snapshot
+
+    def wait_for_next(self, last_version: int, timeout: Union[float, None] = None) -> Union[FeatureSnapshot, None]:
+        """last_versionより新しいスナップショットが公開されるまで待機する
+
+        Parameters
+        ----------
+        last_version : int
+            最後に処理したスナップショットのversion
+        timeout : float | None
+            待機する最大の秒数。Noneの場合は公開されるまで待機する
+
+        Returns
+        -------
+        FeatureSnapshot | None
+            最新のスナップショット。timeoutまでに公開されなかった場合はNone
+        """
+        with self._condition:
+            has_published : bool = self._condition.wait_for(
+                lambda: self.latest is not None and self.latest.version > last_version,
+                timeout=timeout)
+            if not has_published:
+                return None
+            snapshot : FeatureSnapshot = self.latest
+        if last_version > 0 and snapshot.version > last_version + 1:
+            metrics.counter('feature_snapshots_skipped').inc(snapshot.version - last_version - 1)
+        return snapshot
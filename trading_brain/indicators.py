@@ -0,0 +1,294 @@
+from collections import deque
+from typing import Deque, List, Tuple, Union
+import math
+
+import pandas as pd
+
+import constants
+from trading_api.trading_api import OhlcBuffer
+from trading_brain.feature_snapshot import LatestBars
+
+
+class RollingMean:
+    """直近の指定期間の平均を、合計値を保持することで逐次的に求めるクラス
+
+    Attributes
+    ----------
+    term : int
+        計算する期間
+    value : float
+        直近の期間の平均。値の数が期間に満たない場合はnan
+    """
+    def __init__(self, term: int) -> None:
+        self.term : int = term
+        self._window : Deque[float] = deque(maxlen=term)
+        self._sum : float = 0.0
+        self._num_pushed : int = 0
+
+    def push(self, x: float) -> None:
+        """新しい値を追加する"""
+        if len(self._window) == self.term:
+            self._sum -= self._window[0]
+        self._window.append(x)
+        self._sum += x
+        self._num_pushed += 1
+        if self._num_pushed % self.term == 0:
+            self._sum = math.fsum(self._window)  # 丸め誤差の蓄積を防ぐため、期間ごとに合計を求め直す
+
+    def replace_last(self, x: float) -> None:
+        """最後に追加した値を置き換える"""
+        self._sum += x - self._window[-1]
+        self._window[-1] = x
+
+    @property
+    def value(self) -> float:
+        if len(self._window) < self.term:
+            return math.nan
+        return self._sum / self.term
+
+
+class RollingStd:
+    """直近の指定期間の標準偏差（不偏）を、Welford法の追加・削除で逐次的に求めるクラス。
+    二乗和をそのまま保持するよりも、価格の桁が大きい場合の桁落ちが小さい
+
+    Attributes
+    ----------
+    term : int
+        計算する期間
+    value : float
+        直近の期間の標準偏差。値の数が期間に満たない場合はnan
+    """
+    def __init__(self, term: int) -> None:
+        self.term : int = term
+        self._window : Deque[float] = deque(maxlen=term)
+        self._mean : float = 0.0
+        self._m2 : float = 0.0  # 平均からの偏差の二乗和
+
+    def _add(self, x: float) -> None:
+        n : int = len(self._window)  # 追加後の個数
+        delta : float = x - self._mean
+        self._mean += delta / n
+        self._m2 += delta * (x - self._mean)
+
+    def _remove(self, x: float) -> None:
+        n : int = len(self._window)  # 削除後の個数
+        if n == 0:
+            self._mean, self._m2 = 0.0, 0.0
+            return
+        delta : float = x - self._mean
+        self._mean -= delta / n
+        self._m2 -= delta * (x - self._mean)
+
+    def push(self, x: float) -> None:
+        """新しい値を追加する"""
+        if len(self._window) == self.term:
+            oldest : float = self._window.popleft()
+            self._remove(oldest)
+        self._window.append(x)
+        self._add(x)
+
+    def replace_last(self, x: float) -> None:
+        """最後に追加した値を置き換える"""
+        last : float = self._window.pop()
+        self._remove(last)
+        self._window.append(x)
+        self._add(x)
+
+    @property
+    def value(self) -> float:
+        if len(self._window) < self.term:
+            return math.nan
+        return math.sqrt(max(self._m2, 0.0) / (self.term - 1))
+
+
+class RollingExtremum:
+    """直近の指定期間の最大値もしくは最小値を、単調キューを用いて求めるクラス
+
+    Attributes
+    ----------
+    term : int
+        計算する期間
+    is_max : bool
+        Trueの時は最大値、Falseの時は最小値を求める
+    value : float
+        直近の期間の最大値もしくは最小値。値の数が期間に満たない場合はnan
+    """
+    def __init__(self, term: int, is_max: bool) -> None:
+        self.term : int = term
+        self.is_max : bool = is_max
+        self._deque : Deque[Tuple[int, float]] = deque()  # (index, 値)
+        self._index : int = -1
+        # 最後のpushで取り除いた要素。replace_lastで元に戻すために保持する
+        self._popped_front : Union[Tuple[int, float], None] = None
+        self._popped_back : List[Tuple[int, float]] = []
+
+    def _is_dominated(self, old: float, new: float) -> bool:
+        return old <= new if self.is_max else old >= new
+
+    def push(self, x: float) -> None:
+        """新しい値を追加する"""
+        self._index += 1
+        self._popped_front = None
+        if self._deque and self._deque[0][0] <= self._index - self.term:
+            self._popped_front = self._deque.popleft()
+        self._popped_back = []
+        while self._deque and self._is_dominated(self._deque[-1][1], x):
+            self._popped_back.append(self._deque.pop())
+        self._deque.append((self._index, x))
+
+    def replace_last(self, x: float) -> None:
+        """最後に追加した値を置き換える"""
+        self._deque.pop()  # 最後に追加した値は必ず末尾にある
+        self._deque.extend(reversed(self._popped_back))
+        if self._popped_front is not None:
+            self._deque.appendleft(self._popped_front)
+        self._index -= 1
+        self.push(x)
+
+    @property
+    def value(self) -> float:
+        if self._index + 1 < self.term:
+            return math.nan
+        return self._deque[0][1]
+
+
+class ExponentialMovingAverage:
+    """EMAを逐次的に求めるクラス。pandasのewm(span=term, adjust=False)と同じ値となる
+
+    Attributes
+    ----------
+    term : int
+        計算する期間
+    value : float
+        最新のEMA。値が一つも追加されていない場合はnan
+    """
+    def __init__(self, term: int) -> None:
+        self.term : int = term
+        self.alpha : float = 2 / (term + 1)
+        self._prev_value : float = math.nan  # 最後の値を追加する前のEMA
+        self.value : float = math.nan
+
+    def _cal(self, x: float) -> float:
+        if math.isnan(self._prev_value):
+            return x
+        return self.alpha * x + (1 - self.alpha) * self._prev_value
+
+    def push(self, x: float) -> None:
+        """新しい値を追加する"""
+        self._prev_value = self.value
+        self.value = self._cal(x)
+
+    def replace_last(self, x: float) -> None:
+        """最後に追加した値を置き換える"""
+        self.value = self._cal(x)
+
+
+class IndicatorEngine:
+    """ローソク足が追加・更新される度に、全ての特徴量を定数時間で更新するクラス。
+    FeaturesCreator._create_featuresと同じ特徴量を求める
+
+    EMAは保持している足の先頭からではなく、最初に追加された足から計算し続けるため、
+    _create_featuresとの差は(1 - alpha)^NUMBER_OF_OHLCS程度となり無視できる
+
+    Attributes
+    ----------
+    columns : List[str]
+        特徴量を含めた列名
+    version : int
+        特徴量が更新された回数
+    features : OhlcBuffer
+        ohlcと特徴量を列ごとに保持するバッファ
+
+    Methods
+    -------
+    update -> None
+        ローソク足を追加する。最後の足と同じ時刻の足の場合は、最後の足を置き換える
+    update_from_buffer -> None
+        OhlcBufferの全てのローソク足を順に追加する
+    latest_bars -> LatestBars
+        直近の数本の特徴量を、Pythonのfloatとして返却する
+    to_frame -> pd.DataFrame
+        保持しているローソク足と特徴量をDataFrameとして返却する
+    """
+    def __init__(
+            self,
+            terms: List[int],
+            atr_term: int = 5,
+            macd_terms: Tuple[int, int, int] = (9, 17, 7),
+            donchian_term: int = 20,
+            max_ohlcs: int = constants.NUMBER_OF_OHLCS) -> None:
+        short_term, long_term, signal_term = macd_terms
+        self._atr_high : RollingMean = RollingMean(atr_term)
+        self._atr_low : RollingMean = RollingMean(atr_term)
+        self._smas : List[RollingMean] = [RollingMean(term) for term in terms]
+        self._stds : List[RollingStd] = [RollingStd(term) for term in terms]
+        self._emas : List[ExponentialMovingAverage] = [ExponentialMovingAverage(term) for term in terms]
+        self._ema_short : ExponentialMovingAverage = ExponentialMovingAverage(short_term)
+        self._ema_long : ExponentialMovingAverage = ExponentialMovingAverage(long_term)
+        self._macd_signal : ExponentialMovingAverage = ExponentialMovingAverage(signal_term)
+        self._max_price : RollingExtremum = RollingExtremum(donchian_term, is_max=True)
+        self._min_price : RollingExtremum = RollingExtremum(donchian_term, is_max=False)
+
+        self.columns : List[str] = ['open', 'high', 'low', 'close', 'ATR']
+        for term in terms:
+            self.columns += [f'sma_{term}', f'std_{term}', f'ema_{term}']
+        self.columns += ['macd', 'macd_signal', 'max_price', 'min_price']
+        self.features : OhlcBuffer = OhlcBuffer(capacity=max_ohlcs, columns=self.columns)
+        self.version : int = 0
+
+    def update(self, open_time: int, open: float, high: float, low: float, close: float) -> None:
+        """ローソク足を追加する。最後の足と同じ時刻の足の場合は、最後の足を置き換える
+
+        Parameters
+        ----------
+        open_time : int
+            ローソク足の取得時刻のタイムスタンプ
+        open, high, low, close : float
+            始値、高値、安値、終値
+        """
+        last_open_time : Union[int, None] = self.features.last_open_time()
+        is_replacement : bool = last_open_time == open_time
+        if not is_replacement and last_open_time is not None and last_open_time > open_time:
+            raise ValueError(f'ohlc is older than the last one: open_time={open_time}')
+        apply = 'replace_last' if is_replacement else 'push'
+
+        getattr(self._atr_high, apply)(high)
+        getattr(self._atr_low, apply)(low)
+        row : List[float] = [open, high, low, close, self._atr_high.value - self._atr_low.value]
+        for sma, std, ema in zip(self._smas, self._stds, self._emas):
+            getattr(sma, apply)(close)
+            getattr(std, apply)(close)
+            getattr(ema, apply)(close)
+            row += [sma.value, std.value, ema.value]
+        getattr(self._ema_short, apply)(close)
+        getattr(self._ema_long, apply)(close)
+        macd : float = self._ema_short.value - self._ema_long.value
+        getattr(self._macd_signal, apply)(macd)
+        getattr(self._max_price, apply)(high)
+        getattr(self._min_price, apply)(low)
+        row += [macd, self._macd_signal.value, self._max_price.value, self._min_price.value]
+
+        if is_replacement:
+            self.features.set_last(row)
+        else:
+            self.features.append(open_time, row)
+        self.version += 1
+
+    def update_from_buffer(self, ohlcs: OhlcBuffer) -> None:
+        """OhlcBufferの全てのローソク足を順に追加する"""
+        for open_time, (open, high, low, close) in zip(ohlcs.open_time.tolist(), ohlcs.values[:, :4].tolist()):
+            self.update(open_time, open, high, low, close)
+
+    def latest_bars(self, num_bars: int = constants.NUMBER_OF_LATEST_BARS) -> LatestBars:
+        """直近num_bars本の特徴量を、Pythonのfloatとして返却する"""
+        return LatestBars(columns=self.columns, values=self.features.values[-num_bars:])
+
+    def to_frame(self) -> pd.DataFrame:
+        """保持しているローソク足と特徴量をDataFrameとして返却する
+
+        Returns
+        -------
+        pd.DataFrame
+            ohlcと特徴量の情報を持つDataFrame。特徴量が求まっていない行は含まない
+        """
+        return self.features.to_frame().dropna()
@@ -1,65 +1,160 @@
-import numpy as np
+from abc import ABC, abstractmethod
+from typing import Dict, List, Tuple, Type, Union
+import time
 
 import constants
-from trading_brain.feature_creation import SingletonFeaturesCreator
+from trading_brain.feature_snapshot import LatestBars
 from logger import Logger
+from utils.metrics import metrics
 
 logger = Logger()
 
 
-class Judgement:
-    def __init__(self, position_side : str) -> None:
-        self.signal_to_create_order : int = 0
-        _featuers_creator = SingletonFeaturesCreator()
-        self.df_features = _featuers_creator.df_features
-        self.position_side : str = position_side
-        self._judge_by_ensemble()
-
-    def _judge_by_ensemble(self):
-        self._judge_by_donchian()
-        # self._judge_by_MACD()
-
-    def _judge_by_donchian(self):
-        now_price : float = self.df_features.iloc[-1]['close']
-        max_price_over_past : float = self.df_features.iloc[-2]['max_price']
-        min_price_over_past : float = self.df_features.iloc[-2]['min_price']
-        if (now_price > max_price_over_past) and (not self.position_side == constants.BUY):
-            self.signal_to_create_order += 1
+class Strategy(ABC):
+    """売買のシグナルを出す戦略の基底クラス。
+    継承したクラスをregister_strategyで登録し、constants.STRATEGY_WEIGHTSで重みを指定すると判断に用いられる。
+    voteを実装していない戦略は、トレードの途中ではなくインスタンスの作成時にTypeErrorとなる
+
+    Attributes
+    ----------
+    name : str
+        登録名。重みの指定やメトリクスの名前に用いる
+    columns : List[str]
+        判断に用いる特徴量の列名
+    lookback : int
+        判断に用いる直近の足の数（constants.NUMBER_OF_LATEST_BARS以下）
+    """
+    name : str = ''
+    columns : List[str] = []
+    lookback : int = 2
+
+    @abstractmethod
+    def vote(self, bars: LatestBars, position_side: str) -> int:
+        """直近の特徴量から売買のシグナルを出す
+
+        Parameters
+        ----------
+        bars : LatestBars
+            直近の数本の特徴量。columnsの列の直近lookback本のみを参照すること
+        position_side : str = constants.BUY | constants.SELL | constants.NONE
+            現在のポジション
+
+        Returns
+        -------
+        int
+            買いの場合は1、売りの場合は-1、どちらでもない場合は0
+        """
+
+
+strategy_registry : Dict[str, Type[Strategy]] = {}
+
+
+def register_strategy(cls: Type[Strategy]) -> Type[Strategy]:
+    """戦略をstrategy_registryに登録するデコレータ"""
+    strategy_registry[cls.name] = cls
+    return cls
+
+
+@register_strategy
+class DonchianStrategy(Strategy):
+    """終値が直前の足までの最高値を超えたら買い、最安値を下回ったら売り"""
+    name = 'donchian'
+    columns = ['close', 'max_price', 'min_price']
+    lookback = 2
+
+    def vote(self, bars: LatestBars, position_side: str) -> int:
+        now_price : float = bars.last('close')
+        max_price_over_past : float = bars.previous('max_price')
+        min_price_over_past : float = bars.previous('min_price')
+        signal : int = 0
+        if (now_price > max_price_over_past) and (not position_side == constants.BUY):
+            signal += 1
             logger.info('donchian made a buying decision')
-        if (now_price < min_price_over_past) and (not self.position_side == constants.SELL):
-            self.signal_to_create_order -= 1
+        if (now_price < min_price_over_past) and (not position_side == constants.SELL):
+            signal -= 1
             logger.info('donchian made a selling decision')
+        return signal
+
+
+@register_strategy
+class MacdStrategy(Strategy):
+    """MACDがシグナルを0より下で上抜けたら買い、0より上で下抜けたら売り。
+    ポジションを保持している時は、決済となる方向のシグナルのみを出す
+    """
+    name = 'macd'
+    columns = ['macd', 'macd_signal']
+    lookback = 2
+
+    def vote(self, bars: LatestBars, position_side: str) -> int:
+        before_macd, after_macd = bars.previous('macd'), bars.last('macd')
+        before_signal, after_signal = bars.previous('macd_signal'), bars.last('macd_signal')
+        crosses_up : bool = before_macd < 0 and before_signal < 0 and before_macd < before_signal and after_macd > after_signal
+        crosses_down : bool = before_macd > 0 and before_signal > 0 and before_macd > before_signal and after_macd < after_signal
+        if crosses_up and position_side != constants.BUY:
+            logger.info('MACD made a buying decision')
+            return 1
+        if crosses_down and position_side != constants.SELL:
+            logger.info('MACD made a selling decision')
+            return -1
+        return 0
+
+
+class Judgement:
+    """登録された戦略のシグナルの重み付き和で、注文を出すか否かを判断するクラス
+
+    各戦略は、判断に用いる列の直近の値と現在のポジションが前回の判断から変わっていない場合は評価せず、
+    前回のシグナルを使い回す。戦略ごとの評価時間はstrategy_seconds_{name}として記録する
+
+    Attributes
+    ----------
+    strategies : List[Tuple[Strategy, float]]
+        判断に用いる戦略とその重み
+    signal_to_create_order : float
+        最後の判断でのシグナルの重み付き和。1以上で買い、-1以下で売り
+
+    Methods
+    -------
+    judge -> float
+        最新の特徴量から、シグナルの重み付き和を求める
+    """
+    def __init__(self, strategy_weights: Union[Dict[str, float], None] = None) -> None:
+        if strategy_weights is None:
+            strategy_weights = constants.STRATEGY_WEIGHTS
+        self.strategies : List[Tuple[Strategy, float]] = [
+            (strategy_registry[name](), weight) for name, weight in strategy_weights.items() if weight != 0]
+        self.signal_to_create_order : float = 0.0
+        self._last_inputs : Dict[str, Tuple] = {}  # 戦略ごとの、前回評価した際の入力
+        self._last_votes : Dict[str, int] = {}  # 戦略ごとの、前回のシグナル
+
+    def judge(self, position_side: str, bars: LatestBars) -> float:
+        """最新の特徴量から、シグナルの重み付き和を求める
+
+        Parameters
+        ----------
+        position_side : str = constants.BUY | constants.SELL | constants.NONE
+            現在のポジション
+        bars : LatestBars
+            直近の数本の特徴量
+
+        Returns
+        -------
+        float
+            シグナルの重み付き和。1以上で買い、-1以下で売り
+        """
+        self.signal_to_create_order = 0.0
+        for strategy, weight in self.strategies:
+            self.signal_to_create_order += weight * self._vote(strategy, bars, position_side)
+        return self.signal_to_create_order
 
-    def _judge_by_MACD(self):
-        macd = np.array(self.features_creator.df_features['macd'])
-        macd_signal = np.array(self.features_creator.df_features['macd_signal'])
-
-        before_macd, after_macd = macd[-2], macd[-1]
-        before_signal, after_signal = macd_signal[-2], macd_signal[-1]
-
-        if self.position_side == constants.NONE:
-            # ポジションを保持していない時
-            # 買いのシグナル
-            if before_macd < 0 and before_signal < 0:
-                if before_macd < before_signal and after_macd > after_signal:
-                    self.signal_flag = 1
-                    logger.info('MACD made a buying decision')
-            # 売りのシグナル
-            if before_macd > 0 and before_signal > 0:
-                if before_macd > before_signal and after_macd < after_signal:
-                    self.signal_flag = -1
-                    logger.info('MACD made a selling decision')
-
-        elif self.position_side == constants.BUY:
-            # 買いのポジションを保持している時
-            if before_macd > 0 and before_signal > 0:
-                if before_macd > before_signal and after_macd < after_signal:
-                    self.signal_flag = -1
-                    logger.info('MACD made a selling decision')
-
-        elif self.position_side == constants.SELL:
-            # 売りのポジションを保持している時
-            if before_macd < 0 and before_signal < 0:
-                if before_macd < before_signal and after_macd > after_signal:
-                    self.signal_flag = 1
-                    logger.info('MACD made a buying decision')
+    def _vote(self, strategy: Strategy, bars: LatestBars, position_side: str) -> int:
+        """入力が前回から変わっている場合のみ戦略を評価する"""
+        key : Tuple = (position_side,) + bars.key(strategy.columns, strategy.lookback)
+        if self._last_inputs.get(strategy.name) == key:
+            metrics.counter(f'strategy_skipped_{strategy.name}').inc()
+            return self._last_votes[strategy.name]
+        started_at : float = time.perf_counter()
+        vote : int = strategy.vote(bars, position_side)
+        metrics.histogram(f'strategy_seconds_{strategy.name}').observe(time.perf_counter() - started_at)
+        self._last_inputs[strategy.name] = key
+        self._last_votes[strategy.name] = vote
+        return vote
@@ -0,0 +1,194 @@
+from typing import Tuple, Union
+import math
+
+import numpy as np
+import pandas as pd
+
+from trading_api.trading_api import OhlcBuffer, unit_minutes
+from trading_brain.indicators import IndicatorEngine
+from trading_brain.feature_snapshot import SnapshotChannel
+
+
+class OhlcResampler:
+    """下位足のローソク足から、上位足のローソク足を逐次的に作成するクラス
+
+    上位足はタイムスタンプをその単位時間で割り切れる時刻（UTC）で区切るため、bybitの上位足と同じ区間となる。
+    確定前の下位足が同じ時刻で繰り返し届いても正しく集計できるよう、
+    現在の上位足のうち確定した下位足の集計と、最後の下位足を分けて保持する
+
+    Attributes
+    ----------
+    time_interval : str = constants.DURATION_5M | constants.DURATION_30M | ...
+        上位足の単位時間
+    unit_seconds : int
+        上位足の単位時間（秒）
+    """
+    def __init__(self, time_interval: str) -> None:
+        self.time_interval : str = time_interval
+        self.unit_seconds : int = unit_minutes[time_interval] * 60
+        self._bar_open_time : Union[int, None] = None  # 現在の上位足の取得時刻
+        self._confirmed : Tuple[float, float, float] = (math.nan, -math.inf, math.inf)  # 確定した下位足の(始値, 高値, 安値)
+        self._last_open_time : Union[int, None] = None  # 最後の下位足の取得時刻
+        self._last : Tuple[float, float, float, float] = (math.nan, math.nan, math.nan, math.nan)
+
+    def seed(self, bar_open_time: int, open: float, high: float, low: float) -> None:
+        """REST APIで取得した上位足を、現在の上位足の集計の初期値とする。
+        その上位足のうち、下位足として受け取っていない期間を補うために用いる
+
+        Parameters
+        ----------
+        bar_open_time : int
+            上位足の取得時刻のタイムスタンプ
+        open, high, low : float
+            上位足の始値、高値、安値
+        """
+        self._bar_open_time = bar_open_time
+        self._confirmed = (open, high, low)
+        self._last_open_time = None
+        self._last = (math.nan, -math.inf, math.inf, math.nan)
+
+    def update(
+            self,
+            open_time: int,
+            open: float,
+            high: float,
+            low: float,
+            close: float) -> Union[Tuple[int, float, float, float, float], None]:
+        """下位足を1本反映し、その下位足を含む上位足を返却する
+
+        Parameters
+        ----------
+        open_time : int
+            下位足の取得時刻のタイムスタンプ
+        open, high, low, close : float
+            下位足の始値、高値、安値、終値
+
+        Returns
+        -------
+        Tuple[int, float, float, float, float] | None
+            上位足の(取得時刻, 始値, 高値, 安値, 終値)。確定前の場合もある。
+            最後の下位足より古い足の場合は、集計済みのため反映せずNoneを返却する
+        """
+        if self._last_open_time is not None and open_time < self._last_open_time:
+            return None
+        bar_open_time : int = open_time - open_time % self.unit_seconds
+        if bar_open_time != self._bar_open_time:
+            # 新しい上位足を開始する
+            self._bar_open_time = bar_open_time
+            self._confirmed = (open, -math.inf, math.inf)
+        elif open_time != self._last_open_time:
+            # 最後の下位足が確定したため、集計に含める
+            confirmed_open, confirmed_high, confirmed_low = self._confirmed
+            _, last_high, last_low, _ = self._last
+            self._confirmed = (confirmed_open, max(confirmed_high, last_high), min(confirmed_low, last_low))
+        self._last_open_time = open_time
+        self._last = (open, high, low, close)
+
+        bar_open, confirmed_high, confirmed_low = self._confirmed
+        return (bar_open_time, bar_open, max(confirmed_high, high), min(confirmed_low, low), close)
+
+
+class TimeframeFeatures:
+    """下位足から作成した上位足と、その特徴量を保持するクラス
+
+    Attributes
+    ----------
+    time_interval : str = constants.DURATION_5M | constants.DURATION_30M | ...
+        上位足の単位時間
+    resampler : OhlcResampler
+        下位足から上位足を作成するインスタンス
+    indicator_engine : IndicatorEngine
+        上位足の特徴量を逐次的に更新するインスタンス
+    channel : SnapshotChannel
+        上位足の特徴量が更新される度に、その時点のスナップショットを公開するチャネル
+    df_features : pd.DataFrame
+        上位足のohlcと特徴量の情報を持つDataFrame（最新のスナップショットのもの）
+    """
+    def __init__(self, time_interval: str, indicator_engine: IndicatorEngine) -> None:
+        self.time_interval : str = time_interval
+        self.resampler : OhlcResampler = OhlcResampler(time_interval)
+        self.indicator_engine : IndicatorEngine = indicator_engine
+        self.channel : SnapshotChannel = SnapshotChannel()
+
+    @property
+    def df_features(self) -> pd.DataFrame:
+        """上位足のohlcと特徴量の情報を持つDataFrame（最新のスナップショットのもの）"""
+        return self.channel.latest.df_features
+
+    def update_from_buffer(self, ohlcs: OhlcBuffer) -> None:
+        """下位足を順に反映し、上位足の特徴量を更新する"""
+        for open_time, (open, high, low, close) in zip(ohlcs.open_time.tolist(), ohlcs.values[:, :4].tolist()):
+            bar = self.resampler.update(open_time, open, high, low, close)
+            if bar is not None:
+                self.indicator_engine.update(*bar)
+
+    def warm_up(self, ohlcs: OhlcBuffer) -> None:
+        """過去の下位足をまとめて集計し、上位足の特徴量を求める。
+        次の上位足が始まっている上位足は確定しているためNumPyでまとめて集計し、
+        最後の上位足のみ、続く下位足と集計するためにresamplerへ渡す
+
+        Parameters
+        ----------
+        ohlcs : OhlcBuffer
+            過去の下位足。古い順に並ぶ
+        """
+        if len(ohlcs) == 0:
+            return None
+        bar_open_time : np.ndarray = ohlcs.open_time - ohlcs.open_time % self.resampler.unit_seconds
+        starts : np.ndarray = np.flatnonzero(np.r_[True, bar_open_time[1:] != bar_open_time[:-1]])
+        last_start : int = int(starts[-1])
+        complete_starts : np.ndarray = starts[:-1]
+        if len(complete_starts):
+            bars = zip(
+                bar_open_time[complete_starts].tolist(),
+                ohlcs.column('open')[complete_starts].tolist(),
+                np.maximum.reduceat(ohlcs.column('high')[:last_start], complete_starts).tolist(),
+                np.minimum.reduceat(ohlcs.column('low')[:last_start], complete_starts).tolist(),
+                ohlcs.column('close')[np.r_[complete_starts[1:], last_start] - 1].tolist())
+            for bar in bars:
+                self.indicator_engine.update(*bar)
+        last_bar_ohlcs : OhlcBuffer = OhlcBuffer(capacity=len(ohlcs) - last_start)
+        last_bar_ohlcs.extend(ohlcs.open_time[last_start:], ohlcs.values[last_start:])
+        self.update_from_buffer(last_bar_ohlcs)
+
+    def seed(self, ohlcs: OhlcBuffer, until: int) -> None:
+        """REST APIで取得した上位足で、下位足を保持していない期間の特徴量を求める
+
+        Parameters
+        ----------
+        ohlcs : OhlcBuffer
+            REST APIで取得した上位足。古い順に並ぶ
+        until : int
+            保持している最初の下位足の取得時刻のタイムスタンプ。
+            この時刻を含む上位足が途中から始まる場合は、その上位足の始値・高値・安値をresamplerの初期値とする
+        """
+        bar_open_time : int = until - until % self.resampler.unit_seconds
+        end : int = int(np.searchsorted(ohlcs.open_time, bar_open_time, side='left'))
+        bars = zip(
+            ohlcs.open_time[:end].tolist(),
+            ohlcs.column('open')[:end].tolist(),
+            ohlcs.column('high')[:end].tolist(),
+            ohlcs.column('low')[:end].tolist(),
+            ohlcs.column('close')[:end].tolist())
+        for bar in bars:
+            self.indicator_engine.update(*bar)
+        if until != bar_open_time and end < len(ohlcs) and int(ohlcs.open_time[end]) == bar_open_time:
+            open, high, low, _ = ohlcs.values[end, :4].tolist()
+            self.resampler.seed(bar_open_time, open, high, low)
+
+    def publish(self, received_at: float) -> None:
+        """現在の上位足の特徴量のスナップショットを公開する
+
+        Parameters
+        ----------
+        received_at : float
+            最後の下位足を受け取った時刻（time.perf_counter）
+        """
+        features : OhlcBuffer = self.indicator_engine.features
+        self.channel.publish(
+            open_time=features.last_open_time(),
+            received_at=received_at,
+            latest_bars=self.indicator_engine.latest_bars(),
+            columns=self.indicator_engine.columns,
+            feature_open_time=features.open_time.copy(),
+            feature_values=features.values.copy())
@@ -0,0 +1,157 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Union
+import time
+
+import constants
+import settings
+from trading_api.trading_api import ApiClient
+from trading_api.realtime import RealtimeClient
+from trading_brain.feature_creation import FeaturesCreator
+from orders.orders import Trader
+from profit_and_loss.pl_writer import PLWriter
+from logger import Logger
+from utils.metrics import metrics
+from utils.metrics_server import MetricsServer
+
+logger = Logger()
+
+
+class TradingPipeline:
+    """1つの通貨について、特徴量の作成とトレードを行うクラス
+
+    Attributes
+    ----------
+    features_creator : FeaturesCreator
+        この通貨の特徴量生成インスタンス。上位足の特徴量も、最も短い単位時間のローソク足から同時に作成する
+    trader : Trader
+        トレードを行うインスタンス
+    """
+    def __init__(
+            self,
+            api_client: ApiClient,
+            symbol: str,
+            time_interval: str,
+            resampled_time_intervals: List[str],
+            pl_writer: Union[PLWriter, None] = None) -> None:
+        self.features_creator : FeaturesCreator = FeaturesCreator(
+            api_client=api_client,
+            symbol=symbol,
+            time_interval=time_interval,
+            resampled_time_intervals=resampled_time_intervals)
+        self.trader : Trader = Trader(api_client=api_client, features_creator=self.features_creator, pl_writer=pl_writer)
+
+    @property
+    def name(self) -> str:
+        return self.features_creator.symbol
+
+
+class TradingRuntime:
+    """複数の通貨のパイプラインを1つのプロセスで動かすクラス
+
+    全てのパイプラインで1つのApiClient（レート制限、ポジションと残高のキャッシュ）を共有する。
+    ローソク足は通貨ごとに先頭の単位時間のもののみを取得し、それ以外の単位時間はそこから集計する。
+    トレードは先頭の単位時間の特徴量が更新される度に判断する
+
+    Attributes
+    ----------
+    api_client : ApiClient
+        全てのパイプラインで共有するbybitAPIラッパーインスタンス
+    pipelines : List[TradingPipeline]
+        通貨ごとのパイプライン
+    pl_writer : PLWriter
+        全てのパイプラインの損益をまとめて書き込むインスタンス
+    use_websocket : bool
+        WebSocketでローソク足を受け取る場合はTrue。Falseの場合はconstants.UPDATE_INTERVAL秒ごとにREST APIで取得する
+    metrics_server : MetricsServer | None
+        runの間、メトリクスとサンプリングプロファイラを公開するサーバー。constants.METRICS_PORTが0の場合はNone
+
+    Methods
+    -------
+    update_all -> None
+        全てのパイプラインの特徴量をREST APIで並行して更新する
+    run -> None
+        全てのパイプラインの特徴量の作成とトレードを開始する
+    """
+    def __init__(
+            self,
+            symbols: List[str],
+            time_intervals: List[str],
+            api_client: Union[ApiClient, None] = None,
+            use_websocket: bool = settings.use_websocket) -> None:
+        self.api_client : ApiClient = api_client if api_client is not None else ApiClient()
+        self.use_websocket : bool = use_websocket
+        self.pl_writer : PLWriter = PLWriter()
+        self.metrics_server : Union[MetricsServer, None] = MetricsServer() if constants.METRICS_PORT else None
+        # パイプラインの作成時に最初のローソク足を取得するため、並行して作成する
+        self._update_executor : ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=constants.MAX_CONCURRENT_UPDATES, thread_name_prefix='update')
+        self.pipelines : List[TradingPipeline] = list(self._update_executor.map(
+            lambda symbol: TradingPipeline(
+                api_client=self.api_client,
+                symbol=symbol,
+                time_interval=time_intervals[0],
+                resampled_time_intervals=time_intervals[1:],
+                pl_writer=self.pl_writer),
+            symbols))
+
+    def update_all(self) -> None:
+        """全てのパイプラインの特徴量をREST APIで並行して更新する。
+        ある通貨で例外が発生しても、他の通貨の更新は続ける
+        """
+        started_at : float = time.perf_counter()
+        futures : Dict[str, Future] = {
+            pipeline.name: self._update_executor.submit(pipeline.features_creator.update) for pipeline in self.pipelines}
+        for name, future in futures.items():
+            try:
+                future.result()
+            except Exception:
+                logger.error(f'failed to update features: {name}')
+        metrics.histogram('runtime_update_cycle_seconds').observe(time.perf_counter() - started_at)
+
+    def create_features_in_realtime(self) -> None:
+        """constants.UPDATE_INTERVAL秒ごとに、全てのパイプラインの特徴量を更新する"""
+        while True:
+            started_at : float = time.monotonic()
+            self.update_all()
+            time.sleep(max(constants.UPDATE_INTERVAL - (time.monotonic() - started_at), 0.0))
+
+    def create_realtime_client(self) -> RealtimeClient:
+        """全てのパイプラインのローソク足、ポジション、注文を1つの接続で購読するクライアントを作成する"""
+        traders : List[Trader] = [pipeline.trader for pipeline in self.pipelines]
+        return RealtimeClient(
+            on_kline={
+                (pipeline.features_creator.symbol, pipeline.features_creator.time_interval):
+                    pipeline.features_creator.update_from_stream
+                for pipeline in self.pipelines},
+            on_position={trader.symbol: trader.on_position for trader in traders},
+            on_order={trader.symbol: trader.on_order for trader in traders},
+            on_stop_order={trader.symbol: trader.on_stop_order for trader in traders},
+            on_reconnect=self._on_reconnect,
+            on_connection_change=self.api_client.account_state_cache.set_streaming)
+
+    def _on_reconnect(self) -> None:
+        """WebSocketが再接続した際に、切断中に取りこぼしたローソク足と逆指値注文の状態を補う"""
+        for pipeline in self.pipelines:
+            pipeline.trader.on_reconnect()
+        self.update_all()
+
+    def run(self) -> None:
+        """全てのパイプラインの特徴量の作成とトレードを開始する。
+        終了する際（KeyboardInterruptなど）は、書き込み待ちの損益を書き込み、メトリクスの公開を停止する
+        """
+        traders : List[Trader] = [pipeline.trader for pipeline in self.pipelines]
+        logger.info(f'start trading: {[pipeline.name for pipeline in self.pipelines]}')
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        try:
+            with ThreadPoolExecutor(max_workers=len(traders) + 1, thread_name_prefix="thread") as executor:
+                if self.use_websocket:
+                    executor.submit(self.create_realtime_client().run_forever)
+                else:
+                    executor.submit(self.create_features_in_realtime)
+                for trader in traders:
+                    executor.submit(trader.trade)
+        finally:
+            self.pl_writer.close()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
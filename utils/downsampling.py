@@ -0,0 +1,83 @@
+from typing import Tuple
+
+import numpy as np
+
+
+def downsample_ohlc(
+        open_time: np.ndarray,
+        open: np.ndarray,
+        high: np.ndarray,
+        low: np.ndarray,
+        close: np.ndarray,
+        bucket_seconds: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """ローソク足をbucket_seconds秒ごとの足にまとめる。
+    始値は最初の足の始値、高値は最大値、安値は最小値、終値は最後の足の終値とするため、まとめた後も値動きの幅は失われない
+
+    Parameters
+    ----------
+    open_time : np.ndarray
+        取得時刻のタイムスタンプ（秒）の配列。古い順に並ぶ
+    open, high, low, close : np.ndarray
+        始値、高値、安値、終値の配列
+    bucket_seconds : int
+        まとめた足の単位時間（秒）。まとめた足の取得時刻はこの単位で切り捨てた時刻となる
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+        まとめた足の取得時刻、始値、高値、安値、終値
+    """
+    if len(open_time) == 0:
+        return open_time, open, high, low, close
+    bucket_time : np.ndarray = np.asarray(open_time, dtype=np.int64) // bucket_seconds * bucket_seconds
+    starts : np.ndarray = np.flatnonzero(np.concatenate([[True], bucket_time[1:] != bucket_time[:-1]]))
+    ends : np.ndarray = np.append(starts[1:], len(open_time))
+    return (
+        bucket_time[starts],
+        np.asarray(open)[starts],
+        np.maximum.reduceat(high, starts),
+        np.minimum.reduceat(low, starts),
+        np.asarray(close)[ends - 1])
+
+
+def lttb(x: np.ndarray, y: np.ndarray, num_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Largest-Triangle-Three-Bucketsで折れ線を間引く。
+    最初と最後の点を残し、残りを(num_points - 2)個の区間に分け、
+    直前に選んだ点と次の区間の平均の点とで作る三角形の面積が最大となる点を各区間から1つ選ぶ
+
+    Parameters
+    ----------
+    x : np.ndarray
+        横軸の値（タイムスタンプなど）の配列。昇順に並ぶ
+    y : np.ndarray
+        縦軸の値の配列
+    num_points : int
+        間引いた後の点の数。元の点の数以上、または3未満の場合は間引かない
+
+    Returns
+    -------
+    Tuple[np.ndarray, np.ndarray]
+        間引いた後のx, y
+    """
+    num_rows : int = len(x)
+    if num_points >= num_rows or num_points < 3:
+        return x, y
+    xf : np.ndarray = np.asarray(x, dtype=np.float64)
+    yf : np.ndarray = np.asarray(y, dtype=np.float64)
+    # 区間の境界。num_points < num_rowsのため、各区間は1点以上を持つ
+    edges : np.ndarray = np.linspace(1, num_rows - 1, num_points - 1).astype(np.int64)
+    selected : np.ndarray = np.empty(num_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, num_rows - 1
+    a : int = 0  # 直前に選んだ点
+    for i in range(num_points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x : float = xf[end:edges[i + 2]].mean()
+            next_y : float = yf[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = xf[-1], yf[-1]
+        area : np.ndarray = np.abs(
+            (xf[a] - next_x) * (yf[start:end] - yf[a]) - (xf[a] - xf[start:end]) * (next_y - yf[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return x[selected], y[selected]
@@ -0,0 +1,143 @@
+from collections import deque
+from typing import Deque, Dict, List, Sequence
+import math
+import re
+import threading
+import time
+
+# Prometheusのテキスト形式で公開するヒストグラムのパーセンタイル
+exposed_quantiles : Sequence[float] = (0.5, 0.9, 0.99)
+
+
+class Counter:
+    """単調増加する値を記録するクラス"""
+    def __init__(self) -> None:
+        self._lock : threading.Lock = threading.Lock()
+        self.value : float = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """増減する現在値を記録するクラス"""
+    def __init__(self) -> None:
+        self.value : float = 0.0
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Histogram:
+    """観測値の分布を記録するクラス。パーセンタイルは直近max_samples個の観測値から求める
+
+    Attributes
+    ----------
+    count : int
+        これまでの観測回数
+    sum : float
+        これまでの観測値の合計
+    """
+    def __init__(self, max_samples: int = 4096) -> None:
+        self._lock : threading.Lock = threading.Lock()
+        self._samples : Deque[float] = deque(maxlen=max_samples)
+        self.count : int = 0
+        self.sum : float = 0.0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._samples.append(value)
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, q: float) -> float:
+        """直近の観測値のqパーセンタイル（0 <= q <= 100）を求める。観測値がなければnan"""
+        return self.percentiles([q])[0]
+
+    def percentiles(self, qs: Sequence[float]) -> List[float]:
+        """直近の観測値の複数のパーセンタイル（0 <= q <= 100）を、1回の並べ替えで求める。観測値がなければnan"""
+        with self._lock:
+            samples : List[float] = sorted(self._samples)
+        if not samples:
+            return [math.nan for _ in qs]
+        return [samples[min(int(round(q / 100 * (len(samples) - 1))), len(samples) - 1)] for q in qs]
+
+
+class Span:
+    """withで囲んだ処理の経過時間（秒）を、抜ける時にヒストグラムへ記録するクラス。例外で抜けた場合も記録する
+
+    e.g.)
+        with metrics.span('feature_update_seconds_BTCUSD'):
+            ...
+    """
+    __slots__ = ('histogram', 'started_at')
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram : Histogram = histogram
+        self.started_at : float = 0.0
+
+    def __enter__(self) -> 'Span':
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> bool:
+        self.histogram.observe(time.perf_counter() - self.started_at)
+        return False
+
+
+class MetricsRegistry:
+    """プロセス内のメトリクスを名前で管理するクラス。同じ名前では同じインスタンスを返却する"""
+    def __init__(self) -> None:
+        self._lock : threading.Lock = threading.Lock()
+        self.counters : Dict[str, Counter] = {}
+        self.gauges : Dict[str, Gauge] = {}
+        self.histograms : Dict[str, Histogram] = {}
+
+    def counter(self, name: str) -> Counter:
+        with self._lock:
+            return self.counters.setdefault(name, Counter())
+
+    def gauge(self, name: str) -> Gauge:
+        with self._lock:
+            return self.gauges.setdefault(name, Gauge())
+
+    def histogram(self, name: str) -> Histogram:
+        with self._lock:
+            return self.histograms.setdefault(name, Histogram())
+
+    def span(self, name: str) -> Span:
+        """withで囲んだ処理の経過時間を、nameのヒストグラムに記録する"""
+        return Span(self.histogram(name))
+
+    def to_prometheus(self) -> str:
+        """全てのメトリクスをPrometheusのテキスト形式で返却する。
+        ヒストグラムは直近の観測値のパーセンタイル（exposed_quantiles）と、これまでの合計・回数を持つsummaryとする
+        """
+        with self._lock:
+            counters : Dict[str, Counter] = dict(self.counters)
+            gauges : Dict[str, Gauge] = dict(self.gauges)
+            histograms : Dict[str, Histogram] = dict(self.histograms)
+        lines : List[str] = []
+        for name, counter in sorted(counters.items()):
+            name = _to_metric_name(name)
+            lines += [f'# TYPE {name} counter', f'{name} {counter.value!r}']
+        for name, gauge in sorted(gauges.items()):
+            name = _to_metric_name(name)
+            lines += [f'# TYPE {name} gauge', f'{name} {gauge.value!r}']
+        for name, histogram in sorted(histograms.items()):
+            name = _to_metric_name(name)
+            lines.append(f'# TYPE {name} summary')
+            values : List[float] = histogram.percentiles([q * 100 for q in exposed_quantiles])
+            for q, value in zip(exposed_quantiles, values):
+                lines.append(f'{name}{{quantile="{q}"}} {"NaN" if math.isnan(value) else repr(value)}')
+            lines += [f'{name}_sum {histogram.sum!r}', f'{name}_count {histogram.count}']
+        return '\n'.join(lines) + '\n'
+
+
+def _to_metric_name(name: str) -> str:
+    """Prometheusのメトリクス名に使えない文字を_に置き換える"""
+    return re.sub(r'[^a-zA-Z0-9_:]', '_', name)
+
+
+metrics = MetricsRegistry()
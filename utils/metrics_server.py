@@ -0,0 +1,117 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Union
+from urllib.parse import parse_qs, urlparse
+import threading
+
+import constants
+from logger import Logger
+from utils.metrics import MetricsRegistry, metrics
+from utils.profiler import SamplingProfiler
+
+logger = Logger()
+
+
+class MetricsServer:
+    """メトリクスとサンプリングプロファイラを、ローカルのHTTPで公開するクラス
+
+    以下のパスをGETで受け付ける
+        /metrics                      全てのメトリクス（Prometheusのテキスト形式）
+        /profile/start?interval=0.01  サンプリングプロファイラを開始する（intervalは省略可）
+        /profile/stop                 サンプリングプロファイラを停止し、結果を返却する
+        /profile?limit=100            サンプリングプロファイラのそれまでの結果を返却する（limitは省略可）
+        /profile/reset                サンプリングプロファイラの結果を破棄する
+
+    Attributes
+    ----------
+    host : str
+        待ち受けるアドレス。外部に公開しないよう、既定ではループバックのみとする
+    port : int
+        待ち受けるポート
+    registry : MetricsRegistry
+        公開するメトリクス
+    profiler : SamplingProfiler
+        実行中に切り替えるサンプリングプロファイラ
+
+    Methods
+    -------
+    start -> None
+        別のスレッドで待ち受けを開始する
+    stop -> None
+        待ち受けを停止する
+    """
+    def __init__(
+            self,
+            host: str = constants.METRICS_HOST,
+            port: int = constants.METRICS_PORT,
+            registry: MetricsRegistry = metrics,
+            profiler: Union[SamplingProfiler, None] = None) -> None:
+        self.host : str = host
+        self.port : int = port
+        self.registry : MetricsRegistry = registry
+        self.profiler : SamplingProfiler = profiler if profiler is not None else SamplingProfiler()
+        self._server : Union[ThreadingHTTPServer, None] = None
+
+    def start(self) -> None:
+        """別のスレッドで待ち受けを開始する。ポートが使用中などで待ち受けられない場合は、ログに残してトレードを続ける"""
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+        except OSError as e:
+            logger.error(f'failed to serve metrics on {self.host}:{self.port}: {e}', exc_info=False)
+            return None
+        self._server.daemon_threads = True
+        self._server.metrics_server = self
+        threading.Thread(target=self._server.serve_forever, name='metrics_server', daemon=True).start()
+        logger.info(f'serving metrics on http://{self.host}:{self._server.server_address[1]}/metrics')
+
+    def stop(self) -> None:
+        """待ち受けを停止する"""
+        if self._server is None:
+            return None
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self.profiler.stop()
+
+    def handle(self, path: str, query: Dict[str, List[str]]) -> Union[str, None]:
+        """パスに応じた応答の本文を返却する。該当するパスがない場合はNone"""
+        if path == '/metrics':
+            return self.registry.to_prometheus()
+        if path == '/profile/start':
+            interval : Union[float, None] = float(query['interval'][0]) if 'interval' in query else None
+            started : bool = self.profiler.start(interval=interval)
+            return f'{"started" if started else "already running"} (interval={self.profiler.interval}s)\n'
+        if path == '/profile/stop':
+            self.profiler.stop()
+            return self.profiler.report()
+        if path == '/profile':
+            return self.profiler.report(limit=int(query['limit'][0]) if 'limit' in query else None)
+        if path == '/profile/reset':
+            self.profiler.reset()
+            return 'reset\n'
+        return None
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        try:
+            body : Union[str, None] = self.server.metrics_server.handle(url.path.rstrip('/') or '/', parse_qs(url.query))
+        except ValueError as e:  # クエリの値が数値でない、もしくは範囲外
+            self._respond(400, f'{e}\n')
+            return None
+        if body is None:
+            self._respond(404, 'not found\n')
+            return None
+        self._respond(200, body)
+
+    def _respond(self, status: int, body: str) -> None:
+        encoded : bytes = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format: str, *args) -> None:
+        """スクレイプの度にアクセスログを標準エラーに出さない"""
+        return None
@@ -0,0 +1,133 @@
+from collections import Counter as CallCounter
+from types import FrameType
+from typing import Dict, List, Union
+import os
+import sys
+import threading
+
+import constants
+
+
+def _check_interval(interval: float) -> None:
+    """0以下（やNaN）の間隔では、サンプリングのスレッドが待機せずにCPUを使い切るため受け付けない"""
+    if not interval > 0:
+        raise ValueError(f'interval must be positive: {interval}')
+
+
+class SamplingProfiler:
+    """一定の間隔で全てのスレッドのスタックを取得し、呼び出し経路ごとに取得された回数を数えるクラス
+
+    計測する処理には手を加えず、別のスレッドから覗くのみのため、停止中は一切のオーバーヘッドがない。
+    start / stopで実行中に何度でも切り替えられる（MetricsServerの/profile/start, /profile/stopから呼ぶ）。
+    結果は1行に「スレッド名;呼び出し元;...;関数 回数」を持つcollapsed stack形式で、flamegraph.plやspeedscopeで読み込める
+
+    Attributes
+    ----------
+    interval : float
+        スタックを取得する間隔（秒）
+    max_depth : int
+        1つのスタックから取得する最大のフレーム数
+    num_samples : int
+        これまでにスタックを取得した回数
+
+    Methods
+    -------
+    start -> bool
+        サンプリングを開始する
+    stop -> None
+        サンプリングを停止する。それまでの結果は残す
+    reset -> None
+        それまでの結果を破棄する
+    report -> str
+        呼び出し経路ごとの回数を、多い順にcollapsed stack形式で返却する
+    """
+    def __init__(self, interval: float = constants.PROFILER_SAMPLE_INTERVAL, max_depth: int = 64) -> None:
+        _check_interval(interval)
+        self.interval : float = interval
+        self.max_depth : int = max_depth
+        self.num_samples : int = 0
+        self._stacks : CallCounter = CallCounter()
+        self._lock : threading.Lock = threading.Lock()
+        self._stop_event : threading.Event = threading.Event()
+        self._thread : Union[threading.Thread, None] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: Union[float, None] = None) -> bool:
+        """サンプリングを開始する
+
+        Parameters
+        ----------
+        interval : float | None
+            スタックを取得する間隔（秒）。正の値とする。Noneの場合はそれまでの間隔のまま
+
+        Returns
+        -------
+        bool
+            開始した場合はTrue。既に実行中の場合はFalse
+        """
+        if interval is not None:
+            _check_interval(interval)
+        if self.is_running:
+            return False
+        if interval is not None:
+            self.interval = interval
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling_profiler', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> None:
+        """サンプリングを停止する。それまでの結果は残す"""
+        if self._thread is None:
+            return None
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def reset(self) -> None:
+        """それまでの結果を破棄する"""
+        with self._lock:
+            self._stacks.clear()
+            self.num_samples = 0
+
+    def report(self, limit: Union[int, None] = None) -> str:
+        """呼び出し経路ごとの回数を、多い順にcollapsed stack形式で返却する
+
+        Parameters
+        ----------
+        limit : int | None
+            返却する最大の行数。Noneの場合は全て
+        """
+        with self._lock:
+            stacks : List = self._stacks.most_common(limit)
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def _sample(self) -> None:
+        """自身を除く全てのスレッドのスタックを1回取得する"""
+        own_thread_id : int = threading.get_ident()
+        thread_names : Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks : List[str] = []
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread_id:
+                continue
+            stacks.append(';'.join([thread_names.get(thread_id, str(thread_id))] + self._frame_names(frame)))
+        with self._lock:
+            self._stacks.update(stacks)
+            self.num_samples += 1
+
+    def _frame_names(self, frame: Union[FrameType, None]) -> List[str]:
+        """呼び出し元から順に並べたフレームの名前。同じ関数の別の行は同じ名前とする"""
+        names : List[str] = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+            frame = frame.f_back
+        names.reverse()
+        return names